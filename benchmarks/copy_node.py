@@ -0,0 +1,92 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+"""
+compares copying a large RestApi resource with copy_node against the yaml dump
+and reload and copy.deepcopy:
+
+    python benchmarks/copy_node.py --paths 2000
+"""
+import copy
+import time
+from io import BytesIO, StringIO
+
+import click
+from ruamel.yaml import YAML
+
+from aws_cfn_update.nodes import copy_node
+
+
+def rest_api(paths: int) -> str:
+    lines = [
+        "RestAPI:",
+        "  Type: AWS::ApiGateway::RestApi",
+        "  Properties:",
+        "    Body:",
+        "      openapi: 3.0.1",
+        "      paths:",
+    ]
+    for i in range(paths):
+        lines += [
+            f"        /orders/{i}:  # order {i}",
+            "          post:",
+            "            responses:",
+            "              '200':",
+            "                description: ok",
+            "            x-amazon-apigateway-integration:",
+            "              type: aws_proxy",
+            "              httpMethod: POST",
+            "              uri: !Sub 'arn:aws:apigateway:${AWS::Region}:lambda:path/functions/${Order.Arn}/invocations'",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def dump_and_reload(yaml: YAML, resource):
+    buffer = BytesIO()
+    yaml.dump(resource, buffer)
+    buffer.seek(0)
+    return yaml.load(buffer)
+
+
+def measure(operation, repeat: int = 3) -> float:
+    """
+    returns the fastest of `repeat` timings of `operation`, in seconds.
+    """
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        elapsed = time.perf_counter() - start
+        result = elapsed if result is None else min(result, elapsed)
+    return result
+
+
+@click.command(help=__doc__)
+@click.option("--paths", type=click.IntRange(min=1), default=2000, show_default=True)
+@click.option("--repeat", type=click.IntRange(min=1), default=3, show_default=True)
+def main(paths, repeat):
+    yaml = YAML()
+    resource = yaml.load(StringIO(rest_api(paths)))["RestAPI"]
+
+    candidates = {
+        "dump and reload": lambda: dump_and_reload(yaml, resource),
+        "copy.deepcopy": lambda: copy.deepcopy(resource),
+        "copy_node": lambda: copy_node(resource),
+    }
+    for name, candidate in candidates.items():
+        click.echo(f"{name:20} {measure(candidate, repeat) * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
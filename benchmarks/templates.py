@@ -0,0 +1,241 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+"""
+generates deterministic CloudFormation templates for the benchmarks:
+
+    python benchmarks/templates.py --resources 1000 --depth 3 --mix ami=1,ecs=2 > template.yaml
+"""
+import json
+import random
+import sys
+
+import click
+from ruamel.yaml import YAML
+
+KINDS = ("ami", "ecs", "lambda", "events", "restapi", "config", "statemachine")
+
+
+def _nested(depth: int, value) -> dict:
+    result = value
+    for level in range(depth, 0, -1):
+        result = {f"Level{level}": result}
+    return result
+
+
+def _ami(i: int, rng: random.Random, refer) -> tuple:
+    return f"AMI{i}", {
+        "Type": "Custom::AMI",
+        "Properties": {
+            "ServiceToken": {"Fn::Sub": "arn:aws:lambda:${AWS::Region}:${AWS::AccountId}:function:cfn-ami-provider"},
+            "Owners": ["amazon"],
+            "Filters": {"name": f"amzn2-ami-hvm-2.0.2024{rng.randint(1, 12):02d}01.0-x86_64-gp2"},
+        },
+    }
+
+
+def _ecs(i: int, rng: random.Random, refer) -> tuple:
+    return f"Task{i}", {
+        "Type": "AWS::ECS::TaskDefinition",
+        "Properties": {
+            "Family": f"service{i}",
+            "ContainerDefinitions": [
+                {
+                    "Name": "app",
+                    "Image": f"registry.example.com/service{i % 50}:1.0.{rng.randint(0, 9)}",
+                    "Environment": [{"Name": "DEPENDENCY", "Value": {"Ref": refer()}}],
+                },
+                {"Name": "proxy", "Image": "envoyproxy/envoy:v1.30.0"},
+            ],
+        },
+    }
+
+
+def _lambda(i: int, rng: random.Random, refer) -> tuple:
+    return f"Function{i}", {
+        "Type": "AWS::Lambda::Function",
+        "Properties": {
+            "Runtime": "python3.12",
+            "Handler": "index.handler",
+            "Code": {
+                "S3Bucket": {"Fn::Sub": "artifacts-${AWS::Region}"},
+                "S3Key": f"lambdas/function{i % 50}-1.0.{rng.randint(0, 9)}.zip",
+            },
+            "Environment": {
+                "Variables": {"DEPENDENCY": {"Fn::Sub": "${%s}-${AWS::StackName}" % refer()}}
+            },
+        },
+    }
+
+
+def _events(i: int, rng: random.Random, refer) -> tuple:
+    minute, hour = rng.randint(0, 59), rng.randint(0, 23)
+    return f"Schedule{i}", {
+        "Type": "AWS::Events::Rule",
+        "Properties": {
+            "Description": f"run at cron({minute} {hour} * * ? *) Europe/Amsterdam",
+            "ScheduleExpression": f"cron({minute} {hour} * * ? *)",
+            "State": "ENABLED",
+            "Targets": [{"Id": "target", "Arn": {"Fn::GetAtt": [refer(), "Arn"]}}],
+        },
+    }
+
+
+def open_api_body(paths: int) -> dict:
+    return {
+        "openapi": "3.0.1",
+        "info": {"title": "orders", "version": "1.0"},
+        "paths": {
+            f"/orders/{i}": {
+                "post": {
+                    "responses": {"200": {"description": "ok"}},
+                    "x-amazon-apigateway-integration": {
+                        "type": "aws_proxy",
+                        "httpMethod": "POST",
+                        "uri": {
+                            "Fn::Sub": "arn:aws:apigateway:${AWS::Region}:lambda:path/functions/${Order.Arn}/invocations"
+                        },
+                    },
+                }
+            }
+            for i in range(paths)
+        },
+    }
+
+
+def _restapi(i: int, rng: random.Random, refer) -> tuple:
+    return f"Api{i}", {
+        "Type": "AWS::ApiGateway::RestApi",
+        "Properties": {"Body": open_api_body(rng.randint(1, 10))},
+    }
+
+
+def _config(i: int, rng: random.Random, refer) -> tuple:
+    return f"ConfigRule{i}", {
+        "Type": "AWS::Config::ConfigRule",
+        "Properties": {
+            "ConfigRuleName": {"Fn::Sub": "rule%d-${%s}" % (i, refer())},
+            "Source": {
+                "Owner": "CUSTOM_POLICY",
+                "SourceDetails": [
+                    {
+                        "EventSource": "aws.config",
+                        "MessageType": "ConfigurationItemChangeNotification",
+                    }
+                ],
+                "CustomPolicyDetails": {
+                    "EnableDebugLogDelivery": False,
+                    "PolicyRuntime": "guard-2.x.x",
+                    "PolicyText": 'rule versioning when resourceType == "AWS::S3::Bucket" {\n'
+                    f'    configuration.versioningConfiguration.status == "Enabled{rng.randint(0, 9)}"\n'
+                    "}\n",
+                },
+            },
+        },
+    }
+
+
+def _statemachine(i: int, rng: random.Random, refer) -> tuple:
+    states = {
+        f"Step{s}": {"Type": "Task", "Resource": "${%s.Arn}" % refer(), "Next": f"Step{s + 1}"}
+        for s in range(rng.randint(1, 5))
+    }
+    states[f"Step{len(states)}"] = {"Type": "Succeed"}
+    return f"StateMachine{i}", {
+        "Type": "AWS::StepFunctions::StateMachine",
+        "Properties": {
+            "RoleArn": {"Fn::GetAtt": [refer(), "Arn"]},
+            "DefinitionString": {
+                "Fn::Sub": json.dumps({"StartAt": "Step0", "States": states}, indent=2)
+            },
+        },
+    }
+
+
+_generators = {
+    "ami": _ami,
+    "ecs": _ecs,
+    "lambda": _lambda,
+    "events": _events,
+    "restapi": _restapi,
+    "config": _config,
+    "statemachine": _statemachine,
+}
+
+
+def generate_template(
+    resources: int = 100, depth: int = 2, mix: dict = None, seed: int = 0
+) -> dict:
+    """
+    returns a template with `resources` resources of the kinds in `mix`, chosen by weight.
+    Every resource has metadata nested `depth` levels deep, and refers to earlier resources
+    with Ref, Fn::GetAtt, Fn::Sub and DependsOn. The same arguments always generate the
+    same template.
+    """
+    mix = mix or {kind: 1 for kind in KINDS}
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=resources)
+
+    names = []
+    result = {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Parameters": {"Environment": {"Type": "String", "Default": "test"}},
+        "Resources": {},
+        "Outputs": {},
+    }
+
+    def refer():
+        return rng.choice(names) if names else "AWS::NoValue"
+
+    for i, kind in enumerate(kinds):
+        name, resource = _generators[kind](i, rng, refer)
+        if names and rng.random() < 0.2:
+            resource["DependsOn"] = [refer()]
+        resource["Metadata"] = _nested(depth, {"Index": i, "Kind": kind})
+        result["Resources"][name] = resource
+        names.append(name)
+        if i % 10 == 0:
+            result["Outputs"][f"{name}Ref"] = {"Value": {"Ref": name}}
+    return result
+
+
+def parse_mix(mix: str) -> dict:
+    """
+    returns the weights of a mix like "ami=1,ecs=2". A kind without a weight has weight 1.
+    """
+    result = {}
+    for part in filter(None, mix.split(",")):
+        kind, _, weight = part.partition("=")
+        if kind not in _generators:
+            raise click.BadParameter(f"{kind} is not one of {', '.join(KINDS)}")
+        result[kind] = float(weight) if weight else 1.0
+    return result
+
+
+@click.command(help=__doc__)
+@click.option("--resources", type=click.IntRange(min=1), default=100, show_default=True)
+@click.option("--depth", type=click.IntRange(min=0), default=2, show_default=True)
+@click.option("--mix", default=",".join(KINDS), show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--format", "output_format", type=click.Choice(["yaml", "json"]), default="yaml")
+def main(resources, depth, mix, seed, output_format):
+    template = generate_template(resources, depth, parse_mix(mix), seed)
+    if output_format == "json":
+        json.dump(template, sys.stdout, indent=2)
+    else:
+        YAML().dump(template, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
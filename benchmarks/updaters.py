@@ -0,0 +1,321 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+"""
+measures the load, update and write of every updater on generated templates of several
+sizes, and compares the results with a baseline:
+
+    python benchmarks/updaters.py run --sizes 100,1000 --output results.json
+    python benchmarks/updaters.py compare benchmarks/baseline.json results.json --threshold 0.25
+
+The updaters which require network access, like oidc-provider-thumbprints, are not measured.
+The latest-ami updater is measured with a fixed describe-images response.
+"""
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import click
+import pytz
+
+from aws_cfn_update.add_new_resources import AddNewResources
+from aws_cfn_update.cfn_updater import CfnUpdater
+from aws_cfn_update.config_rule_inline_code_updater import ConfigRuleInlineCodeUpdater
+from aws_cfn_update.container_image_updater import ContainerImageUpdater
+from aws_cfn_update.cron_schedule_expression_updater import CronScheduleExpressionUpdater
+from aws_cfn_update.intrinsics import iter_intrinsics
+from aws_cfn_update.lambda_inline_code_updater import LambdaInlineCodeUpdater
+from aws_cfn_update.lambda_s3_key_updater import LambdaS3KeyUpdater
+from aws_cfn_update.latest_ami_updater import AMIUpdater
+from aws_cfn_update.nodes import copy_node
+from aws_cfn_update.remove_resource import ResourceRemover
+from aws_cfn_update.replace_references import referenced_names, replace_references
+from aws_cfn_update.rest_api_body_updater import RestAPIBodyUpdater
+from aws_cfn_update.scheduler_migrator import SchedulerMigrator
+from aws_cfn_update.statemachine_updater import StateMachineDefinitionUpdater
+from templates import generate_template, open_api_body
+
+
+class FixedAMIUpdater(AMIUpdater):
+    def _describe_images(self, **kwargs):
+        return {
+            "Images": [
+                {
+                    "Name": "amzn2-ami-hvm-2.0.20250101.0-x86_64-gp2",
+                    "CreationDate": "2025-01-01T00:00:00.000Z",
+                }
+            ]
+        }
+
+
+def _names(template: dict, prefix: str) -> list:
+    return [n for n in template["Resources"] if n.startswith(prefix)]
+
+
+def container_image(template):
+    updater = ContainerImageUpdater()
+    updater.images = [f"registry.example.com/service{i}:2.0.0" for i in range(50)]
+    return updater
+
+
+def lambda_s3_key(template):
+    updater = LambdaS3KeyUpdater()
+    updater.s3_keys = [f"lambdas/function{i}-2.0.0.zip" for i in range(50)]
+    return updater
+
+
+def latest_ami(template):
+    updater = FixedAMIUpdater()
+    updater.ami_name_pattern = "amzn2-ami-hvm-*"
+    updater.add_new_version = False
+    return updater
+
+
+def lambda_inline_code(template):
+    updater = LambdaInlineCodeUpdater()
+    updater.resource = next(iter(_names(template, "Function")), "Function0")
+    updater.code = "def handler(event, context):\n    return {}\n"
+    return updater
+
+
+def config_rule_inline_code(template):
+    updater = ConfigRuleInlineCodeUpdater()
+    updater.resource_name = next(iter(_names(template, "ConfigRule")), "ConfigRule0")
+    updater.code = 'rule versioning when resourceType == "AWS::S3::Bucket" {\n    true\n}\n'
+    return updater
+
+
+def state_machine_definition(template):
+    updater = StateMachineDefinitionUpdater()
+    updater.resource_name = next(iter(_names(template, "StateMachine")), "StateMachine0")
+    updater.definition = '{"StartAt": "Done", "States": {"Done": {"Type": "Succeed"}}}\n'
+    return updater
+
+
+def cron_schedule_expression(template):
+    updater = CronScheduleExpressionUpdater()
+    updater.timezone = pytz.timezone("Europe/Amsterdam")
+    updater.today = datetime(2024, 7, 1)
+    return updater
+
+
+def migrate_to_scheduler(template):
+    updater = SchedulerMigrator()
+    updater.timezone = pytz.timezone("Europe/Amsterdam")
+    return updater
+
+
+def remove_resource(template):
+    updater = ResourceRemover()
+    names = list(template["Resources"])
+    updater.resource_names = names[len(names) // 2 : len(names) // 2 + 1]
+    return updater
+
+
+def add_new_resources(template):
+    updater = AddNewResources()
+    updater.source = generate_template(len(template["Resources"]), seed=1)
+    updater.strategy = "deep"
+    return updater
+
+
+def rest_api_body(template):
+    updater = RestAPIBodyUpdater()
+    updater.resource_names = _names(template, "Api")[:10]
+    updater.body = open_api_body(20)
+    return updater
+
+
+UPDATERS = {
+    "container-image": container_image,
+    "lambda-s3-key": lambda_s3_key,
+    "latest-ami": latest_ami,
+    "lambda-inline-code": lambda_inline_code,
+    "config-rule-inline-code": config_rule_inline_code,
+    "state-machine-definition": state_machine_definition,
+    "cron-schedule-expression": cron_schedule_expression,
+    "migrate-to-scheduler": migrate_to_scheduler,
+    "remove-resource": remove_resource,
+    "add-new-resources": add_new_resources,
+    "rest-api-body": rest_api_body,
+}
+
+
+def measure(operation, setup=None, repeat: int = 3) -> float:
+    """
+    returns the fastest of `repeat` timings of `operation`, in seconds. The result of
+    `setup`, which is not timed, is passed to the operation.
+    """
+    result = None
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        operation(argument)
+        elapsed = time.perf_counter() - start
+        result = elapsed if result is None else min(result, elapsed)
+    return result
+
+
+def benchmark_updater(name: str, filename: str, repeat: int) -> dict:
+    reader = CfnUpdater()
+    reader.filename = filename
+    reader.load()
+    template = reader.template
+    updater = UPDATERS[name](template)
+    updater.filename = filename
+
+    def update(argument):
+        updater.template = argument
+        updater.update_template()
+
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, os.path.basename(filename))
+
+        def write(_):
+            updater.dirty = True
+            updater.write()
+
+        results = {
+            "load": measure(lambda _: updater.load(), repeat=repeat),
+            "update": measure(update, lambda: copy_node(template), repeat),
+        }
+        updater.filename = output
+        updater.template = template
+        results["write"] = measure(write, repeat=repeat)
+    return results
+
+
+def benchmark_references(filename: str, repeat: int) -> dict:
+    reader = CfnUpdater()
+    reader.filename = filename
+    reader.load()
+    template = reader.template
+    names = list(template["Resources"])
+    mapping = {n: f"{n}New" for n in names[::10]}
+    return {
+        "iter_intrinsics": measure(
+            lambda _: sum(1 for _ in iter_intrinsics(template)), repeat=repeat
+        ),
+        "referenced_names": measure(lambda _: referenced_names(template), repeat=repeat),
+        "replace_references": measure(
+            lambda t: replace_references(t, mapping), lambda: copy_node(template), repeat
+        ),
+    }
+
+
+def run_benchmarks(sizes: list, repeat: int = 3, depth: int = 2, updaters=None) -> dict:
+    """
+    returns the timings of the updaters and the reference functions on generated
+    templates of `sizes` resources, by "<name>/<phase>/<size>".
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            filename = os.path.join(directory, f"template-{size}.yaml")
+            updater = CfnUpdater()
+            updater.filename = filename
+            updater.template = generate_template(size, depth)
+            updater.dirty = True
+            updater.write()
+
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+                for name in updaters or UPDATERS:
+                    for phase, elapsed in benchmark_updater(name, filename, repeat).items():
+                        results[f"{name}/{phase}/{size}"] = elapsed
+                for name, elapsed in benchmark_references(filename, repeat).items():
+                    results[f"{name}/{size}"] = elapsed
+    return results
+
+
+def compare_results(baseline: dict, results: dict, threshold: float) -> list:
+    """
+    returns (name, baseline, result, ratio, slower) of the benchmarks in both `baseline`
+    and `results`, where slower is True if the ratio exceeds 1 + `threshold`.
+    """
+    return [
+        (
+            name,
+            baseline[name],
+            results[name],
+            results[name] / baseline[name] if baseline[name] else float("inf"),
+            results[name] > baseline[name] * (1 + threshold),
+        )
+        for name in results
+        if name in baseline
+    ]
+
+
+@click.group(help=__doc__)
+def cli():
+    pass
+
+
+@cli.command(help="measures the updaters and writes the results as JSON")
+@click.option("--sizes", default="100,1000", show_default=True, help="numbers of resources")
+@click.option("--depth", type=click.IntRange(min=0), default=2, show_default=True)
+@click.option("--repeat", type=click.IntRange(min=1), default=3, show_default=True)
+@click.option("--updater", "updaters", multiple=True, type=click.Choice(list(UPDATERS)))
+@click.option("--output", type=click.Path(dir_okay=False), help="to write the results to")
+def run(sizes, depth, repeat, updaters, output):
+    results = run_benchmarks(
+        [int(s) for s in sizes.split(",")], repeat, depth, list(updaters) or None
+    )
+    content = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    for name, elapsed in results.items():
+        sys.stderr.write(f"{name:45} {elapsed * 1000:10.2f} ms\n")
+    if output:
+        with open(output, "w") as f:
+            json.dump(content, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(content, sys.stdout, indent=2)
+
+
+@cli.command(help="compares the results with a baseline, and fails on slowdowns")
+@click.argument("baseline", type=click.Path(exists=True, dir_okay=False))
+@click.argument("results", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0),
+    default=0.25,
+    show_default=True,
+    help="the fraction a benchmark may be slower than the baseline",
+)
+def compare(baseline, results, threshold):
+    with open(baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(results) as f:
+        results = json.load(f)["results"]
+
+    slower = 0
+    for name, old, new, ratio, is_slower in compare_results(baseline, results, threshold):
+        marker = "SLOWER" if is_slower else ""
+        click.echo(f"{name:45} {old * 1000:10.2f} {new * 1000:10.2f} ms {ratio:6.2f}x {marker}")
+        slower += is_slower
+    if slower:
+        sys.stderr.write(f"ERROR: {slower} benchmarks are more than {threshold:.0%} slower\n")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    cli()
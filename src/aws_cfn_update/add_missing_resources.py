@@ -1,10 +1,112 @@
-def add_missing_resources(template: dict, src: dict) -> bool:
-    dirty = False
+from .nodes import copy_node, structural_hash
+
+
+def add_missing_resources(template: dict, src: dict) -> list:
+    """
+    adds the parameters, resources, conditions and mappings of `src` which are missing
+    in `template`. The added entries are copied, so that `src` can be shared. Returns
+    the (section, name) of the added entries.
+    """
+    added = []
     for top_level in ["Parameters", "Resources", "Conditions", "Mappings"]:
         for name, value in src.get(top_level, {}).items():
             if not template.get(top_level, {}).get(name):
                 if top_level not in template:
                     template[top_level] = {}
-                template[top_level][name] = value
-                dirty = True
-    return dirty
+                template[top_level][name] = copy_node(value)
+                added.append((top_level, name))
+    return added
+
+
+_merged_sections = [
+    "Metadata",
+    "Parameters",
+    "Rules",
+    "Mappings",
+    "Conditions",
+    "Resources",
+    "Outputs",
+]
+
+_missing = object()
+
+
+def json_pointer(path: tuple) -> str:
+    """
+    returns the json pointer of the keys in `path`, like /Resources/Bucket/Properties.
+    """
+    return "".join(
+        "/" + str(p).replace("~", "~0").replace("/", "~1") for p in path
+    )
+
+
+def _merge(ours: dict, theirs: dict, base, path: tuple, strategy: str, changes, conflicts):
+    for key, value in theirs.items():
+        mine = ours.get(key, _missing)
+        original = base.get(key, _missing) if isinstance(base, dict) else _missing
+        pointer = path + (key,)
+
+        if isinstance(mine, dict) and isinstance(value, dict):
+            if structural_hash(mine) != structural_hash(value):
+                _merge(mine, value, original, pointer, strategy, changes, conflicts)
+            continue
+
+        value_hash = structural_hash(value)
+        if mine is not _missing and structural_hash(mine) == value_hash:
+            continue
+
+        if original is not _missing:
+            original_hash = structural_hash(original)
+            if original_hash == value_hash:
+                # only changed or removed by us
+                continue
+            if mine is not _missing and original_hash == structural_hash(mine):
+                # only changed by them
+                ours[key] = copy_node(value)
+                changes.append(json_pointer(pointer))
+                continue
+
+        if mine is not _missing or original is not _missing:
+            conflicts.append(json_pointer(pointer))
+            if strategy != "theirs":
+                continue
+        ours[key] = copy_node(value)
+        changes.append(json_pointer(pointer))
+
+
+def merge_templates(
+    template: dict, src: dict, strategy: str = "deep", base: dict = None
+) -> tuple:
+    """
+    merges the metadata, parameters, rules, mappings, conditions, resources and outputs
+    of `src` into `template`. Entries missing in `template` are added at any depth.
+    Values which differ are conflicts: with the strategy "deep" the value in `template`
+    is kept, with "theirs" the value of `src` is taken. Lists are compared as a whole.
+
+    If the common ancestor `base` is given, a value changed on one side only is not a
+    conflict: a change in `src` is taken, a change in `template` is kept. Entries of
+    `base` removed from `template` are not added again.
+
+    Returns the json pointers of the changed entries and of the conflicts.
+    Identical subtrees are skipped by comparing their structural hash.
+    """
+    if strategy not in ("deep", "theirs"):
+        raise ValueError(f"unknown merge strategy {strategy}")
+
+    changes, conflicts = [], []
+    for section in _merged_sections:
+        theirs = src.get(section)
+        if not isinstance(theirs, dict):
+            continue
+        ours = template.get(section)
+        if ours is None:
+            ours = {}
+        elif not isinstance(ours, dict):
+            conflicts.append(json_pointer((section,)))
+            continue
+        original = base.get(section, {}) if base is not None else _missing
+        count = len(changes)
+        _merge(ours, theirs, original, (section,), strategy, changes, conflicts)
+        if len(changes) > count and section not in template:
+            template[section] = ours
+    return changes, conflicts
@@ -12,23 +12,164 @@
 #   limitations under the License.
 #
 #   Copyright 2018 binx.io B.V.
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
 import click
 
-from .add_missing_resources import add_missing_resources
-from .cfn_updater import CfnUpdater, read_template
+from .add_missing_resources import add_missing_resources, json_pointer, merge_templates
+from .cfn_updater import STDIO, CfnUpdater, read_template
+
+_template_extensions = (".json", ".yaml", ".yml")
+
+# the source template and options of a worker process
+_worker = {}
 
 
 class AddNewResources(CfnUpdater):
     """
     Add resources that exist in the new template and not in the existing template.
+
+    The source template is read once and added to all target templates, which
+    may be specified as files, directories or glob patterns like 'services/*/template.yaml'.
+    The targets are updated in parallel, and a summary of the added entries is shown
+    per target.
+
+    With the strategy 'missing', only parameters, conditions, mappings and resources
+    missing in the target are added. With 'deep', missing entries are added at
+    any depth, in the metadata, rules and outputs too, and differing values are reported
+    as conflicts and left as is. With 'theirs', the conflicting values are overwritten
+    by the source. If the common ancestor of the templates is specified with --base,
+    values changed on one side only are not conflicts.
     """
 
     def __init__(self):
         super(AddNewResources, self).__init__()
         self.source: dict = {}
+        self.base: Optional[dict] = None
+        self.strategy = "missing"
+        self.changes: list = []
+        self.conflicts: list = []
 
     def update_template(self):
-        self.dirty = add_missing_resources(self.template, self.source)
+        if self.strategy == "missing":
+            self.changes = [
+                json_pointer(added)
+                for added in add_missing_resources(self.template, self.source)
+            ]
+            self.conflicts = []
+        else:
+            self.changes, self.conflicts = merge_templates(
+                self.template, self.source, self.strategy, self.base
+            )
+        self.dirty = bool(self.changes)
+
+    def update_file(self, filename: str) -> Optional[tuple]:
+        """
+        merges the source into the template `filename`. Returns the json pointers
+        of the changes and of the conflicts, or None if the file is not a
+        CloudFormation template.
+        """
+        self.filename = filename
+        self.load()
+        if not self.is_cloudformation_template():
+            return None
+        self.update_template()
+        self.write()
+        return self.changes, self.conflicts
+
+
+def target_filenames(paths: List[str]) -> List[str]:
+    """
+    returns the template files in `paths`, which may be files, directories or
+    glob patterns.
+    """
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                result.extend(
+                    os.path.join(root, f)
+                    for f in sorted(files)
+                    if f.endswith(_template_extensions)
+                )
+        elif os.path.isfile(path):
+            result.append(path)
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches:
+                sys.stderr.write(f"ERROR: {path} does not match any file\n")
+                raise SystemExit(1)
+            result.extend(
+                target_filenames([m for m in matches if os.path.isdir(m)])
+                + [m for m in matches if os.path.isfile(m)]
+            )
+    return list(dict.fromkeys(os.path.normpath(f) for f in result))
+
+
+def _initialize_worker(options: dict):
+    _worker.update(options)
+
+
+def _update_target(filename: str) -> Optional[tuple]:
+    updater = AddNewResources()
+    for name, value in _worker.items():
+        setattr(updater, name, value)
+    return updater.update_file(filename)
+
+
+def add_to_targets(
+    source: dict,
+    filenames: List[str],
+    dry_run: bool,
+    verbose: bool,
+    max_workers: int = None,
+    strategy: str = "missing",
+    base: dict = None,
+) -> dict:
+    """
+    merges `source` into all templates `filenames` with `strategy`, in a pool of
+    `max_workers` processes. Returns the changes and conflicts by filename.
+    """
+    options = dict(
+        source=source, base=base, strategy=strategy, dry_run=dry_run, verbose=verbose
+    )
+    if len(filenames) < 2 or max_workers == 1:
+        _initialize_worker(options)
+        return {f: _update_target(f) for f in filenames}
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_initialize_worker,
+        initargs=(options,),
+    ) as pool:
+        return dict(zip(filenames, pool.map(_update_target, filenames)))
+
+
+def report(results: dict, verbose: bool):
+    """
+    writes the changes and conflicts per target and the number of updated targets.
+    """
+    updated, conflicts = 0, 0
+    for filename, result in results.items():
+        if result is None:
+            if verbose:
+                sys.stderr.write(
+                    f"INFO: skipping {filename} as it is not a CloudFormation template\n"
+                )
+            continue
+        if result[0]:
+            updated += 1
+            sys.stderr.write(f"INFO: merged {', '.join(result[0])} into {filename}\n")
+        for pointer in result[1]:
+            sys.stderr.write(f"WARN: conflict at {pointer} in {filename}\n")
+        conflicts += len(result[1])
+    sys.stderr.write(
+        f"INFO: updated {updated} of {len(results)} templates, {conflicts} conflicts\n"
+    )
 
 
 @click.command(name="add-new-resources", help=AddNewResources.__doc__)
@@ -38,11 +179,57 @@ class AddNewResources(CfnUpdater):
     help="template to add resources from",
     type=click.Path(exists=True),
 )
-@click.argument("path", nargs=1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--strategy",
+    type=click.Choice(["missing", "deep", "theirs"]),
+    default="missing",
+    show_default=True,
+    help="how to merge the source into the templates",
+)
+@click.option(
+    "--base",
+    required=False,
+    help="common ancestor of the source and the templates",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="number of templates to update in parallel  [default: number of cpus]",
+)
+@click.argument("path", nargs=-1, required=True)
 @click.pass_context
-def add_new_resources(ctx, source, path):
-    updater = AddNewResources()
-    updater.dry_run = ctx.obj["dry_run"]
-    updater.verbose = ctx.obj["verbose"]
-    updater.source = read_template(source)
-    updater.update(path)
+def add_new_resources(ctx, source, strategy, base, workers, path):
+    unsupported = [
+        option
+        for option, value in [
+            ("--follow-nested", ctx.obj["follow_nested"]),
+            ("--journal", ctx.obj["journal_file"]),
+            ("--resume", ctx.obj["resume"]),
+            ("- as path", STDIO in path),
+        ]
+        if value
+    ]
+    if unsupported:
+        raise click.UsageError(
+            f"add-new-resources does not support {', '.join(unsupported)}, as it updates"
+            " the templates in separate processes",
+            ctx,
+        )
+
+    filenames = [
+        f
+        for f in target_filenames(list(path))
+        if not any(os.path.samefile(f, p) for p in (source, base) if p)
+    ]
+    results = add_to_targets(
+        read_template(source),
+        filenames,
+        ctx.obj["dry_run"],
+        ctx.obj["verbose"],
+        workers,
+        strategy,
+        read_template(base) if base else None,
+    )
+    report(results, ctx.obj["verbose"])
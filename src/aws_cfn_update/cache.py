@@ -0,0 +1,66 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+import json
+import os
+import sys
+import tempfile
+
+
+def cache_directory() -> str:
+    """
+    returns the directory in which lookups are cached across runs. It is read from
+    the environment variable AWS_CFN_UPDATE_CACHE_DIR and defaults to
+    $XDG_CACHE_HOME/aws-cfn-update.
+    """
+    directory = os.getenv("AWS_CFN_UPDATE_CACHE_DIR")
+    if not directory:
+        directory = os.path.join(
+            os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            "aws-cfn-update",
+        )
+    return directory
+
+
+def load_cache(name: str) -> dict:
+    """
+    returns the content of the cache `name`, or an empty dictionary if it does not exist
+    or is unreadable.
+    """
+    filename = os.path.join(cache_directory(), f"{name}.json")
+    try:
+        with open(filename, "r") as f:
+            result = json.load(f)
+        return result if isinstance(result, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        sys.stderr.write(f"WARN: ignoring cache {filename}, {error}\n")
+        return {}
+
+
+def save_cache(name: str, content: dict):
+    """
+    writes `content` to the cache `name`. The cache is replaced atomically, so that
+    concurrent runs never read a partially written cache.
+    """
+    directory = cache_directory()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp, os.path.join(directory, f"{name}.json"))
+    except OSError as error:
+        sys.stderr.write(f"WARN: failed to write cache {name} in {directory}, {error}\n")
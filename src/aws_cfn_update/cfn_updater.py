@@ -17,9 +17,43 @@ import sys
 import os.path
 import json
 import collections
+import copy
+from concurrent.futures import ThreadPoolExecutor
 
 from ruamel.yaml import YAML
 
+from .journal import Journal, write_atomic
+
+# the yaml settings copied to the updaters of nested templates
+_yaml_settings = [
+    "preserve_quotes",
+    "explicit_start",
+    "explicit_end",
+    "width",
+    "map_indent",
+    "sequence_indent",
+    "sequence_dash_offset",
+    "default_flow_style",
+    "allow_unicode",
+]
+
+# the filename which refers to stdin and stdout
+STDIO = "-"
+
+# the property of the location of a nested template, by resource type
+_nested_template_properties = {
+    "AWS::CloudFormation::Stack": "TemplateURL",
+    "AWS::Serverless::Application": "Location",
+}
+
+
+def detect_format(content: str) -> str:
+    """
+    returns the format of the template `content`, .json if it is a JSON object and .yaml
+    otherwise.
+    """
+    return ".json" if content.lstrip().startswith("{") else ".yaml"
+
 
 class CfnUpdater(object):
     """
@@ -37,6 +71,15 @@ class CfnUpdater(object):
 
     Please note that formatting and comments may be lost, when using this
     updater.
+
+    If the filename is "-", the template is read from stdin and written to stdout,
+    in the format detected from the content.
+
+    Templates are written atomically, and recorded in `self.journal` once completed,
+    so that an interrupted run can be resumed.
+
+    If the property `self.follow_nested` is True, the templates of nested stacks
+    referring to a local file are updated too, see update_nested(path).
     """
 
     def __init__(self):
@@ -48,11 +91,16 @@ class CfnUpdater(object):
         self.dry_run = False
         self.verbose = False
         self._filename = None
+        self._stdin = None
+        self._stdin_template = None
         self.yaml = YAML(typ="rt")
         self.yaml.preserve_quotes = True
         self.yaml.explicit_start = True
         self.yaml.width = 4096
         self.yaml.indent(mapping=2, sequence=4, offset=2)
+        self.follow_nested = False
+        self.journal = Journal()
+        self.max_workers = None
 
     @property
     def filename(self):
@@ -66,9 +114,15 @@ class CfnUpdater(object):
         """
         requires `filename` ends with `.json`, `.yaml` or `.yml`.
         sets `basename`, `template_format` and `_filename` accordingly.
-        clears `dirty` and `templae`
+        clears `dirty` and `templae`. The filename "-" refers to stdin and stdout.
         """
         self._filename = filename
+        if filename == STDIO:
+            self.basename = filename
+            self.template_format = self._stdin[0] if self._stdin else None
+            self.template = None
+            self.dirty = False
+            return
         parts = os.path.splitext(os.path.basename(filename))
         self.basename = parts[0]
         self.template_format = parts[1]
@@ -83,6 +137,21 @@ class CfnUpdater(object):
         """
         self.dirty = False
         self.template = None
+        if self.filename == STDIO:
+            if self._stdin is None:
+                content = sys.stdin.read()
+                self._stdin = (detect_format(content), content)
+            self.template_format, content = self._stdin
+            if self._stdin_template is None:
+                if self.template_format == ".json":
+                    self._stdin_template = json.loads(
+                        content, object_pairs_hook=collections.OrderedDict
+                    )
+                else:
+                    self._stdin_template = self.yaml.load(content)
+            self.template = self._stdin_template
+            return
+
         with open(self.filename, "r") as f:
             if self.template_format == ".json":
                 self.template = json.load(f, object_pairs_hook=collections.OrderedDict)
@@ -98,8 +167,17 @@ class CfnUpdater(object):
     def write(self):
         """
         write modified content from `template` to `filename`. It will retain it's original
-        format (yaml or json) but loose original formatting and comments.
+        format (yaml or json) but loose original formatting and comments. The file is
+        replaced atomically.
+
+        If the filename is "-", the template is written to stdout, also when there are no
+        changes. Without changes or in a dry run, the content read from stdin is written
+        unchanged.
         """
+        if self.filename == STDIO:
+            self.write_stdout()
+            return
+
         if not self.dirty:
             if self.verbose:
                 sys.stderr.write("INFO: no changes in {}\n".format(self.filename))
@@ -108,12 +186,26 @@ class CfnUpdater(object):
         if self.dry_run:
             return
 
-        with open(self.filename, "w") as f:
+        def dump(f):
             if self.template_format == ".yaml":
                 self.yaml.dump(self.template, f)
             else:
                 json.dump(self.template, f, separators=(",", ": "), indent=2)
 
+        write_atomic(self.filename, dump)
+
+    def write_stdout(self):
+        if self.verbose and not self.dirty:
+            sys.stderr.write("INFO: no changes in {}\n".format(self.filename))
+        if self.dry_run or not self.dirty:
+            sys.stdout.write(self._stdin[1])
+        elif self.template_format == ".yaml":
+            self.yaml.dump(self.template, sys.stdout)
+        else:
+            json.dump(self.template, sys.stdout, separators=(",", ": "), indent=2)
+            sys.stdout.write("\n")
+        sys.stdout.flush()
+
     def update_template(self):
         """
         implement the update logic of `self.template`. Set self.dirty to True, if you modified.
@@ -124,15 +216,18 @@ class CfnUpdater(object):
     def resources(self):
         return self.template.get("Resources", {})
 
-    def update(self, path):
+    def templates(self, path):
         """
-        recursively updates all the cloudformation templates in the specified `path`. `path` may be a file,
-        a directory or a list of paths.
+        recursively loads all the cloudformation templates in the specified `path` into `self.template`
+        and yields the filename of each. `path` may be a file, a directory, "-" for stdin or a list
+        of paths.
         """
         if isinstance(path, (list, tuple)):
             for p in path:
-                self.update(p)
+                yield from self.templates(p)
         elif os.path.isfile(path):
+            if self.skip_completed(path):
+                return
             if (
                 path.endswith(".yml")
                 or path.endswith(".yaml")
@@ -141,8 +236,7 @@ class CfnUpdater(object):
                 self.filename = path
                 self.load()
                 if self.is_cloudformation_template():
-                    self.update_template()
-                    self.write()
+                    yield path
                 else:
                     if self.verbose:
                         sys.stderr.write(
@@ -150,14 +244,178 @@ class CfnUpdater(object):
                                 path
                             )
                         )
+        elif path == STDIO:
+            self.filename = path
+            self.load()
+            if self.is_cloudformation_template():
+                yield path
         elif os.path.isdir(path):
             for root, dirs, files in os.walk(path):
                 for f in files:
-                    self.update(os.path.join(root, f))
+                    yield from self.templates(os.path.join(root, f))
         else:
             sys.stderr.write("ERROR: {} is not a file or directory\n".format(path))
             raise SystemExit(1)
 
+    def update(self, path):
+        """
+        recursively updates all the cloudformation templates in the specified `path`. `path` may be a file,
+        a directory or a list of paths.
+        """
+        if self.follow_nested:
+            self.update_nested(path)
+            return
+
+        for filename in self.templates(path):
+            self.update_template()
+            self.write()
+            self.complete(filename)
+        self.pass_through_stdin(path)
+        self.journal.flush()
+        self.journal.finished = True
+
+    def pass_through_stdin(self, path):
+        """
+        writes stdin unchanged to stdout, if `path` refers to stdin and it is not a
+        CloudFormation template. This is done once, after the templates were updated,
+        as the templates in `path` may be iterated more than once.
+        """
+        paths = path if isinstance(path, (list, tuple)) else [path]
+        if STDIO not in paths or self._stdin is None:
+            return
+        template = self._stdin_template
+        if template and "AWSTemplateFormatVersion" in template:
+            return
+        sys.stderr.write(
+            "WARN: passing stdin through, as it is not a CloudFormation template\n"
+        )
+        sys.stdout.write(self._stdin[1])
+        sys.stdout.flush()
+
+    def skip_completed(self, path: str) -> bool:
+        """
+        returns True if the template `path` was completed by the run which is resumed.
+        """
+        if self.follow_nested or not self.journal.is_completed(path):
+            return False
+        if self.verbose:
+            sys.stderr.write(f"INFO: skipping {path}, as it was already completed\n")
+        return True
+
+    def complete(self, filename: str):
+        """
+        records the template `filename` as completed in the journal.
+        """
+        if filename != STDIO and not self.dry_run:
+            self.journal.complete(filename, self.dirty)
+
+    def nested_templates(self) -> list:
+        """
+        returns the filenames of the local templates of the nested stacks in `self.template`,
+        relative to `self.filename`. Locations which are urls or intrinsic functions are ignored.
+        """
+        result = []
+        for name, resource in self.resources.items():
+            if not isinstance(resource, dict):
+                continue
+            location = _nested_template_properties.get(resource.get("Type"))
+            properties = resource.get("Properties")
+            url = properties.get(location) if isinstance(properties, dict) else None
+            if not isinstance(url, str) or "://" in url:
+                continue
+            filename = os.path.normpath(
+                os.path.join(os.path.dirname(self.filename), url)
+            )
+            if os.path.isfile(filename):
+                result.append(filename)
+            elif self.verbose:
+                sys.stderr.write(
+                    f"INFO: skipping nested stack {name} in {self.filename}, as {filename} does not exist\n"
+                )
+        return result
+
+    def stack_graph(self, path) -> dict:
+        """
+        returns the CloudFormation templates in `path` and the local templates of their
+        nested stacks, recursively. The result maps the real path of each template to
+        its filename, the loaded template and the real paths of its nested templates.
+        Every template is loaded once, even when it is nested in multiple stacks.
+        """
+        graph = {}
+        pending = []
+        for filename in self.templates(path):
+            key = os.path.realpath(filename)
+            if key not in graph:
+                graph[key] = (filename, self.template, self.nested_templates())
+                pending.extend(graph[key][2])
+
+        while pending:
+            filename = pending.pop()
+            key = os.path.realpath(filename)
+            if key in graph:
+                continue
+            try:
+                self.filename = filename
+                self.load()
+            except ValueError as error:
+                sys.stderr.write(f"WARN: skipping nested template {filename}, {error}\n")
+                continue
+            if not isinstance(self.template, dict) or "Resources" not in self.template:
+                sys.stderr.write(
+                    f"WARN: skipping {filename} as it is not a CloudFormation template\n"
+                )
+                continue
+            graph[key] = (filename, self.template, self.nested_templates())
+            pending.extend(graph[key][2])
+
+        for key, (filename, template, nested) in graph.items():
+            graph[key] = (
+                filename,
+                template,
+                [os.path.realpath(n) for n in nested if os.path.realpath(n) in graph],
+            )
+        return graph
+
+    def _update_loaded(self, filename: str, template: dict) -> bool:
+        """
+        updates the already loaded `template` of `filename` in a copy of this updater,
+        so that templates can be updated concurrently. Returns True if it was changed.
+        """
+        updater = copy.copy(self)
+        updater.yaml = YAML(typ=self.yaml.typ, pure=self.yaml.pure)
+        for setting in _yaml_settings:
+            setattr(updater.yaml, setting, getattr(self.yaml, setting))
+        updater.filename = filename
+        updater.template = template
+        updater.update_template()
+        updater.write()
+        updater.complete(filename)
+        return updater.dirty
+
+    def update_nested(self, path):
+        """
+        updates the cloudformation templates in `path` and the local templates of their
+        nested stacks, as found by stack_graph(path). Each template is updated exactly once,
+        in a pool of `self.max_workers` threads.
+        """
+        graph = self.stack_graph(path)
+        pending = []
+        for filename, template, _ in graph.values():
+            if filename != STDIO and self.journal.is_completed(filename):
+                if self.verbose:
+                    sys.stderr.write(
+                        f"INFO: skipping {filename}, as it was already completed\n"
+                    )
+            else:
+                pending.append((filename, template))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            changes = list(pool.map(lambda node: self._update_loaded(*node), pending))
+        self.dirty = any(changes)
+        self.pass_through_stdin(path)
+        self.journal.flush()
+        self.journal.finished = True
+
 
 def read_template(filename: str) -> dict:
     src = CfnUpdater()
@@ -23,11 +23,13 @@ from aws_cfn_update.packer_ami_updater import main as packer_latest_ami
 import click
 import pytz
 
+from aws_cfn_update.cfn_updater import STDIO
 from aws_cfn_update.config_rule_inline_code_updater import ConfigRuleInlineCodeUpdater
 from aws_cfn_update.container_image_updater import ContainerImageUpdater
 from aws_cfn_update.cron_schedule_expression_updater import (
     CronScheduleExpressionUpdater,
 )
+from aws_cfn_update.journal import Journal, default_journal
 from aws_cfn_update.latest_ami_updater import AMIUpdater
 from aws_cfn_update.rest_api_body_updater import RestAPIBodyUpdater
 from aws_cfn_update.lambda_inline_code_updater import LambdaInlineCodeUpdater
@@ -38,6 +40,7 @@ from aws_cfn_update.add_new_resources import add_new_resources
 from aws_cfn_update.oidc_provider_thumbprints_updater import (
     update_oidc_provider_thumbprint,
 )
+from aws_cfn_update.scheduler_migrator import migrate_to_scheduler
 
 
 @click.group()
@@ -48,10 +51,35 @@ from aws_cfn_update.oidc_provider_thumbprints_updater import (
     help="do not change anything, just show what is going to happen",
 )
 @click.option("--verbose", is_flag=True, default=False, help="show more output")
+@click.option(
+    "--follow-nested",
+    is_flag=True,
+    default=False,
+    help="update the local templates of nested stacks too",
+)
+@click.option(
+    "--journal",
+    "journal_file",
+    required=False,
+    type=click.Path(dir_okay=False),
+    help="to record the completed templates in  [default with --resume: in the cache directory]",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="skip the templates completed by an interrupted run, as recorded in the journal",
+)
 @click.pass_context
-def cli(ctx, dry_run, verbose):
+def cli(ctx, dry_run, verbose, follow_nested, journal_file, resume):
     """Programmatically update CloudFormation templates"""
     ctx.obj = copy(ctx.params)
+    if dry_run or not (journal_file or resume):
+        journal = Journal()
+    else:
+        journal = Journal(journal_file or default_journal(sys.argv[1:]), resume)
+    ctx.obj["journal"] = journal
+    ctx.call_on_close(journal.close)
 
 
 def validate_image(ctx, param, value):
@@ -72,17 +100,24 @@ def validate_image(ctx, param, value):
     callback=validate_image,
     help="to update to",
 )
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
 def task_image(ctx, image, path):
     if not image:
         image = os.getenv("AWS_CFN_UPDATE_CONTAINER_IMAGES", "").split()
 
     if not image:
-        click.echo("no container images to update")
-        return
+        click.echo("no container images to update", err=True)
+        if STDIO not in path:
+            return
+        # pass the template on stdin through unchanged
+        path = (STDIO,)
 
     updater = ContainerImageUpdater()
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
     updater.main(image, ctx.obj["dry_run"], ctx.obj["verbose"], list(path))
 
 
@@ -104,10 +139,14 @@ def task_image(ctx, image, path):
     default=False,
     help="of the AMI resource and replace all references",
 )
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
 def ami_image_update(ctx, ami_name_pattern, add_new_version, ami_name, path):
     updater = AMIUpdater()
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
     updater.main(
         ami_name_pattern,
         ctx.obj["dry_run"],
@@ -133,13 +172,25 @@ def ami_image_update(ctx, ami_name_pattern, add_new_version, ami_name, path):
     default=datetime.now(),
     help="to use as reference date",
 )
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--forecast",
+    type=click.IntRange(min=1),
+    required=False,
+    help="number of days to print the dates of schedule expression changes for",
+)
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
-def cron_schedule_expression(ctx, timezone, date, path):
+def cron_schedule_expression(ctx, timezone, date, forecast, path):
     updater = CronScheduleExpressionUpdater()
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
     try:
         tz = pytz.timezone(timezone)
-        updater.main(tz, date, ctx.obj["dry_run"], ctx.obj["verbose"], list(path))
+        updater.main(
+            tz, date, ctx.obj["dry_run"], ctx.obj["verbose"], list(path), forecast
+        )
     except pytz.exceptions.UnknownTimeZoneError:
         raise click.BadParameter(
             "invalid timezone specified", ctx=ctx, param="timezone"
@@ -148,7 +199,10 @@ def cron_schedule_expression(ctx, timezone, date, path):
 
 @cli.command(name="rest-api-body", help=RestAPIBodyUpdater.__doc__)
 @click.option(
-    "--resource", required=True, help="AWS::ApiGateway::RestApi body to update"
+    "--resource",
+    required=True,
+    multiple=True,
+    help="name of the API to update the body of",
 )
 @click.option(
     "--open-api-specification",
@@ -173,7 +227,23 @@ def cron_schedule_expression(ctx, timezone, date, path):
     default=1,
     help="number of versions to keep, if --add-new-version is specified",
 )
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--diff",
+    type=click.Choice(["structural", "lines"]),
+    default="structural",
+    show_default=True,
+    help="show the changed paths or lines of the body, if --verbose is specified",
+)
+@click.option(
+    "--max-diff-hunks",
+    type=click.IntRange(min=0),
+    default=50,
+    show_default=True,
+    help="maximum number of changes shown by --diff, 0 for all",
+)
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
 def swagger_document(
     ctx,
@@ -183,10 +253,14 @@ def swagger_document(
     path,
     add_new_version,
     keep,
+    diff,
+    max_diff_hunks,
 ):
     updater = RestAPIBodyUpdater()
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
     updater.main(
-        resource,
+        list(resource),
         open_api_specification,
         api_gateway_extensions,
         list(path),
@@ -194,6 +268,8 @@ def swagger_document(
         keep,
         ctx.obj["dry_run"],
         ctx.obj["verbose"],
+        diff,
+        max_diff_hunks,
     )
 
 
@@ -204,10 +280,14 @@ def swagger_document(
 @click.option(
     "--file", required=True, type=click.Path(exists=True), help="containing the source"
 )
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
 def lambda_body(ctx, resource, file, path):
     updater = LambdaInlineCodeUpdater()
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
 
     with open(file, "r") as f:
         body = f.read()
@@ -222,18 +302,45 @@ def lambda_body(ctx, resource, file, path):
     default=[],
     help="The new S3 key in semver format",
 )
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--resolve-from-s3",
+    is_flag=True,
+    default=False,
+    help="resolve the latest S3 key by listing the S3 bucket",
+)
+@click.option(
+    "--cache-max-age",
+    type=int,
+    default=300,
+    show_default=True,
+    help="seconds to reuse cached S3 listings, if --resolve-from-s3 is specified",
+)
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
-def update_s3_key(ctx, s3_key, path):
+def update_s3_key(ctx, s3_key, resolve_from_s3, cache_max_age, path):
     updater = LambdaS3KeyUpdater()
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
     if not s3_key:
         s3_key = os.getenv("AWS_CFN_UPDATE_LAMBDA_S3_KEYS", "").split()
 
-    if not s3_key:
-        click.echo("no Lambda s3 keys to update")
-        return
+    if not s3_key and not resolve_from_s3:
+        click.echo("no Lambda s3 keys to update", err=True)
+        if STDIO not in path:
+            return
+        # pass the template on stdin through unchanged
+        path = (STDIO,)
 
-    updater.main(s3_key, list(path), ctx.obj["dry_run"], ctx.obj["verbose"])
+    updater.main(
+        s3_key,
+        list(path),
+        ctx.obj["dry_run"],
+        ctx.obj["verbose"],
+        resolve_from_s3,
+        cache_max_age,
+    )
 
 
 @cli.command(name="config-rule-inline-code", help=ConfigRuleInlineCodeUpdater.__doc__)
@@ -241,10 +348,14 @@ def update_s3_key(ctx, s3_key, path):
 @click.option(
     "--file", required=True, type=click.Path(exists=True), help="containing the source"
 )
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
 def config_rule_body(ctx, resource, file, path):
     updater = ConfigRuleInlineCodeUpdater()
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
 
     with open(file, "r") as f:
         body = f.read()
@@ -256,6 +367,7 @@ cli.add_command(remove_resource)
 cli.add_command(add_new_resources)
 cli.add_command(packer_latest_ami)
 cli.add_command(update_oidc_provider_thumbprint)
+cli.add_command(migrate_to_scheduler)
 
 
 def main():
@@ -12,10 +12,15 @@
 #   limitations under the License.
 #
 #   Copyright 2018 binx.io B.V.
+import json
 import re
 import sys
-from datetime import datetime, timedelta, tzinfo
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, tzinfo
+from functools import lru_cache
+from typing import Optional
 
+import pytz
 from croniter import croniter
 from tzlocal import get_localzone
 
@@ -60,7 +65,9 @@ class CronScheduleExpressionUpdater(CfnUpdater):
               ScheduleExpression: cron(30 00 * * ? *)
               State: ENABLED
 
-
+    With --forecast <days>, no templates are changed. Instead, a JSON plan is
+    printed of the dates in the next <days> days on which a schedule expression
+    changes, so that the updater only needs to be run on those dates.
     """
 
     def __init__(self):
@@ -79,6 +86,7 @@ class CronScheduleExpressionUpdater(CfnUpdater):
     def timezone(self, timezone):
         self._timezone = timezone
         self._today = timezone.localize(self._today)
+        utc_offset_table(canonical_timezone(timezone))
 
     @property
     def today(self):
@@ -104,6 +112,15 @@ class CronScheduleExpressionUpdater(CfnUpdater):
     def all_matching_resources(self, resources):
         return {k: v for k, v in resources.items() if self.is_matching_resource(v)}
 
+    @staticmethod
+    def local_cron_expression(resource) -> Optional[str]:
+        """
+        returns the cron expression in the `Description` of the resource, or None.
+        """
+        description = resource.get("Properties", {}).get("Description", "")
+        match = aws_cron_pattern.search(description)
+        return cron_expression(match) if match else None
+
     def update_template(self):
         """
         converts the cron expression in `Description` into a UTC expression in `ScheduleExpression`.
@@ -111,26 +128,82 @@ class CronScheduleExpressionUpdater(CfnUpdater):
         resources = self.all_matching_resources(self.template.get("Resources", {}))
 
         for name, resource in resources.items():
-            description = resource.get("Properties", {}).get("Description", "")
-            match = aws_cron_pattern.search(description)
-            if match:
-                expression = "{minutes} {hours} {day_of_month} {month} {day_of_week} {year}".format(
-                    **match.groupdict()
-                )
+            expression = self.local_cron_expression(resource)
+            if expression:
                 new_expression = correct_cron_expression_for_utc(expression, self.today)
                 if expression != new_expression:
                     properties = resource.get("Properties")
                     properties["ScheduleExpression"] = "cron({})".format(new_expression)
                     if self.verbose:
-                        print("INFO: updating {}".format(name))
+                        sys.stderr.write("INFO: updating {}\n".format(name))
                     self.dirty = True
 
-    def main(self, tz, date, dry_run, verbose, paths):
+    def schedule_changes(self, expression: str, days: int) -> list[tuple[date, str]]:
+        """
+        returns the dates in the next `days` days on which the UTC expression of the local
+        cron `expression` changes, together with the new UTC expression. The expression
+        only changes on the first day of which the next run is after a UTC offset
+        transition, so only those days are evaluated.
+        """
+        result = []
+        previous = correct_cron_expression_for_utc(expression, self.today)
+        for day in transition_days(expression, self.today, days):
+            today = self.today + timedelta(days=day)
+            utc_expression = correct_cron_expression_for_utc(expression, today)
+            if utc_expression != previous:
+                result.append((today.date(), utc_expression))
+                previous = utc_expression
+        return result
+
+    def forecast(self, paths, days: int) -> dict:
+        """
+        returns the plan of dates in the next `days` days on which the schedule
+        expression of the matching rules in `paths` must be updated. If a rule is not
+        up to date today, it is planned for today. The changes are calculated once per
+        cron expression.
+        """
+        changes = {}
+        plan = {}
+        for _ in self.templates(paths):
+            resources = self.all_matching_resources(self.template.get("Resources", {}))
+            for name, resource in resources.items():
+                expression = self.local_cron_expression(resource)
+                if expression not in changes:
+                    changes[expression] = self.schedule_changes(expression, days)
+
+                updates = list(changes[expression])
+                current = aws_cron_pattern.search(
+                    resource["Properties"].get("ScheduleExpression") or ""
+                )
+                utc_expression = correct_cron_expression_for_utc(expression, self.today)
+                if not current or cron_expression(current) != utc_expression:
+                    updates.insert(0, (self.today.date(), utc_expression))
+
+                for day, utc_expression in updates:
+                    plan.setdefault(day.isoformat(), []).append(
+                        {
+                            "path": self.filename,
+                            "resource": name,
+                            "schedule_expression": f"cron({utc_expression})",
+                        }
+                    )
+
+        return {
+            "timezone": str(getattr(self.timezone, "zone", self.timezone)),
+            "date": self.today.date().isoformat(),
+            "days": days,
+            "dates": dict(sorted(plan.items())),
+        }
+
+    def main(self, tz, date, dry_run, verbose, paths, forecast=None):
         self.dry_run = dry_run
         self.verbose = verbose
         self.timezone = tz
         if date:
             self.today = date
+        if forecast is not None:
+            print(json.dumps(self.forecast(paths, forecast), separators=(",", ":")))
+            return
         self.update(paths)
 
 
@@ -142,6 +215,15 @@ cron_pattern = re.compile(
 )
 
 
+def cron_expression(match: re.Match) -> str:
+    """
+    returns the cron expression of a `aws_cron_pattern` or `cron_pattern` match.
+    """
+    return "{minutes} {hours} {day_of_month} {month} {day_of_week} {year}".format(
+        **match.groupdict()
+    )
+
+
 def correct_for_utc(hour, utcoffset):
     if utcoffset.seconds % 3600 == 0:
         return int((hour + 24 - (utcoffset.seconds / 3600)) % 24)
@@ -179,28 +261,125 @@ def correct_cron_hours_expression_for_utc(expression, utcoffset):
     return expression
 
 
+class UTCOffsetTable(object):
+    """
+    the UTC offsets of a timezone, as a sorted table of the local times at which the
+    offset changes. The offset of a local time is found by a binary search of the table.
+    Ambiguous and non-existent local times around a transition get the standard time
+    offset, like `localize(dt, is_dst=False)`.
+    """
+
+    def __init__(self, timezone: tzinfo):
+        self.timezone = timezone
+        self.boundaries = []
+        self.offsets = []
+
+        if isinstance(timezone, pytz.tzinfo.DstTzInfo):
+            for utc, (offset, _, _) in zip(
+                timezone._utc_transition_times, timezone._transition_info
+            ):
+                self.boundaries.append(
+                    utc + offset if utc > datetime.min + abs(offset) else datetime.min
+                )
+                self.offsets.append(offset)
+        elif isinstance(timezone, pytz.tzinfo.StaticTzInfo) or timezone is pytz.utc:
+            self.boundaries.append(datetime.min)
+            self.offsets.append(timezone.utcoffset(datetime.min))
+
+    def utcoffset(self, local_time: datetime) -> timedelta:
+        """
+        returns the UTC offset of the naive `local_time`.
+        """
+        if not self.offsets:
+            return local_time.replace(tzinfo=self.timezone).utcoffset()
+        index = bisect_right(self.boundaries, local_time) - 1
+        return self.offsets[max(index, 0)]
+
+
+def canonical_timezone(timezone: tzinfo) -> tzinfo:
+    """
+    returns the timezone of which `timezone` is a localized instance.
+    """
+    zone = getattr(timezone, "zone", None)
+    return pytz.timezone(zone) if zone else timezone
+
+
+@lru_cache(maxsize=None)
+def utc_offset_table(timezone: tzinfo) -> UTCOffsetTable:
+    return UTCOffsetTable(timezone)
+
+
 def correct_cron_expression_for_utc(expression, today):
+    return _correct_cron_expression_for_utc(
+        expression, canonical_timezone(today.tzinfo), today.date()
+    )
+
+
+def transition_days(expression: str, today: datetime, days: int) -> list[int]:
+    """
+    returns the days in the next `days` days after `today` on which the next run of the
+    local cron `expression` is the first after a UTC offset transition of the timezone of
+    `today`. Each day is found by a binary search, instead of evaluating every day.
+    """
+    table = utc_offset_table(canonical_timezone(today.tzinfo))
+    if not table.offsets:
+        return list(range(1, days + 1))
+
+    def next_run(day: int) -> datetime:
+        return _next_run(expression, (today + timedelta(days=day)).date())
+
+    first, last = next_run(0), next_run(days)
+    result = []
+    low = 1
+    for boundary in table.boundaries[
+        bisect_right(table.boundaries, first) : bisect_right(table.boundaries, last)
+    ]:
+        high = days
+        while low < high:
+            middle = (low + high) // 2
+            if next_run(middle) >= boundary:
+                high = middle
+            else:
+                low = middle + 1
+        if not result or result[-1] != low:
+            result.append(low)
+    return result
+
+
+@lru_cache(maxsize=4096)
+def _next_run(expression: str, today: date) -> datetime:
+    """
+    returns the first local time after `today` at which the cron `expression` runs.
+    """
     match = cron_pattern.search(expression)
     assert match, '"{}" is not a cron expression'.format(expression)
 
-    cron = match.groupdict()
-    tomorrow_midnight = today.tzinfo.localize(
-        datetime(today.year, today.month, today.day) + timedelta(days=1)
-    )
-
+    ccron = {k: ("*" if v == "?" else v) for (k, v) in match.groupdict().items()}
+    tomorrow_midnight = datetime(today.year, today.month, today.day) + timedelta(days=1)
     try:
-        ccron = {k: ("*" if v == "?" else v) for (k, v) in cron.items()}
-        expression = (
+        return croniter(
             "{minutes} {hours} {day_of_month} {month} {day_of_week} {year}".format(
                 **ccron
-            )
-        )
-        next_time = croniter(expression, tomorrow_midnight).get_next(datetime)
+            ),
+            tomorrow_midnight,
+        ).get_next(datetime)
     except ValueError as e:
         sys.stderr.write("ERROR: {}".format(e))
         raise SystemExit(1)
 
-    utcoffset = next_time.tzinfo.utcoffset(next_time)
+
+@lru_cache(maxsize=4096)
+def _correct_cron_expression_for_utc(expression: str, timezone: tzinfo, today: date):
+    match = cron_pattern.search(expression)
+    assert match, '"{}" is not a cron expression'.format(expression)
+
+    cron = match.groupdict()
+    next_time = _next_run(expression, today)
+    expression = "{minutes} {hours} {day_of_month} {month} {day_of_week} {year}".format(
+        **{k: ("*" if v == "?" else v) for (k, v) in cron.items()}
+    )
+
+    utcoffset = utc_offset_table(timezone).utcoffset(next_time)
     if utcoffset.seconds % 3600 == 0:
         cron["hours"] = correct_cron_hours_expression_for_utc(cron["hours"], utcoffset)
         expression = (
@@ -211,7 +390,7 @@ def correct_cron_expression_for_utc(expression, today):
     else:
         sys.stderr.write(
             'WARN: UTC offset for "{}" in timezone "{}" is not a multiple of hours but {} seconds.\n'.format(
-                expression, today.tzinfo, utcoffset.seconds
+                expression, timezone, utcoffset.seconds
             )
         )
 
@@ -0,0 +1,194 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+from bisect import bisect_left
+from typing import Iterator
+
+from aws_cfn_update.nodes import node_tag, structural_hash
+
+
+def structural_diff(old, new, path: tuple = ()) -> Iterator[tuple]:
+    """
+    walks `old` and `new` together and generates a tuple (change, path) for every
+    difference, where change is "+" for added, "-" for removed and "~" for changed
+    values. The path is a tuple of keys and indices.
+    """
+    same_tag = node_tag(old) == node_tag(new)
+    if isinstance(old, dict) and isinstance(new, dict) and same_tag:
+        old_keys = {str(k): k for k in old}
+        new_keys = {str(k): k for k in new}
+        for name, key in new_keys.items():
+            if name not in old_keys:
+                yield "+", path + (name,)
+            else:
+                yield from structural_diff(
+                    old[old_keys[name]], new[key], path + (name,)
+                )
+        for name in old_keys:
+            if name not in new_keys:
+                yield "-", path + (name,)
+    elif isinstance(old, list) and isinstance(new, list) and same_tag:
+        for i in range(min(len(old), len(new))):
+            yield from structural_diff(old[i], new[i], path + (i,))
+        for i in range(len(old), len(new)):
+            yield "+", path + (i,)
+        for i in range(len(new), len(old)):
+            yield "-", path + (i,)
+    elif structural_hash(old) != structural_hash(new):
+        yield "~", path
+
+
+def format_path(path: tuple) -> str:
+    """
+    returns the `path` as a dotted string, like paths./orders.post.responses.200
+    """
+    return ".".join(str(p) for p in path) if path else "."
+
+
+def structural_diff_lines(old, new, max_changes: int = 0) -> Iterator[str]:
+    """
+    generates a line for each changed path between `old` and `new`, truncated
+    after `max_changes` lines if it is greater than zero.
+    """
+    changes = structural_diff(old, new)
+    count = 0
+    for change, path in changes:
+        if max_changes and count == max_changes:
+            remaining = 1 + sum(1 for _ in changes)
+            yield f"... {remaining} more changes"
+            return
+        yield f"{change} {format_path(path)}"
+        count += 1
+
+
+def _longest_increasing(pairs: list) -> list:
+    """
+    returns the longest subsequence of `pairs` which is increasing in the second
+    element, using patience sorting. `pairs` must be sorted on the first element.
+    """
+    tops, backlinks, piles = [], [], []
+    for i, (_, b) in enumerate(pairs):
+        pile = bisect_left(tops, b)
+        if pile == len(tops):
+            tops.append(b)
+            piles.append(i)
+        else:
+            tops[pile] = b
+            piles[pile] = i
+        backlinks.append(piles[pile - 1] if pile > 0 else None)
+
+    result = []
+    i = piles[-1] if piles else None
+    while i is not None:
+        result.append(pairs[i])
+        i = backlinks[i]
+    result.reverse()
+    return result
+
+
+def _unique_anchors(a: list, b: list, alo: int, ahi: int, blo: int, bhi: int):
+    """
+    returns the longest increasing sequence of lines which occur exactly once in
+    both a[alo:ahi] and b[blo:bhi], as (index in a, index in b).
+    """
+    in_a, in_b = {}, {}
+    for i in range(alo, ahi):
+        in_a[a[i]] = None if a[i] in in_a else i
+    for j in range(blo, bhi):
+        in_b[b[j]] = None if b[j] in in_b else j
+    pairs = [
+        (i, in_b[line])
+        for line, i in in_a.items()
+        if i is not None and in_b.get(line) is not None
+    ]
+    pairs.sort()
+    return _longest_increasing(pairs)
+
+
+def _matching_lines(a: list, b: list) -> list:
+    """
+    returns the matching lines of `a` and `b` as a sorted list of (index in a,
+    index in b), using the patience diff algorithm.
+    """
+    result = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            result.append((alo, blo))
+            alo, blo = alo + 1, blo + 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi, bhi = ahi - 1, bhi - 1
+            result.append((ahi, bhi))
+
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        for i, j in anchors:
+            result.append((i, j))
+            regions.append((alo, i, blo, j))
+            alo, blo = i + 1, j + 1
+        if anchors:
+            regions.append((alo, ahi, blo, bhi))
+    result.sort()
+    return result
+
+
+def line_diff(
+    old: list, new: list, context: int = 3, max_hunks: int = 0
+) -> Iterator[str]:
+    """
+    generates a unified diff of the lines `old` and `new`, truncated after
+    `max_hunks` hunks if it is greater than zero. Lines are hashed to integers
+    before they are compared, and matched with the patience diff algorithm.
+    """
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in old]
+    b = [ids.setdefault(line, len(ids)) for line in new]
+
+    # the changed blocks as (a start, a end, b start, b end)
+    blocks, i, j = [], 0, 0
+    for mi, mj in _matching_lines(a, b) + [(len(a), len(b))]:
+        if i < mi or j < mj:
+            blocks.append((i, mi, j, mj))
+        i, j = mi + 1, mj + 1
+
+    # group the changed blocks which are within 2 * context lines into hunks
+    hunks = []
+    for block in blocks:
+        if hunks and block[0] - hunks[-1][-1][1] <= 2 * context:
+            hunks[-1].append(block)
+        else:
+            hunks.append([block])
+
+    for n, hunk in enumerate(hunks):
+        if max_hunks and n == max_hunks:
+            yield f"... {len(hunks) - n} more hunks"
+            return
+        astart = max(hunk[0][0] - context, 0)
+        bstart = max(hunk[0][2] - context, 0)
+        aend = min(hunk[-1][1] + context, len(a))
+        bend = min(hunk[-1][3] + context, len(b))
+        yield f"@@ -{astart + 1},{aend - astart} +{bstart + 1},{bend - bstart} @@"
+        i = astart
+        for alo, ahi, blo, bhi in hunk:
+            for line in old[i:alo]:
+                yield f" {line}"
+            for line in old[alo:ahi]:
+                yield f"-{line}"
+            for line in new[blo:bhi]:
+                yield f"+{line}"
+            i = ahi
+        for line in old[i:aend]:
+            yield f" {line}"
@@ -0,0 +1,274 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+import re
+from typing import Callable, Iterator, Optional
+
+from ruamel.yaml.comments import CommentedSeq, TaggedScalar
+
+_sub_pattern = re.compile(r"\${([^!}][^}]*)}")
+
+# the namespace of the name referred to, by function
+_namespaces = {
+    "Ref": "value",
+    "Fn::GetAtt": "value",
+    "Fn::Sub": "value",
+    "DependsOn": "value",
+    "Fn::If": "condition",
+    "Condition": "condition",
+    "Fn::FindInMap": "mapping",
+    "Fn::ImportValue": "export",
+}
+
+# the function of a short form tag
+_tags = {
+    "Ref": "Ref",
+    "GetAtt": "Fn::GetAtt",
+    "Sub": "Fn::Sub",
+    "If": "Fn::If",
+    "FindInMap": "Fn::FindInMap",
+    "ImportValue": "Fn::ImportValue",
+    "Condition": "Condition",
+}
+
+
+def sub_names(sub: str, variables=()) -> list:
+    """
+    returns the names referred to by ${Name} or ${Name.Attribute} in `sub`, except
+    the `variables` of the substitution.
+    """
+    result = []
+    for match in _sub_pattern.finditer(sub):
+        name = match.group(1).split(".")[0]
+        if name not in variables and name not in result:
+            result.append(name)
+    return result
+
+
+def rename_in_sub(sub: str, mapping: dict, variables=()) -> str:
+    """
+    returns `sub` with the references ${Name} and ${Name.Attribute} renamed to the
+    name Name maps to in `mapping`, except the `variables` of the substitution.
+    """
+
+    def rename(match):
+        name, dot, attribute = match.group(1).partition(".")
+        if name not in mapping or name in variables:
+            return match.group(0)
+        return "${" + mapping[name] + dot + attribute + "}"
+
+    return _sub_pattern.sub(rename, sub)
+
+
+class Intrinsic:
+    """
+    a reference to a name by an intrinsic function, a Condition or a DependsOn
+    in a template. The referred name can be changed with `rename`. References in
+    the same value, like the names in a Fn::Sub string, share the same `holder`.
+    """
+
+    __slots__ = (
+        "function",
+        "name",
+        "attribute",
+        "holder",
+        "variables",
+        "_chain",
+        "_get",
+        "_set",
+    )
+
+    def __init__(
+        self, function, name, holder, chain, getter, setter, attribute=None
+    ):
+        self.function = function
+        self.name = name
+        self.attribute = attribute
+        self.holder = holder
+        self.variables = ()
+        self._chain = chain
+        self._get = getter
+        self._set = setter
+
+    @property
+    def namespace(self) -> str:
+        """
+        "value" for a resource or parameter, "condition", "mapping" or "export".
+        """
+        return _namespaces[self.function]
+
+    @property
+    def path(self) -> tuple:
+        """
+        the keys and indices leading to the node holding the reference.
+        """
+        result = []
+        chain = self._chain
+        while chain:
+            chain, key = chain
+            result.append(key)
+        result.reverse()
+        return tuple(result)
+
+    def rename(self, new_name: str):
+        """
+        changes the name referred to into `new_name`.
+        """
+        self.rename_all({self.name: new_name})
+
+    def rename_all(self, mapping: dict):
+        """
+        changes the name referred to into the name it maps to in `mapping`. For a
+        Fn::Sub, all names in the string are renamed at once, so that names
+        can be swapped.
+        """
+        if self.function == "Fn::Sub":
+            self._set(rename_in_sub(self._get(), mapping, self.variables))
+        elif self.name not in mapping:
+            return
+        elif self.function == "Fn::GetAtt" and self.attribute is not None:
+            self._set(f"{mapping[self.name]}.{self.attribute}")
+        else:
+            self._set(mapping[self.name])
+        self.name = mapping.get(self.name, self.name)
+
+    def __repr__(self):
+        return f"Intrinsic({self.function}, {self.name}, {self.path})"
+
+
+def _item(container, key, function, chain, attribute=None) -> Intrinsic:
+    return Intrinsic(
+        function,
+        container[key],
+        (id(container), key),
+        chain,
+        lambda: container[key],
+        lambda v: container.__setitem__(key, v),
+        attribute,
+    )
+
+
+def _scalar(node: TaggedScalar, function: str, chain, name=None, attribute=None):
+    def set_value(v):
+        node.value = v
+
+    return Intrinsic(
+        function,
+        name if name is not None else str(node.value),
+        id(node),
+        chain,
+        lambda: str(node.value),
+        set_value,
+        attribute,
+    )
+
+
+def _sub_intrinsics(container, key, chain, variables=()) -> Iterator[Intrinsic]:
+    for name in sub_names(container[key], variables):
+        intrinsic = _item(container, key, "Fn::Sub", chain)
+        intrinsic.name = name
+        intrinsic.variables = variables
+        yield intrinsic
+
+
+def _list_intrinsics(function: str, value: list, chain) -> Iterator[Intrinsic]:
+    """
+    generates the references of the list form of `function`.
+    """
+    if not value or not isinstance(value[0], str):
+        return
+    if function == "Fn::Sub":
+        variables = value[1] if len(value) > 1 and isinstance(value[1], dict) else {}
+        yield from _sub_intrinsics(value, 0, (chain, 0), variables)
+    elif function == "DependsOn":
+        for i, name in enumerate(value):
+            if isinstance(name, str):
+                yield _item(value, i, function, (chain, i))
+    elif function in ("Fn::GetAtt", "Fn::If", "Fn::FindInMap"):
+        yield _item(value, 0, function, (chain, 0))
+
+
+def _value_intrinsics(node: dict, key: str, chain) -> Iterator[Intrinsic]:
+    """
+    generates the references of the JSON form of `key` in `node`.
+    """
+    value = node[key]
+    if isinstance(value, str):
+        if key == "Fn::GetAtt":
+            name, dot, attribute = value.partition(".")
+            yield Intrinsic(
+                key,
+                name,
+                (id(node), key),
+                chain,
+                lambda: node[key],
+                lambda v: node.__setitem__(key, v),
+                attribute if dot else None,
+            )
+        elif key == "Fn::Sub":
+            yield from _sub_intrinsics(node, key, chain)
+        elif key in ("Ref", "DependsOn", "Condition", "Fn::ImportValue"):
+            yield _item(node, key, key, chain)
+    elif isinstance(value, list):
+        yield from _list_intrinsics(key, value, (chain, key))
+
+
+def _tagged_intrinsics(node: TaggedScalar, chain) -> Iterator[Intrinsic]:
+    function = _tags.get(node.tag.suffix if node.tag else None)
+    if function == "Fn::GetAtt":
+        name, dot, attribute = str(node.value).partition(".")
+        yield _scalar(node, function, chain, name, attribute if dot else None)
+    elif function == "Fn::Sub":
+        for name in sub_names(str(node.value)):
+            yield _scalar(node, function, chain, name)
+    elif function in ("Ref", "Condition", "Fn::ImportValue"):
+        yield _scalar(node, function, chain)
+
+
+def iter_intrinsics(template) -> Iterator[Intrinsic]:
+    """
+    generates all references in `template`, in both the JSON and the short tag form
+    of Ref, Fn::GetAtt, Fn::Sub, Fn::If, Fn::FindInMap, Fn::ImportValue, and in
+    Condition and DependsOn. The template is traversed iteratively, so there is no
+    limit on its depth.
+    """
+    stack = [(template, None)]
+    while stack:
+        node, chain = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in _namespaces:
+                    yield from _value_intrinsics(node, key, chain)
+                if isinstance(value, (dict, list, TaggedScalar)):
+                    stack.append((value, (chain, key)))
+        elif isinstance(node, list):
+            if isinstance(node, CommentedSeq) and node.tag and node.tag.suffix:
+                function = _tags.get(node.tag.suffix)
+                if function:
+                    yield from _list_intrinsics(function, node, chain)
+            for i in range(len(node) - 1, -1, -1):
+                if isinstance(node[i], (dict, list, TaggedScalar)):
+                    stack.append((node[i], (chain, i)))
+        elif isinstance(node, TaggedScalar):
+            yield from _tagged_intrinsics(node, chain)
+
+
+def visit_intrinsics(
+    template, callback: Callable[[Intrinsic], Optional[bool]]
+) -> list:
+    """
+    calls `callback` for every reference in `template`, see iter_intrinsics. Returns
+    the references for which the callback returned True.
+    """
+    return [i for i in iter_intrinsics(template) if callback(i)]
@@ -0,0 +1,190 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+from typing import Callable, Optional
+
+from .cache import cache_directory
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# the permissions of new files, as the temporary file is created with mode 0600
+_new_file_mode = 0o666 & ~_umask()
+
+
+def write_atomic(filename: str, dump: Callable, sync: bool = True):
+    """
+    writes `filename` by calling `dump` with a temporary file in the same directory,
+    which replaces `filename` once it is complete. A crash never leaves a partially
+    written file behind. A symbolic link is resolved, so the file it points to is
+    replaced. The permissions of an existing file are retained. With `sync`, the
+    content is flushed to disk before the rename. The rename itself is only durable
+    once the directory is synced, see fsync_directory.
+
+    A file with multiple hard links is not replaced, but overwritten with the content
+    of the temporary file, so that the links keep sharing the content.
+    """
+    filename = os.path.realpath(filename)
+    directory = os.path.dirname(filename)
+    fd, tmp = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            dump(f)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        try:
+            status = os.stat(filename)
+        except FileNotFoundError:
+            status = None
+
+        if status and status.st_nlink > 1:
+            with open(tmp, "rb") as src, open(filename, "r+b") as dst:
+                shutil.copyfileobj(src, dst)
+                dst.truncate()
+                dst.flush()
+                if sync:
+                    os.fsync(dst.fileno())
+            os.unlink(tmp)
+            return
+
+        os.chmod(tmp, stat.S_IMODE(status.st_mode) if status else _new_file_mode)
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def fsync_directory(directory: str):
+    """
+    flushes the entries of `directory` to disk, so that renames in it are durable.
+    """
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def default_journal(args: list) -> str:
+    """
+    returns the filename of the journal of a run with the command line `args` in the
+    current directory.
+    """
+    digest = hashlib.sha256(
+        "\0".join([os.getcwd()] + [a for a in args if a != "--resume"]).encode("utf-8")
+    ).hexdigest()
+    return os.path.join(cache_directory(), f"journal-{digest[:32]}.log")
+
+
+class Journal:
+    """
+    records the templates which were completely processed in an append-only file, so
+    that an interrupted run can be resumed without processing them again.
+
+    Completed templates are recorded in batches of `batch_size`. Before a batch is
+    recorded, the directories of the written templates are synced once per directory,
+    instead of once per file. The journal is removed when the run has finished.
+    Without a filename, only the directories are synced.
+    """
+
+    batch_size = 100
+
+    def __init__(self, filename: Optional[str] = None, resume: bool = False):
+        self.filename = filename
+        self.completed = set()
+        self.finished = False
+        self._pending = {}
+        self._lock = threading.Lock()
+        if filename and resume:
+            try:
+                with open(filename, "r") as f:
+                    self.completed = set(line.rstrip("\n") for line in f if line.endswith("\n"))
+            except FileNotFoundError:
+                pass
+        elif filename and os.path.exists(filename):
+            os.unlink(filename)
+
+    def is_completed(self, filename: str) -> bool:
+        return os.path.realpath(filename) in self.completed
+
+    def complete(self, filename: str, written: bool):
+        """
+        records the template `filename` as completed, `written` if it was changed.
+        """
+        path = os.path.realpath(filename)
+        with self._lock:
+            files = self._pending.setdefault(os.path.dirname(path), [])
+            files.append((path, written))
+            if sum(len(f) for f in self._pending.values()) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        """
+        syncs the directories of the written templates, and records the completed
+        templates in the journal.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        for directory, files in pending.items():
+            if any(written for _, written in files):
+                fsync_directory(directory)
+
+        completed = [path for files in pending.values() for path, _ in files]
+        self.completed.update(completed)
+        if not self.filename or not completed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+            with open(self.filename, "a") as f:
+                f.writelines(f"{path}\n" for path in completed)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as error:
+            sys.stderr.write(f"WARN: failed to write journal {self.filename}, {error}\n")
+
+    def close(self):
+        """
+        records the pending templates. If the run has finished, the journal is removed.
+        """
+        self.flush()
+        if self.finished and self.filename:
+            try:
+                os.unlink(self.filename)
+            except FileNotFoundError:
+                pass
@@ -14,13 +14,181 @@
 #   Copyright 2024 binx.io B.V.
 import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+from .cache import load_cache, save_cache
 from .cfn_updater import CfnUpdater
 
-_s3_key_semver_pattern = re.compile(
-    r"(.*)(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)(?:-((?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?\.zip$"
-)
+_semver_zip = r"(?P<major>0|[1-9]\d*)\.(?P<minor>0|[1-9]\d*)\.(?P<patch>0|[1-9]\d*)(?:-(?P<pre_release>(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+(?P<build>[0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?\.zip"
+
+# the prefix ends with a non-digit, so that it does not take the leading digits of the major version
+_s3_key_semver_pattern = re.compile(r"(?P<prefix>(?:.*\D)?)" + _semver_zip + "$")
+
+_semver_zip_pattern = re.compile(_semver_zip)
+
+
+def semver_precedence(match: re.Match) -> tuple:
+    """
+    returns a sort key for a semver match, following the semver precedence rules:
+    major, minor and patch compare numerically, a pre-release version has a lower
+    precedence than the release and pre-release identifiers compare numerically or
+    lexically. Build metadata does not influence the precedence.
+    """
+    major, minor, patch = (
+        int(match.group("major")),
+        int(match.group("minor")),
+        int(match.group("patch")),
+    )
+    pre_release = match.group("pre_release")
+    if pre_release is None:
+        return major, minor, patch, 1, ()
+
+    identifiers = tuple(
+        (0, int(i), "") if i.isdigit() else (1, 0, i) for i in pre_release.split(".")
+    )
+    return major, minor, patch, 0, identifiers
+
+
+class S3KeyIndex(object):
+    """
+    index of semver S3 keys by prefix, which keeps the key with the highest
+    precedence for each prefix.
+    """
+
+    def __init__(self, s3_keys: list[str] = ()):
+        self._keys = {}
+        self._precedences = {}
+        self._prefix_lengths = []
+        for s3_key in s3_keys:
+            self.add(s3_key)
+
+    def add(self, s3_key: str) -> bool:
+        """
+        adds `s3_key` to the index, if it has a higher precedence than the key already
+        indexed for its prefix. Returns True if the key was added.
+        """
+        match = _s3_key_semver_pattern.match(s3_key)
+        if not match:
+            raise ValueError(f"{s3_key} is not a semver S3Key")
+
+        prefix = match.group("prefix")
+        precedence = semver_precedence(match)
+        current = self._precedences.get(prefix)
+        if current is not None:
+            if precedence < current:
+                return False
+            if precedence == current:
+                if s3_key != self._keys[prefix]:
+                    sys.stderr.write(
+                        f"WARN: ignoring {s3_key}, as it has the same precedence as {self._keys[prefix]}\n"
+                    )
+                return False
+
+        self._keys[prefix] = s3_key
+        self._precedences[prefix] = precedence
+        if len(prefix) not in self._prefix_lengths:
+            self._prefix_lengths.append(len(prefix))
+            self._prefix_lengths.sort(reverse=True)
+        return True
+
+    def get(self, prefix: str) -> Optional[str]:
+        return self._keys.get(prefix)
+
+    def values(self):
+        return self._keys.values()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, s3_key: str) -> Optional[str]:
+        """
+        returns the indexed key for the longest indexed prefix of `s3_key` which is followed
+        by a semver. Only the suffix after a known prefix is matched against the semver
+        pattern, so keys without an indexed prefix are rejected by a dictionary lookup.
+        """
+        for length in self._prefix_lengths:
+            replacement = self._keys.get(s3_key[:length])
+            if replacement and _semver_zip_pattern.fullmatch(s3_key, length):
+                return replacement
+        return None
+
+
+class S3CodeLocation(object):
+    """
+    the S3 location of the code of a Lambda function or layer in a template. It
+    supports the S3Bucket/S3Key/S3ObjectVersion properties of the AWS::Lambda resources,
+    and both the s3:// uri and Bucket/Key/Version forms of the AWS::Serverless resources.
+    """
+
+    def __init__(
+        self,
+        resource_name: str,
+        resource_type: str,
+        properties: dict,
+        property_name: str,
+        fields: tuple[str, str, str],
+    ):
+        self.resource_name = resource_name
+        self.resource_type = resource_type
+        self.properties = properties
+        self.property_name = property_name
+        self.bucket_field, self.key_field, self.version_field = fields
+
+    @property
+    def is_uri(self) -> bool:
+        return isinstance(self.properties.get(self.property_name), str)
+
+    def _split_uri(self) -> tuple[str, str]:
+        uri = self.properties[self.property_name]
+        if not uri.startswith("s3://") or "/" not in uri[5:]:
+            return "", ""
+        bucket, key = uri[5:].split("/", 1)
+        return bucket, key
+
+    @property
+    def bucket(self):
+        if self.is_uri:
+            return self._split_uri()[0]
+        return self.properties[self.property_name].get(self.bucket_field)
+
+    @property
+    def key(self) -> str:
+        if self.is_uri:
+            return self._split_uri()[1]
+        key = self.properties[self.property_name].get(self.key_field)
+        return key if isinstance(key, str) else ""
+
+    @key.setter
+    def key(self, key: str):
+        if self.is_uri:
+            self.properties[self.property_name] = f"s3://{self.bucket}/{key}"
+        else:
+            self.properties[self.property_name][self.key_field] = key
+
+    @property
+    def has_version(self) -> bool:
+        return not self.is_uri and self.version_field in self.properties[self.property_name]
+
+    @property
+    def version(self):
+        return None if self.is_uri else self.properties[self.property_name].get(self.version_field)
+
+    @version.setter
+    def version(self, version: str):
+        self.properties[self.property_name][self.version_field] = version
+
+
+_code_location_properties = {
+    "AWS::Lambda::Function": ("Code", ("S3Bucket", "S3Key", "S3ObjectVersion")),
+    "AWS::Lambda::LayerVersion": ("Content", ("S3Bucket", "S3Key", "S3ObjectVersion")),
+    "AWS::Serverless::Function": ("CodeUri", ("Bucket", "Key", "Version")),
+    "AWS::Serverless::LayerVersion": ("ContentUri", ("Bucket", "Key", "Version")),
+}
 
 
 class LambdaS3KeyUpdater(CfnUpdater):
@@ -44,13 +212,27 @@ class LambdaS3KeyUpdater(CfnUpdater):
             S3Key: lambdas/iam-sudo-0.3.1.zip
               ...
 
+        The Content of an AWS::Lambda::LayerVersion, and the CodeUri and ContentUri of
+        AWS::Serverless::Function and AWS::Serverless::LayerVersion are updated too. If the
+        location has an S3ObjectVersion, it is set to the latest version of the new key. When
+        no version of the new key is found, the location is left unchanged.
+
         The environment variable AWS_CFN_UPDATE_LAMBDA_S3_KEYS can be used to specify a
         whitespace separated list of S3 keys to update.
+
+        With --resolve-from-s3, the latest version of each S3Key is looked up by listing
+        the objects in the S3Bucket starting with the prefix of the key. The listings are
+        cached for --cache-max-age seconds.
     """
 
     def __init__(self):
         super().__init__()
-        self._s3_keys = {}
+        self._s3_keys = S3KeyIndex()
+        self._resolved_s3_keys = {}
+        self._object_versions = {}
+        self._s3 = None
+        self.cache_max_age = 300
+        self.max_workers = 8
 
     @property
     def s3_keys(self) -> list[str]:
@@ -61,39 +243,265 @@ class LambdaS3KeyUpdater(CfnUpdater):
 
     @s3_keys.setter
     def s3_keys(self, s3_keys: list[str]):
-        self._s3_keys = {}
-        for s3_key in s3_keys:
-            match = _s3_key_semver_pattern.match(s3_key)
-            if not match:
-                raise ValueError(f"{s3_key} is not a semver S3Key")
-            self._s3_keys[match.group(1)] = s3_key
+        self._s3_keys = S3KeyIndex(s3_keys)
 
-    def update_template(self):
+    @property
+    def s3(self):
+        if not self._s3:
+            self._s3 = boto3.client("s3")
+        return self._s3
+
+    @s3.setter
+    def s3(self, client):
+        self._s3 = client
+
+    def resolved_s3_key(self, bucket: str, prefix: str) -> Optional[str]:
         """
-        updates the S3Key property of a AWS::Lambda::Function definition.
+        returns the latest S3 key with `prefix` found in `bucket` by `resolve_from_s3()`.
+        """
+        return self._resolved_s3_keys.get((bucket, prefix))
 
+    def code_locations(self):
+        """
+        yields the S3 code location of all Lambda functions and layers in `self.template`.
         """
         for resource_name, resource in self.template.get("Resources", {}).items():
-            if resource and resource["Type"] == "AWS::Lambda::Function":
-                code = resource.get("Properties", {}).get("Code", {})
-                s3_key = code.get("S3Key")
-                if not s3_key:
-                    return
-
-                match = _s3_key_semver_pattern.match(s3_key)
-                if match and (replacement := self.s3_key_by_prefix(match.group(1))):
-                    if replacement != s3_key:
-                        sys.stderr.write(
-                            "INFO: updating S3Key of Lambda function {} in {}\n".format(
-                                resource_name, self.filename
-                            )
+            if not isinstance(resource, dict):
+                continue
+            resource_type = resource.get("Type")
+            if resource_type not in _code_location_properties:
+                continue
+            properties = resource.get("Properties") or {}
+            property_name, fields = _code_location_properties[resource_type]
+            if isinstance(properties.get(property_name), (str, dict)):
+                location = S3CodeLocation(
+                    resource_name, resource_type, properties, property_name, fields
+                )
+                if location.key:
+                    yield location
+
+    def _list_object_keys(self, s3, bucket: str, prefix: str) -> list[str]:
+        """
+        returns all object keys in `bucket` starting with `prefix`, listed with the
+        client `s3`.
+        """
+        result = []
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            result.extend(map(lambda o: o["Key"], page.get("Contents", [])))
+        return result
+
+    def _list_semver_keys(self, s3, bucket: str, prefix: str) -> list[str]:
+        """
+        returns all semver object keys in `bucket` with exactly the prefix `prefix`.
+        """
+        return list(
+            filter(
+                lambda k: (m := _s3_key_semver_pattern.match(k)) and m.group("prefix") == prefix,
+                self._list_object_keys(s3, bucket, prefix),
+            )
+        )
+
+    def _list_latest_object_versions(self, s3, bucket: str, prefix: str) -> dict[str, str]:
+        """
+        returns the version id of the latest version of all objects in `bucket` starting
+        with `prefix`, listed with the client `s3`.
+        """
+        result = {}
+        paginator = s3.get_paginator("list_object_versions")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for version in page.get("Versions", []):
+                if version.get("IsLatest"):
+                    result[version["Key"]] = version["VersionId"]
+        return result
+
+    def _list_concurrently(self, list_function, locations: list[tuple[str, str]]) -> dict:
+        """
+        calls `list_function(s3, bucket, prefix)` for all `locations` concurrently, and
+        returns the results by location. The S3 client is created once, before the
+        calls are submitted, as creating clients is not thread-safe.
+        """
+        result = {}
+        s3 = self.s3
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(list_function, s3, bucket, prefix): (bucket, prefix)
+                for bucket, prefix in locations
+            }
+            for future in as_completed(futures):
+                bucket, prefix = futures[future]
+                try:
+                    result[(bucket, prefix)] = future.result()
+                except (BotoCoreError, ClientError) as error:
+                    sys.stderr.write(
+                        f"ERROR: failed to list s3://{bucket}/{prefix}, {error}\n"
+                    )
+                    raise SystemExit(1)
+        return result
+
+    def s3_key_locations(self, path) -> set[tuple[str, str]]:
+        """
+        returns the (bucket, prefix) of all semver S3Keys of Lambda functions and layers
+        in `path`. Buckets which are not a literal string are skipped.
+        """
+        result = set()
+        for _ in self.templates(path):
+            for location in self.code_locations():
+                match = _s3_key_semver_pattern.match(location.key)
+                if not match:
+                    continue
+                if isinstance(location.bucket, str):
+                    result.add((location.bucket, match.group("prefix")))
+                elif self.verbose:
+                    sys.stderr.write(
+                        "INFO: skipping S3Bucket of {} in {}, as it is not a string\n".format(
+                            location.resource_name, self.filename
                         )
+                    )
+        return result
+
+    def resolve_from_s3(self, path):
+        """
+        resolves the latest S3 key of each Lambda code location in `path`, by listing the
+        objects of every (bucket, prefix) concurrently. Listings younger than
+        `cache_max_age` seconds are read from the cache.
+        """
+        now = time.time()
+        cache = load_cache("s3-listings")
+        listings = {}
+        to_list = []
+        for bucket, prefix in sorted(self.s3_key_locations(path)):
+            entry = cache.get(f"s3://{bucket}/{prefix}")
+            if entry and now - entry.get("listed_at", 0) < self.cache_max_age:
+                listings[(bucket, prefix)] = entry.get("keys", [])
+            else:
+                to_list.append((bucket, prefix))
+
+        if to_list:
+            for (bucket, prefix), keys in self._list_concurrently(
+                self._list_semver_keys, to_list
+            ).items():
+                listings[(bucket, prefix)] = keys
+                cache[f"s3://{bucket}/{prefix}"] = {"listed_at": now, "keys": keys}
+            save_cache("s3-listings", cache)
+
+        self._resolved_s3_keys = {}
+        for (bucket, prefix), keys in listings.items():
+            if not keys:
+                sys.stderr.write(f"WARN: no S3 keys found in s3://{bucket}/{prefix}\n")
+                continue
+            latest = max(
+                keys, key=lambda k: (semver_precedence(_s3_key_semver_pattern.match(k)), k)
+            )
+            self._resolved_s3_keys[(bucket, prefix)] = latest
+            if self.verbose:
+                sys.stderr.write(f"INFO: resolved s3://{bucket}/{prefix} to {latest}\n")
+
+    def object_versions(self, objects: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        """
+        returns the latest version id of each (bucket, key) in `objects`. Objects are
+        looked up in batches, with a single listing of the object versions for all keys
+        sharing a bucket and semver prefix. Versions are kept for the duration of the run
+        and cached for `cache_max_age` seconds.
+        """
+        now = time.time()
+        missing = set(filter(lambda o: o not in self._object_versions, objects))
+        if missing:
+            cache = load_cache("s3-object-versions")
+            to_list = set()
+            for bucket, key in missing:
+                match = _s3_key_semver_pattern.match(key)
+                prefix = match.group("prefix") if match else key
+                entry = cache.get(f"s3://{bucket}/{prefix}", {})
+                versions = entry.get("versions", {})
+                if key in versions and now - entry.get("listed_at", 0) < self.cache_max_age:
+                    self._object_versions[(bucket, key)] = versions[key]
+                else:
+                    to_list.add((bucket, prefix))
+
+            if to_list:
+                for (bucket, prefix), versions in self._list_concurrently(
+                    self._list_latest_object_versions, sorted(to_list)
+                ).items():
+                    for key, version in versions.items():
+                        self._object_versions[(bucket, key)] = version
+                    cache[f"s3://{bucket}/{prefix}"] = {
+                        "listed_at": now,
+                        "versions": versions,
+                    }
+                save_cache("s3-object-versions", cache)
+
+        return {o: self._object_versions[o] for o in objects if o in self._object_versions}
+
+    def replacement_s3_key(self, location: S3CodeLocation) -> Optional[str]:
+        replacement = self._s3_keys.lookup(location.key)
+        if (
+            not replacement
+            and self._resolved_s3_keys
+            and isinstance(location.bucket, str)
+            and (match := _s3_key_semver_pattern.match(location.key))
+        ):
+            replacement = self.resolved_s3_key(location.bucket, match.group("prefix"))
+        return replacement
+
+    def update_template(self):
+        """
+        updates the S3Key of all Lambda functions and layers in a single pass over the
+        resources. The object versions of the new keys are resolved in one batch.
+        """
+        updates = []
+        for location in self.code_locations():
+            replacement = self.replacement_s3_key(location)
+            if replacement and replacement != location.key:
+                updates.append((location, replacement))
+
+        versions = self.object_versions(
+            list(
+                {
+                    (location.bucket, replacement)
+                    for location, replacement in updates
+                    if location.has_version and isinstance(location.bucket, str)
+                }
+            )
+        )
+
+        for location, replacement in updates:
+            version = (
+                versions.get((location.bucket, replacement))
+                if isinstance(location.bucket, str)
+                else None
+            )
+            if location.has_version and not version:
+                sys.stderr.write(
+                    "WARN: no object version found for {}, leaving {} in {} unchanged\n".format(
+                        replacement, location.resource_name, self.filename
+                    )
+                )
+                continue
 
-                        code["S3Key"] = replacement
-                        self.dirty = True
+            sys.stderr.write(
+                "INFO: updating S3Key of {} {} in {}\n".format(
+                    location.resource_type, location.resource_name, self.filename
+                )
+            )
+            location.key = replacement
+            if location.has_version:
+                location.version = version
+            self.dirty = True
 
-    def main(self, s3_keys: list[str], paths, dry_run, verbose):
+    def main(
+        self,
+        s3_keys: list[str],
+        paths,
+        dry_run,
+        verbose,
+        resolve_from_s3=False,
+        cache_max_age=300,
+    ):
         self.s3_keys = s3_keys
         self.dry_run = dry_run
         self.verbose = verbose
+        self.cache_max_age = cache_max_age
+        if resolve_from_s3:
+            self.resolve_from_s3(paths)
         self.update(paths)
@@ -12,7 +12,6 @@
 #   limitations under the License.
 #
 #   Copyright 2018 binx.io B.V.
-import copy
 import fnmatch
 import re
 from collections import OrderedDict
@@ -21,7 +20,8 @@ import boto3
 import sys
 
 from .cfn_updater import CfnUpdater
-from .replace_references import replace_references
+from .nodes import copy_node
+from .replace_references import referenced_names, replace_references
 
 
 def split_resource_name(resource_name):
@@ -277,17 +277,20 @@ class AMIUpdater(CfnUpdater):
         for ami_resources in self.custom_ami_resources_partitions():
             resource_name = self.latest_custom_ami_resource(ami_resources)
             if resource_name is not None:
-                ami = copy.deepcopy(self.resources[resource_name])
+                ami = copy_node(self.resources[resource_name])
                 self.load_latest_ami_name_pattern(ami)
                 if self.ami_requires_update(ami):
                     new_resource_name = make_new_resource_name(resource_name)
                     self.resources[new_resource_name] = ami
                     self.update_ami(new_resource_name, ami)
-                    for old_resource_name in reversed(ami_resources):
-                        if replace_references(
-                            self.template, old_resource_name, new_resource_name
-                        ):
-                            break
+                    referenced = referenced_names(self.template)
+                    old_resource_name = next(
+                        filter(lambda n: n in referenced, reversed(ami_resources)), None
+                    )
+                    if old_resource_name:
+                        replace_references(
+                            self.template, {old_resource_name: new_resource_name}
+                        )
 
     def update_template(self):
         if self.add_new_version:
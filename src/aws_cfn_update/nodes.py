@@ -0,0 +1,197 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+import copy
+from hashlib import blake2b
+
+from ruamel.yaml.comments import (
+    Anchor,
+    Comment,
+    CommentedMap,
+    CommentedSeq,
+    Format,
+    LineCol,
+    TaggedScalar,
+    Tag,
+    merge_attrib,
+)
+from ruamel.yaml.compat import ordereddict
+
+
+def node_tag(node) -> bytes:
+    tag = getattr(node, "tag", None)
+    value = getattr(tag, "value", None) if tag is not None else None
+    return value.encode("utf-8") if isinstance(value, str) else b""
+
+
+def long_form(node):
+    """
+    returns the long form of the short form intrinsic function `node`, like `!Sub x`
+    for `{"Fn::Sub": x}`, or None if `node` is not a short form intrinsic function.
+    The value is returned without the tag.
+    """
+    tag = node_tag(node).decode("utf-8")
+    if not tag.startswith("!") or tag.startswith("!!"):
+        return None
+    name = tag[1:]
+    key = name if name in ("Ref", "Condition") else f"Fn::{name}"
+    if isinstance(node, TaggedScalar):
+        value = node.value
+    elif isinstance(node, dict):
+        value = dict(node)
+    elif isinstance(node, list):
+        value = list(node)
+    else:
+        return None
+    return {key: value}
+
+
+def structural_hash(node) -> bytes:
+    """
+    returns a digest of the structure and values of `node`, which may consist of
+    ruamel and plain dictionaries, lists and scalars. Comments, key order, quoting
+    and scalar styles do not influence the digest, and keys are compared as strings,
+    as CloudFormation does. Short form intrinsic functions, like `!Sub x`, have the
+    digest of their long form, like `{"Fn::Sub": x}`, and `Fn::GetAtt: A.B` that
+    of `Fn::GetAtt: [A, B]`, so that JSON and YAML templates compare equal.
+    """
+    intrinsic = long_form(node)
+    if intrinsic is not None:
+        return structural_hash(intrinsic)
+
+    if isinstance(node, dict) and len(node) == 1 and isinstance(node.get("Fn::GetAtt"), str):
+        name, _, attribute = node["Fn::GetAtt"].partition(".")
+        return structural_hash({"Fn::GetAtt": [name, attribute]})
+
+    if isinstance(node, dict):
+        digest = blake2b(b"m" + node_tag(node), digest_size=16)
+        for pair in sorted(
+            structural_hash(str(k)) + structural_hash(v) for k, v in node.items()
+        ):
+            digest.update(pair)
+        return digest.digest()
+
+    if isinstance(node, (list, tuple)):
+        digest = blake2b(b"s" + node_tag(node), digest_size=16)
+        for value in node:
+            digest.update(structural_hash(value))
+        return digest.digest()
+
+    if isinstance(node, TaggedScalar):
+        value = b"t" + node_tag(node) + b":" + str(node.value).encode("utf-8")
+    elif isinstance(node, bool):
+        value = b"b1" if node else b"b0"
+    elif isinstance(node, int):
+        value = b"i" + str(int(node)).encode("ascii")
+    elif isinstance(node, float):
+        value = b"f" + repr(float(node)).encode("ascii")
+    elif isinstance(node, str):
+        value = b"u" + str(node).encode("utf-8")
+    elif node is None:
+        value = b"n"
+    else:
+        value = b"o" + repr(node).encode("utf-8")
+    return blake2b(value, digest_size=16).digest()
+
+
+def _copy_comment(comment: Comment) -> Comment:
+    result = copy.copy(comment)
+    result._items = {
+        k: list(v) if isinstance(v, list) else v for k, v in comment._items.items()
+    }
+    if isinstance(comment.comment, list):
+        result.comment = list(comment.comment)
+    return result
+
+
+def _copy_attributes(node, result, memo: dict):
+    """
+    copies the yaml attributes of `node` to `result`: the comments, the formatting,
+    the position, the anchor, the tag and the merged mappings.
+    """
+    if hasattr(node, Comment.attrib):
+        setattr(result, Comment.attrib, _copy_comment(getattr(node, Comment.attrib)))
+    for attribute in [Format.attrib, LineCol.attrib, Anchor.attrib]:
+        if hasattr(node, attribute):
+            setattr(result, attribute, copy.copy(getattr(node, attribute)))
+    if hasattr(node, Tag.attrib):
+        setattr(result, Tag.attrib, getattr(node, Tag.attrib))
+    if hasattr(node, merge_attrib):
+        setattr(result, merge_attrib, _copy_merge(getattr(node, merge_attrib), result, memo))
+
+
+def _copy_merge(merge, result, memo: dict):
+    """
+    returns a copy of the mappings merged into `result` with `<<`. Depending on the
+    ruamel version, these are a list of (position, mapping) or a MergeValue.
+    """
+    merged = copy.copy(merge)
+    values = merge.value if hasattr(merge, "value") else merge
+    values = [
+        (v[0], copy_node(v[1], memo)) if isinstance(v, tuple) else copy_node(v, memo)
+        for v in values
+    ]
+    for value in values:
+        mapping = value[1] if isinstance(value, tuple) else value
+        if hasattr(mapping, "add_referent"):
+            mapping.add_referent(result)
+    if hasattr(merge, "value"):
+        merged.value = values
+        if getattr(merge, "sequence", None) is not None:
+            merged.sequence = copy_node(merge.sequence, memo)
+        return merged
+    return values
+
+
+def copy_node(node, memo: dict = None):
+    """
+    returns a deep copy of `node`, which may consist of ruamel and plain dictionaries,
+    lists and scalars. The tags, comments, anchors and formatting of ruamel nodes are
+    preserved, and nodes which occur more than once (aliases) are copied once.
+    Immutable scalars, including the ruamel scalar strings, are shared.
+    """
+    if not isinstance(node, (dict, list, TaggedScalar)):
+        return node
+
+    if memo is None:
+        memo = {}
+    elif id(node) in memo:
+        return memo[id(node)]
+
+    if isinstance(node, CommentedMap):
+        result = node.__class__()
+        memo[id(node)] = result
+        for key, value in node._items():
+            ordereddict.__setitem__(result, key, copy_node(value, memo))
+        result._ok.update(node._ok)
+        _copy_attributes(node, result, memo)
+    elif isinstance(node, CommentedSeq):
+        result = node.__class__()
+        memo[id(node)] = result
+        result.extend(copy_node(value, memo) for value in node)
+        _copy_attributes(node, result, memo)
+    elif isinstance(node, TaggedScalar):
+        result = TaggedScalar(node.value, node.style)
+        memo[id(node)] = result
+        _copy_attributes(node, result, memo)
+    elif isinstance(node, dict):
+        result = node.__class__()
+        memo[id(node)] = result
+        for key, value in node.items():
+            result[key] = copy_node(value, memo)
+    else:
+        result = node.__class__()
+        memo[id(node)] = result
+        result.extend(copy_node(value, memo) for value in node)
+    return result
@@ -13,18 +13,327 @@
 #
 #   Copyright 2018 binx.io B.V.
 import binascii
+import os
+import socket
 import ssl
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from urllib.parse import urlparse
 
 import click
 import requests
+from requests.adapters import HTTPAdapter
 from cryptography import x509
+from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import Encoding, pkcs7
+from cryptography.x509.oid import AuthorityInformationAccessOID
 from ruamel.yaml import CommentedSeq
+from aws_cfn_update.cache import load_cache, save_cache
 from aws_cfn_update.cfn_updater import CfnUpdater
 
+_default_timeout = (5.0, 30.0)
+
+# the cache of the JWKS hosts and the fingerprints of their top intermediate CA. Version 1,
+# named oidc-certificates, held the fingerprints of the leaf certificates.
+_cache_name = "oidc-certificates-v2"
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    """
+    returns a requests session with a connection pool of `pool_size` connections per host.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_jwks_host(
+    url: str, session: requests.Session = None, timeout=_default_timeout
+) -> tuple[str, int]:
+    """
+    returns the host and port of the jwks_uri in the openid configuration of `url`.
+    """
+    wks = f"{url}/.well-known/openid-configuration"
+    response = (session if session else requests).get(
+        wks, headers={"Accept": "application/json"}, timeout=timeout
+    )
+    if response.status_code != 200:
+        raise ValueError(
+            "expected 200 from %s, got %d, %s",
+            url,
+            response.status_code,
+            response.text,
+        )
+
+    configuration = response.json()
+    if "jwks_uri" not in configuration:
+        raise ValueError("%s did not return a proper openid configuration", wks)
+
+    jwks_uri = urlparse(configuration["jwks_uri"])
+    return jwks_uri.hostname, jwks_uri.port if jwks_uri.port else 443
+
+
+@lru_cache(maxsize=1024)
+def parse_certificate(der: bytes) -> x509.Certificate:
+    """
+    returns the certificate from its DER encoding. Certificates shared by many
+    chains, like intermediate CAs, are parsed only once.
+    """
+    return x509.load_der_x509_certificate(der, default_backend())
+
+
+@lru_cache(maxsize=1024)
+def _is_issued_by(certificate: bytes, issuer: bytes) -> bool:
+    try:
+        parse_certificate(certificate).verify_directly_issued_by(
+            parse_certificate(issuer)
+        )
+        return True
+    except (ValueError, TypeError, InvalidSignature):
+        return False
+
+
+def is_issued_by(certificate: x509.Certificate, issuer: x509.Certificate) -> bool:
+    """
+    returns true if `certificate` is signed by `issuer`. The result is cached, so that a
+    signature is verified only once for all chains sharing an issuer.
+    """
+    if certificate.issuer != issuer.subject:
+        return False
+    return _is_issued_by(
+        certificate.public_bytes(Encoding.DER), issuer.public_bytes(Encoding.DER)
+    )
+
+
+def is_self_signed(certificate: x509.Certificate) -> bool:
+    return is_issued_by(certificate, certificate)
+
+
+def walk_chain(
+    leaf: x509.Certificate, candidates: list[x509.Certificate]
+) -> list[x509.Certificate]:
+    """
+    returns the chain from `leaf` up to the root, following the issuers found in
+    `candidates`. The candidates may be in any order. The walk stops at a self-signed
+    certificate, or when no issuer is found.
+    """
+    result = [leaf]
+    certificate = leaf
+    while not is_self_signed(certificate):
+        issuer = next(
+            filter(
+                lambda c: c not in result and is_issued_by(certificate, c), candidates
+            ),
+            None,
+        )
+        if not issuer:
+            break
+        result.append(issuer)
+        certificate = issuer
+    return result
+
+
+def thumbprint_certificate(chain: list[x509.Certificate]) -> x509.Certificate:
+    """
+    returns the certificate of which AWS expects the thumbprint: the top intermediate
+    CA of the chain. If the chain has no intermediate CA, the leaf certificate is
+    returned.
+    """
+    certificates = list(filter(lambda c: not is_self_signed(c), chain))
+    return certificates[-1] if certificates else chain[0]
+
+
+def download_certificates(url: str, timeout=_default_timeout) -> list[x509.Certificate]:
+    """
+    returns the certificates published at the caIssuers `url`, which are DER, PEM
+    or PKCS#7 encoded.
+    """
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    content = response.content
+    for load in [
+        lambda c: [x509.load_der_x509_certificate(c)],
+        lambda c: x509.load_pem_x509_certificates(c),
+        pkcs7.load_der_pkcs7_certificates,
+        pkcs7.load_pem_pkcs7_certificates,
+    ]:
+        try:
+            return load(content)
+        except ValueError:
+            continue
+    raise ValueError(f"no certificates found at {url}")
+
+
+def download_issuers(
+    leaf: x509.Certificate, timeout=_default_timeout
+) -> list[x509.Certificate]:
+    """
+    returns the issuers of `leaf`, downloaded from the caIssuers urls in the Authority
+    Information Access extension of each certificate in the chain.
+    """
+    result = []
+    certificate = leaf
+    while not is_self_signed(certificate) and len(result) < 10:
+        try:
+            access = certificate.extensions.get_extension_for_class(
+                x509.AuthorityInformationAccess
+            ).value
+        except x509.ExtensionNotFound:
+            break
+        urls = [
+            d.access_location.value
+            for d in access
+            if d.access_method == AuthorityInformationAccessOID.CA_ISSUERS
+        ]
+        if not urls:
+            break
+        try:
+            candidates = download_certificates(urls[0], timeout)
+        except (requests.RequestException, ValueError) as error:
+            sys.stderr.write(f"WARN: failed to download issuer from {urls[0]}, {error}\n")
+            break
+        issuer = next(filter(lambda c: is_issued_by(certificate, c), candidates), None)
+        if not issuer:
+            break
+        result.append(issuer)
+        certificate = issuer
+    return result
+
+
+def _peer_chain(sock: ssl.SSLSocket, timeout=_default_timeout) -> list[x509.Certificate]:
+    """
+    returns the certificates presented by the peer of `sock`, starting with the leaf.
+
+    The chain is read with SSLSocket.get_unverified_chain(), which was added in Python 3.13.
+    On older versions, only the leaf certificate is available, and its issuers are
+    downloaded from the caIssuers urls in the certificates instead.
+    """
+    if hasattr(sock, "get_unverified_chain"):
+        return list(map(parse_certificate, sock.get_unverified_chain()))
+    leaf = parse_certificate(sock.getpeercert(True))
+    return [leaf] + download_issuers(leaf, timeout)
+
+
+def get_certificate_chain(
+    host: str, port: int = 443, timeout=_default_timeout
+) -> list[x509.Certificate]:
+    """
+    returns the certificate chain presented by `host` on `port`, walked from the
+    leaf certificate upwards.
+    """
+    conn = None
+    try:
+        conn = socket.create_connection((host, port), timeout=timeout[0])
+        conn.settimeout(timeout[1])
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        sock = context.wrap_socket(conn, server_hostname=host)
+        presented = _peer_chain(sock, timeout)
+        return walk_chain(presented[0], presented[1:])
+    finally:
+        if conn:
+            conn.close()
+
+
+def get_certificate(host: str, port: int = 443, timeout=_default_timeout):
+    """
+    returns the certificate presented by `host` on `port` of which the thumbprint is
+    required: the top intermediate CA.
+    """
+    return thumbprint_certificate(get_certificate_chain(host, port, timeout))
+
+
+class CertificateFingerprint(object):
+    """
+    the SHA1 fingerprint of a certificate, with the attributes reported when updating
+    a thumbprint list.
+    """
+
+    def __init__(
+        self, fingerprint: str, subject: str, issuer: str, not_valid_after_utc: datetime
+    ):
+        self.fingerprint = fingerprint
+        self.subject = subject
+        self.issuer = issuer
+        self.not_valid_after_utc = not_valid_after_utc
+
+    @staticmethod
+    def from_certificate(certificate: x509.Certificate) -> "CertificateFingerprint":
+        sha1 = certificate.fingerprint(hashes.SHA1())
+        return CertificateFingerprint(
+            binascii.hexlify(sha1).decode("ascii").lower(),
+            certificate.subject.rfc4514_string(),
+            certificate.issuer.rfc4514_string(),
+            certificate.not_valid_after_utc,
+        )
+
+    @staticmethod
+    def from_dict(d: dict) -> "CertificateFingerprint":
+        return CertificateFingerprint(
+            d["fingerprint"],
+            d["subject"],
+            d["issuer"],
+            datetime.fromisoformat(d["not_valid_after_utc"]),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "subject": self.subject,
+            "issuer": self.issuer,
+            "not_valid_after_utc": self.not_valid_after_utc.isoformat(),
+        }
+
+    def is_valid(self, margin: timedelta = timedelta(0)) -> bool:
+        """
+        returns true if the certificate is valid for at least `margin`.
+        """
+        return datetime.now(timezone.utc) + margin < self.not_valid_after_utc
+
+
+def is_host_name_match(certificate: x509.Certificate, host: str) -> bool:
+    """
+    returns true if `host` matches the subject alternative names, or the common name, of
+    `certificate`. A wildcard matches a single label.
+    """
+    try:
+        names = certificate.extensions.get_extension_for_class(
+            x509.SubjectAlternativeName
+        ).value.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        names = [
+            a.value
+            for a in certificate.subject.get_attributes_for_oid(
+                x509.oid.NameOID.COMMON_NAME
+            )
+        ]
+
+    host = host.lower()
+    for name in map(lambda n: n.lower(), names):
+        if name == host:
+            return True
+        if name.startswith("*.") and "." in host and host.split(".", 1)[1] == name[2:]:
+            return True
+    return False
+
+
+def load_pem_certificates(directory: str) -> list[x509.Certificate]:
+    """
+    returns all certificates in the .pem, .crt and .cer files in `directory`.
+    """
+    result = []
+    for filename in sorted(os.listdir(directory)):
+        if os.path.splitext(filename)[1] in (".pem", ".crt", ".cer"):
+            with open(os.path.join(directory, filename), "rb") as f:
+                result.extend(x509.load_pem_x509_certificates(f.read()))
+    return result
+
 
 class OIDCProviderThumbprintsUpdater(CfnUpdater):
     """
@@ -32,6 +341,18 @@ class OIDCProviderThumbprintsUpdater(CfnUpdater):
 
     By default, it updates the thumbprints of all OIDCProviders specified
     templates.
+
+    The certificates of all providers in the templates are retrieved
+    concurrently, once per JWKS host, before any template is updated.
+    The fingerprints are cached until --expiry-margin days before the
+    certificate expires. Specify --refresh to ignore the cache.
+
+    With --offline, no network connections are made: the certificates are
+    read from the PEM files in the specified directory and matched on
+    the JWKS host name.
+
+    As AWS requires, the thumbprint is taken from the top intermediate CA
+    certificate of the chain presented by the JWKS host.
     """
 
     def __init__(self):
@@ -40,6 +361,14 @@ class OIDCProviderThumbprintsUpdater(CfnUpdater):
         self.verbose = False
         self.dry_run = False
         self.append = False
+        self.timeout = _default_timeout
+        self.max_workers = 8
+        self.expiry_margin = timedelta(days=7)
+        self.refresh = False
+        self.offline = None
+        self._session = None
+        self._jwks_hosts = {}
+        self._certificates = {}
 
     def new_value(self, definition):
         if self.with_fn_sub:
@@ -81,49 +410,179 @@ class OIDCProviderThumbprintsUpdater(CfnUpdater):
     def all_matching_oidc_providers(self, resources):
         return filter(lambda n: self.is_matching_oidc_provider(resources[n]), resources)
 
-    def main(self, url, append, path, dry_run, verbose):
+    def main(
+        self,
+        url,
+        append,
+        path,
+        dry_run,
+        verbose,
+        timeout=_default_timeout,
+        expiry_margin=timedelta(days=7),
+        refresh=False,
+        offline=None,
+    ):
         self.dry_run = dry_run
         self.verbose = verbose
         self.url = url
         self.append = append
+        self.timeout = timeout
+        self.expiry_margin = expiry_margin
+        self.refresh = refresh
+        self.offline = offline
+        self.prefetch_certificates(path)
         self.update(path)
 
+    @property
+    def session(self) -> requests.Session:
+        if not self._session:
+            self._session = create_session(self.max_workers)
+        return self._session
+
     @staticmethod
     def get_public_key(url: str):
-        wks = f"{url}/.well-known/openid-configuration"
-        response = requests.get(wks, headers={"Accept": "application/json"})
-        if response.status_code != 200:
-            raise ValueError(
-                "expected 200 from %s, got %d, %s",
-                url,
-                response.status_code,
-                response.text,
+        host, port = get_jwks_host(url)
+        return get_certificate(host, port)
+
+    def provider_urls(self, path) -> set[str]:
+        """
+        returns the urls of all matching OIDC providers in the templates in `path`.
+        """
+        result = set()
+        for _ in self.templates(path):
+            resources = self.template.get("Resources", {})
+            for name in self.all_matching_oidc_providers(resources):
+                result.add(resources[name]["Properties"]["Url"])
+        return result
+
+    def load_cached_fingerprints(self, urls: list[str]):
+        """
+        loads the fingerprints of the JWKS hosts of `urls` from the cache, for certificates
+        which are still valid for `expiry_margin`.
+        """
+        cache = load_cache(_cache_name)
+        providers, hosts = cache.get("providers", {}), cache.get("hosts", {})
+        for url in urls:
+            if url not in providers:
+                continue
+            host = tuple(providers[url])
+            entry = hosts.get("{}:{}".format(*host))
+            if not entry:
+                continue
+            fingerprint = CertificateFingerprint.from_dict(entry)
+            if fingerprint.is_valid(self.expiry_margin):
+                self._jwks_hosts[url] = host
+                self._certificates[host] = fingerprint
+
+    def save_cached_fingerprints(self):
+        cache = load_cache(_cache_name)
+        providers = cache.setdefault("providers", {})
+        hosts = cache.setdefault("hosts", {})
+        for url, host in self._jwks_hosts.items():
+            providers[url] = list(host)
+        for host, fingerprint in self._certificates.items():
+            hosts["{}:{}".format(*host)] = fingerprint.to_dict()
+        save_cache(_cache_name, cache)
+
+    def load_offline_fingerprints(self, urls: list[str]):
+        """
+        loads the fingerprints of the JWKS hosts of `urls` from the PEM files in the
+        `offline` directory. The chain is walked from the certificate of the JWKS host
+        through the issuers in the PEM files. Without network access, the JWKS host is read from the cache,
+        or assumed to be the host of the provider url.
+        """
+        providers = load_cache(_cache_name).get("providers", {})
+        certificates = load_pem_certificates(self.offline)
+        for url in urls:
+            if url in providers:
+                host = tuple(providers[url])
+            else:
+                parsed = urlparse(url)
+                host = (parsed.hostname, parsed.port if parsed.port else 443)
+
+            leaf = next(
+                filter(lambda c: is_host_name_match(c, host[0]), certificates), None
             )
+            if not leaf:
+                sys.stderr.write(
+                    f"ERROR: no certificate for {host[0]} of {url} found in {self.offline}\n"
+                )
+                raise SystemExit(1)
+
+            certificate = thumbprint_certificate(walk_chain(leaf, certificates))
+            fingerprint = CertificateFingerprint.from_certificate(certificate)
+            if not fingerprint.is_valid(self.expiry_margin):
+                sys.stderr.write(
+                    f"WARN: certificate for {host[0]} in {self.offline} expires {fingerprint.not_valid_after_utc}\n"
+                )
+            self._jwks_hosts[url] = host
+            self._certificates[host] = fingerprint
+
+    def prefetch_certificates(self, path):
+        """
+        retrieves the certificates of all OIDC providers in `path` concurrently. The
+        openid configuration is read once per provider url, and the certificate is
+        retrieved once per JWKS host. Fingerprints are read from the cache, unless
+        `refresh` is set, or from the PEM files in the directory `offline`.
+        """
+        urls = sorted(self.provider_urls(path) - set(self._jwks_hosts))
+        if not urls:
+            return
 
-        configuration = response.json()
-        if "jwks_uri" not in configuration:
-            raise ValueError("%s did not return a proper openid configuration", wks)
+        if self.offline:
+            self.load_offline_fingerprints(urls)
+            return
 
-        jwks_uri = urlparse(configuration["jwks_uri"])
+        if not self.refresh:
+            self.load_cached_fingerprints(urls)
+            urls = list(filter(lambda u: u not in self._jwks_hosts, urls))
+            if not urls:
+                if self.verbose:
+                    sys.stderr.write("INFO: using cached OIDC provider certificates\n")
+                return
 
-        conn = None
         try:
-            conn = ssl.create_connection((jwks_uri.netloc, 443))
-            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-            sock = context.wrap_socket(conn, server_hostname=jwks_uri.netloc)
-            certificate = ssl.DER_cert_to_PEM_cert(sock.getpeercert(True))
-            return x509.load_pem_x509_certificate(
-                certificate.encode("ascii"), default_backend()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                hosts = executor.map(
+                    lambda u: get_jwks_host(u, self.session, self.timeout), urls
+                )
+                self._jwks_hosts.update(zip(urls, hosts))
+
+                missing = sorted(set(self._jwks_hosts.values()) - set(self._certificates))
+                certificates = executor.map(
+                    lambda h: get_certificate(h[0], h[1], self.timeout), missing
+                )
+                self._certificates.update(
+                    zip(missing, map(CertificateFingerprint.from_certificate, certificates))
+                )
+        except (requests.RequestException, OSError, ValueError) as error:
+            sys.stderr.write(f"ERROR: failed to retrieve OIDC provider certificate, {error}\n")
+            raise SystemExit(1)
+
+        if self.verbose:
+            sys.stderr.write(
+                f"INFO: retrieved {len(missing)} certificates for {len(urls)} OIDC providers\n"
+            )
+        self.save_cached_fingerprints()
+
+    def certificate_fingerprint(self, url: str) -> CertificateFingerprint:
+        """
+        returns the certificate fingerprint of the JWKS host of the OIDC provider `url`,
+        retrieving it if it was not prefetched.
+        """
+        if url not in self._jwks_hosts:
+            self._jwks_hosts[url] = get_jwks_host(url, self.session, self.timeout)
+        host = self._jwks_hosts[url]
+        if host not in self._certificates:
+            self._certificates[host] = CertificateFingerprint.from_certificate(
+                get_certificate(host[0], host[1], self.timeout)
             )
-        finally:
-            if conn:
-                conn.close()
+        return self._certificates[host]
 
     def update_thumbprints(self, name, provider):
         url = provider.get("Properties", {}).get("Url")
-        public_key = self.get_public_key(url)
-        sha1 = public_key.fingerprint(hashes.SHA1())
-        fingerprint = binascii.hexlify(sha1).decode("ascii").lower()
+        certificate = self.certificate_fingerprint(url)
+        fingerprint = certificate.fingerprint
 
         thumbprints = provider.get("Properties", {}).get(
             "ThumbprintList", CommentedSeq()
@@ -137,14 +596,12 @@ class OIDCProviderThumbprintsUpdater(CfnUpdater):
             return
 
         if self.verbose:
-            subject = public_key.subject.rfc4514_string()
-            issuer = public_key.issuer.rfc4514_string()
             sys.stderr.write(
-                f"INFO: updating fingerprint of {url} for OIDC provider {name}, {subject} issued by {issuer}\n"
+                f"INFO: updating fingerprint of {url} for OIDC provider {name}, {certificate.subject} issued by {certificate.issuer}\n"
             )
 
         sys.stderr.write(
-            f"INFO: updating fingerprint of {url}, for OIDC provider {name} to {fingerprint}, valid until {public_key.not_valid_after_utc}\n"
+            f"INFO: updating fingerprint of {url}, for OIDC provider {name} to {fingerprint}, valid until {certificate.not_valid_after_utc}\n"
         )
         self.dirty = True
 
@@ -156,7 +613,7 @@ class OIDCProviderThumbprintsUpdater(CfnUpdater):
 
         thumbprints.append(fingerprint)
         thumbprints.yaml_add_eol_comment(
-            f"valid until {public_key.not_valid_after_utc}", len(thumbprints) - 1
+            f"valid until {certificate.not_valid_after_utc}", len(thumbprints) - 1
         )
         provider["Properties"]["ThumbprintList"] = thumbprints
 
@@ -166,8 +623,65 @@ class OIDCProviderThumbprintsUpdater(CfnUpdater):
 )
 @click.option("--url", required=False, type=str, help="of the OIDC provider to update")
 @click.option("--append", required=False, is_flag=True, help="append the fingerprint")
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--connect-timeout",
+    type=float,
+    default=_default_timeout[0],
+    show_default=True,
+    help="seconds to wait for a connection to the OIDC provider",
+)
+@click.option(
+    "--read-timeout",
+    type=float,
+    default=_default_timeout[1],
+    show_default=True,
+    help="seconds to wait for a response of the OIDC provider",
+)
+@click.option(
+    "--expiry-margin",
+    type=int,
+    default=7,
+    show_default=True,
+    help="days before expiry of a certificate to stop using its cached fingerprint",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="ignore the cached fingerprints",
+)
+@click.option(
+    "--offline",
+    required=False,
+    type=click.Path(exists=True, file_okay=False),
+    help="directory with PEM certificates to use instead of the network",
+)
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
-def update_oidc_provider_thumbprint(ctx, url, append, path):
+def update_oidc_provider_thumbprint(
+    ctx,
+    url,
+    append,
+    connect_timeout,
+    read_timeout,
+    expiry_margin,
+    refresh,
+    offline,
+    path,
+):
     updater = OIDCProviderThumbprintsUpdater()
-    updater.main(url, append, list(path), ctx.obj["dry_run"], ctx.obj["verbose"])
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
+    updater.main(
+        url,
+        append,
+        list(path),
+        ctx.obj["dry_run"],
+        ctx.obj["verbose"],
+        (connect_timeout, read_timeout),
+        timedelta(days=expiry_margin),
+        refresh,
+        offline,
+    )
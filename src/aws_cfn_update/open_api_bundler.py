@@ -0,0 +1,213 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+import hashlib
+import os
+import sys
+import threading
+from typing import Optional
+from urllib.parse import unquote
+
+from ruamel.yaml import YAML
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+# the sections of a swagger 2.0 specification which can be referenced by name
+_swagger_sections = ["definitions", "parameters", "responses", "securityDefinitions"]
+
+# parsed fragments by absolute path, shared by all bundlers in this process
+_fragments = {}
+_fragments_lock = threading.Lock()
+
+
+def load_fragment(path: str) -> tuple:
+    """
+    returns the sha256 hex digest and the parsed content of the yaml or json file
+    `path`. The file is only parsed again when its modification time or size changed.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _fragments_lock:
+        cached = _fragments.get(path)
+    if cached and cached[0] == key:
+        return cached[1], cached[2]
+
+    with open(path, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    document = YAML().load(content)
+    with _fragments_lock:
+        _fragments[path] = (key, digest, document)
+    return digest, document
+
+
+def pointer_parts(pointer: str) -> list:
+    """
+    returns the unescaped reference tokens of the json pointer `pointer`.
+    """
+    if not pointer:
+        return []
+    return [
+        unquote(part).replace("~1", "/").replace("~0", "~")
+        for part in pointer.split("/")[1:]
+    ]
+
+
+def component_section(pointer: str) -> Optional[tuple]:
+    """
+    returns the section and name of the component `pointer` refers to, for
+    instance (("components", "schemas"), "Pet") for /components/schemas/Pet. Returns
+    None if the pointer does not refer to a named component.
+    """
+    parts = pointer_parts(pointer)
+    if len(parts) == 3 and parts[0] == "components":
+        return tuple(parts[:2]), parts[2]
+    if len(parts) == 2 and parts[0] in _swagger_sections:
+        return (parts[0],), parts[1]
+    return None
+
+
+class OpenAPIBundler:
+    """
+    bundles an open api specification which refers to other files with `$ref` into a
+    single document. References to named components in other files, like
+    `schemas.yaml#/components/schemas/Pet`, are hoisted into the same section of the
+    specification and referred to locally. All other references to other files are
+    inlined. Cyclic references which cannot be hoisted are reported as an error.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = os.path.abspath(filename)
+        self.files = {}
+        self._hoisted = {}
+        self._components = {}
+        self._reserved = {}
+        self._inlining = []
+
+    def load(self, path: str):
+        try:
+            digest, document = load_fragment(path)
+        except OSError as error:
+            sys.stderr.write(f"ERROR: failed to read {path}, {error}\n")
+            raise SystemExit(1)
+        self.files[path] = digest
+        return document
+
+    def resolve(self, path: str, pointer: str):
+        """
+        returns the node in the file `path` the json `pointer` refers to.
+        """
+        node = self.load(path)
+        try:
+            for part in pointer_parts(pointer):
+                node = node[int(part)] if isinstance(node, list) else node[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            sys.stderr.write(f"ERROR: $ref {path}#{pointer} does not exist\n")
+            raise SystemExit(1)
+        return node
+
+    def target(self, ref: str, base: str) -> tuple:
+        """
+        returns the absolute path and the json pointer of the `ref` in the file `base`.
+        """
+        filename, _, pointer = ref.partition("#")
+        if not filename:
+            return base, pointer
+        path = os.path.join(os.path.dirname(base), unquote(filename))
+        return os.path.normpath(path), pointer
+
+    def reserve(self, section: tuple, name: str) -> str:
+        """
+        returns a name for the component `name` in `section` which is not yet
+        in use by the specification or another hoisted component.
+        """
+        if section not in self._reserved:
+            node = self.load(self.filename)
+            for part in section:
+                node = node.get(part, {}) if isinstance(node, dict) else {}
+            self._reserved[section] = set(node.keys())
+
+        reserved = self._reserved[section]
+        result, i = name, 1
+        while result in reserved:
+            result, i = f"{name}{i}", i + 1
+        reserved.add(result)
+        return result
+
+    def reference(self, node: dict, base: str, path: str, pointer: str):
+        """
+        returns the bundled replacement of the `node` with a $ref to `pointer` in `path`.
+        """
+        siblings = [
+            (k, self.bundle_node(v, base)) for k, v in node.items() if k != "$ref"
+        ]
+        key = (path, pointer)
+
+        if key not in self._hoisted and (component := component_section(pointer)):
+            section, name = component
+            name = self.reserve(section, name)
+            self._hoisted[key] = "#/" + "/".join(
+                p.replace("~", "~0").replace("/", "~1") for p in section + (name,)
+            )
+            components = self._components.setdefault(section, {})
+            components[name] = None
+            components[name] = self.bundle_node(self.resolve(path, pointer), path)
+
+        if key in self._hoisted:
+            return CommentedMap([("$ref", self._hoisted[key])] + siblings)
+
+        if key in self._inlining:
+            cycle = " -> ".join(f"{p}#{f}" for p, f in self._inlining + [key])
+            sys.stderr.write(f"ERROR: cyclic $ref {cycle}\n")
+            raise SystemExit(1)
+
+        self._inlining.append(key)
+        try:
+            result = self.bundle_node(self.resolve(path, pointer), path)
+        finally:
+            self._inlining.pop()
+        if siblings and isinstance(result, dict):
+            result.update(siblings)
+        return result
+
+    def bundle_node(self, node, base: str):
+        """
+        returns a copy of `node` from the file `base`, with all references to other
+        files resolved.
+        """
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str) and "://" not in ref:
+                path, pointer = self.target(ref, base)
+                if path != self.filename:
+                    return self.reference(node, base, path, pointer)
+                node = CommentedMap(node.items())
+                node["$ref"] = "#" + pointer
+            return CommentedMap((k, self.bundle_node(v, base)) for k, v in node.items())
+        if isinstance(node, list):
+            return CommentedSeq(self.bundle_node(v, base) for v in node)
+        return node
+
+    def bundle(self):
+        """
+        returns the bundled specification.
+        """
+        result = self.bundle_node(self.load(self.filename), self.filename)
+        for section, components in self._components.items():
+            parent = result
+            for part in section:
+                if part not in parent:
+                    parent[part] = CommentedMap()
+                parent = parent[part]
+            parent.update(components)
+        return result
@@ -13,152 +13,247 @@
 #
 #   Copyright 2018 binx.io B.V.
 import fnmatch
-import re
-import copy
+import sys
+from collections import defaultdict, deque
+from typing import Iterator, List
+
 import click
-import json
-import boto3
-from typing import List
-from ruamel.yaml.comments import TaggedScalar, CommentedSeq
 
 from .cfn_updater import CfnUpdater
+from .intrinsics import iter_intrinsics
 
-import logging
+# the namespace of the names defined in each template section
+_namespaces = {
+    "Resources": "value",
+    "Parameters": "value",
+    "Conditions": "condition",
+    "Mappings": "mapping",
+}
 
 
-def is_reference(obj, fld, name):
-    if isinstance(obj, dict):
-        if fld == "Ref":
-            return obj["Ref"] == name
-        elif fld == "FN::GetAtt":
-            return len(obj[fld]) > 0 and obj[fld][0] == name
-        elif fld == "FN::Sub":
-            return isinstance(obj[fld], str) and references_in_sub(obj[fld], name)
+def references(obj) -> Iterator[tuple]:
+    """
+    generates a tuple ((namespace, name), via) for each reference in `obj`, where
+    namespace is "value" for a reference to a resource or parameter and "condition"
+    for a reference to a condition. `via` is the intrinsic function or attribute
+    which makes the reference.
+    """
+    for intrinsic in iter_intrinsics(obj):
+        yield (intrinsic.namespace, intrinsic.name), intrinsic.function
 
 
-def references_in_sub(sub, name):
-    return list(
-        filter(
-            lambda n: n == name,
-            map(lambda n: n.split(".")[0], re.findall(r"\${([^!][^}]*)}", sub)),
-        )
-    )
+class ReferenceIndex:
+    """
+    an index of the objects in the sections of a template, by the names they refer to.
+    """
 
+    def __init__(self, template: dict):
+        self.template = template
+        self.dependents = defaultdict(list)
+        for section, objects in template.items():
+            if not isinstance(objects, dict):
+                continue
+            for name, obj in objects.items():
+                for reference, via in set(references(obj)):
+                    self.dependents[reference].append((section, name, via))
 
-def is_tag_reference(obj, name):
-    if isinstance(obj, TaggedScalar):
-        if obj.tag.suffix == "Ref":
-            return str(obj.value) == name
-        elif obj.tag.suffix == "Sub":
-            return references_in_sub(obj.value, name)
-        elif obj.tag.suffix == "GetAtt":
-            return str(obj.value).split(".")[0] == name
-    elif isinstance(obj, CommentedSeq):
-        if obj.tag.suffix == "GetAtt":
-            return len(obj) > 1 and obj[0] == name
-    return False
+    def removal_set(self, victims: List[tuple]) -> dict:
+        """
+        returns the (section, name) of the `victims` and all objects which directly or
+        indirectly refer to them, in the order of discovery. The value is None for a
+        victim, and (via, section, name) of the referred object for a dependent.
 
+        A resource which only depends on a removed resource via DependsOn is not
+        removed, only its DependsOn entry, see prune_depends_on.
+        """
+        result = {}
+        queue = deque()
+        for victim in victims:
+            if victim not in result:
+                result[victim] = None
+                queue.append(victim)
 
-def remove_resource_from_template(template: dict, name: str):
-    resources: dict = template.get("Resources")
-    if resources and name in resources:
-        resources.pop(name)
-        remove_all_references(template, name)
-        return True
-    outputs: dict = template.get("Resources")
-    if outputs and name in outputs:
-        remove_all_references(template, name)
-        return True
-    return False
-
-    return False
-
-
-def remove_all_references(template, name):
-    to_remove = {}
-    for toplevel in template:
-        if isinstance(template[toplevel], dict):
-            to_remove[toplevel] = []
-
-    for toplevel in to_remove:
-        for obj in template[toplevel]:
-            if has_reference(template[toplevel][obj], name, []):
-                to_remove[toplevel].append(obj)
-    for toplevel in to_remove:
-        for obj in to_remove[toplevel]:
-            logging.info(
-                "Removing object %s from %s, as it references %s", obj, toplevel, name
+        while queue:
+            section, name = queue.popleft()
+            namespace = _namespaces.get(section)
+            if not namespace:
+                continue
+            for dependent in self.dependents.get((namespace, name), []):
+                if dependent[2] == "DependsOn":
+                    continue
+                key = dependent[:2]
+                if key not in result:
+                    result[key] = (dependent[2], section, name)
+                    queue.append(key)
+        return result
+
+
+def remove_objects(
+    template: dict, objects: dict, victims: dict = None, dry_run: bool = False
+):
+    """
+    removes the `objects` returned by ReferenceIndex.removal_set from the `template`,
+    and reports why each is removed. `victims` may hold the reason why a victim
+    was selected.
+    """
+    action = "would remove" if dry_run else "removing"
+    for (section, name), reason in objects.items():
+        if reason:
+            because = "it references {} via {}".format(reason[2], reason[0])
+        else:
+            because = (victims or {}).get((section, name))
+        sys.stderr.write(
+            "INFO: {} {} from {}{}\n".format(
+                action, name, section, f", as {because}" if because else ""
             )
-            template[toplevel].pop(obj)
+        )
+        template[section].pop(name, None)
 
+    prune_depends_on(
+        template,
+        {name for section, name in objects if section == "Resources"},
+        dry_run,
+    )
 
-def has_reference(obj, name, path):
-    result = False
-    if isinstance(obj, dict):
-        for fld in obj:
-            if is_reference(obj, fld, name):
-                logging.info("INFO: %s to %s found in %s", fld, name, ".".join(path))
-                result = True
-            else:
-                nested_path = path[:]
-                nested_path.append(fld)
-                result = result or has_reference(obj[fld], name, nested_path)
-    elif isinstance(obj, TaggedScalar):
-        if is_tag_reference(obj, name):
-            logging.info("INFO: %s to %s found in %s", obj.tag, name, ".".join(path))
-            result = True
-
-    elif isinstance(obj, CommentedSeq):
-        if is_tag_reference(obj, name):
-            logging.info("INFO: %s to %s found in %s", obj.tag, name, ".".join(path))
-            result = True
+
+def prune_depends_on(template: dict, removed: set, dry_run: bool = False):
+    """
+    removes the `removed` resources from the DependsOn of the remaining resources.
+    """
+    action = "would remove" if dry_run else "removing"
+    for name, resource in (template.get("Resources") or {}).items():
+        depends_on = resource.get("DependsOn") if isinstance(resource, dict) else None
+        if isinstance(depends_on, str):
+            pruned = [depends_on] if depends_on in removed else []
+        elif isinstance(depends_on, list):
+            pruned = [d for d in depends_on if d in removed]
         else:
-            for i in range(len(obj)):
-                nested_path = path[:]
-                nested_path.append("[%d]" % i)
-                if has_reference(obj[i], name, nested_path):
-                    logging.info(
-                        "INFO: %s too %s found in array %s",
-                        obj[i],
-                        name,
-                        ".".join(nested_path),
-                    )
-                    result = True
-
-    elif isinstance(obj, list):
-        for i in range(len(obj)):
-            nested_path = path[:]
-            nested_path.append("[%d]" % i)
-            if has_reference(obj[i], name, nested_path):
-                logging.info(
-                    "INFO: Ref:%s found in array %s", name, ".".join(nested_path)
-                )
-                result = True
+            continue
+        if not pruned:
+            continue
 
-    return result
+        for dependency in pruned:
+            sys.stderr.write(f"INFO: {action} {dependency} from the DependsOn of {name}\n")
+        if isinstance(depends_on, str) or len(pruned) == len(depends_on):
+            del resource["DependsOn"]
+        else:
+            for index in reversed(range(len(depends_on))):
+                if depends_on[index] in removed:
+                    del depends_on[index]
+
+
+def remove_resource_from_template(template: dict, name: str) -> bool:
+    """
+    removes the resource `name` from `template`, together with all objects which
+    directly or indirectly refer to it.
+    """
+    resources: dict = template.get("Resources")
+    if not resources or name not in resources:
+        return False
+    remove_objects(template, ReferenceIndex(template).removal_set([("Resources", name)]))
+    return True
 
 
 class ResourceRemover(CfnUpdater):
     """
     Removes the specified CloudFormation resource and all resources that reference it.
+
+    Resources, outputs and conditions which refer to a removed object, directly or
+    indirectly via Ref, Fn::GetAtt, Fn::Sub, Condition or Fn::If, are removed as
+    well. Removed resources are only removed from the DependsOn of other resources. The resources to remove are selected by --resource,
+    --resource-glob and --resource-type, which may all be repeated. With --dry-run,
+    it shows which objects would be removed and why.
     """
 
     def __init__(self):
         super(ResourceRemover, self).__init__()
-        self.resource_name = None
+        self.resource_names = []
+        self.resource_globs = []
+        self.resource_types = []
+
+    def victims(self) -> dict:
+        """
+        returns the (section, name) of the selected resources, with the reason of
+        their selection.
+        """
+        result = {}
+        for name, resource in self.resources.items():
+            resource_type = resource.get("Type") if isinstance(resource, dict) else None
+            if name in self.resource_names:
+                reason = "it is selected by --resource"
+            elif pattern := next(
+                filter(lambda p: fnmatch.fnmatchcase(name, p), self.resource_globs),
+                None,
+            ):
+                reason = f"it matches --resource-glob {pattern}"
+            elif isinstance(resource_type, str) and (
+                pattern := next(
+                    filter(
+                        lambda p: fnmatch.fnmatchcase(resource_type, p),
+                        self.resource_types,
+                    ),
+                    None,
+                )
+            ):
+                reason = f"it is of --resource-type {pattern}"
+            else:
+                continue
+            result[("Resources", name)] = reason
+        return result
 
     def update_template(self):
-        if remove_resource_from_template(self.template, self.resource_name):
-            self.dirty = True
+        victims = self.victims()
+        if not victims:
+            return
+
+        objects = ReferenceIndex(self.template).removal_set(list(victims))
+        if self.dry_run:
+            sys.stderr.write(
+                "INFO: plan to remove {} objects from {}\n".format(
+                    len(objects), self.filename
+                )
+            )
+        remove_objects(self.template, objects, victims, self.dry_run)
+        self.dirty = True
+
+    def main(self, resource_names, resource_globs, resource_types, dry_run, verbose, path):
+        self.dry_run = dry_run
+        self.verbose = verbose
+        self.resource_names = list(resource_names)
+        self.resource_globs = list(resource_globs)
+        self.resource_types = list(resource_types)
+        self.update(path)
 
 
 @click.command(name="remove-resource", help=ResourceRemover.__doc__)
-@click.option("--resource", required=True, help="to remove from the template")
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--resource", multiple=True, help="to remove from the template")
+@click.option(
+    "--resource-glob",
+    multiple=True,
+    help="pattern of the names of the resources to remove, like 'Legacy*'",
+)
+@click.option(
+    "--resource-type",
+    multiple=True,
+    help="of the resources to remove, like 'AWS::SNS::*'",
+)
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
-def remove_resource(ctx, resource, path):
+def remove_resource(ctx, resource, resource_glob, resource_type, path):
+    if not (resource or resource_glob or resource_type):
+        raise click.UsageError(
+            "specify at least one --resource, --resource-glob or --resource-type"
+        )
     updater = ResourceRemover()
-    updater.dry_run = ctx.obj["dry_run"]
-    updater.verbose = ctx.obj["verbose"]
-    updater.resource_name = resource
-    updater.update(path)
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
+    updater.main(
+        resource,
+        resource_glob,
+        resource_type,
+        ctx.obj["dry_run"],
+        ctx.obj["verbose"],
+        list(path),
+    )
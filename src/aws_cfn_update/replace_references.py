@@ -1,31 +1,38 @@
-from ruamel.yaml.comments import TaggedScalar
+from typing import Union
 
+from .intrinsics import iter_intrinsics
 
-def replace_references(template, old_reference, new_reference) -> bool:
+# the functions referring to a resource or parameter by name
+_renamed_functions = ("Ref", "Fn::GetAtt", "Fn::Sub", "DependsOn")
+
+
+def replace_references(
+    template, mapping: Union[dict, str], new_reference: str = None
+) -> list:
     """
-    replaces CloudFormation references { "Ref": old_reference } with { "Ref": new_reference } in `template`.
-    returns True if one or more references where made.
+    replaces the Ref, Fn::GetAtt, Fn::Sub and DependsOn references to the names in
+    `mapping` with the name they map to, in a single pass over `template`. For
+    compatibility, `mapping` may be a single old name followed by the new name.
+
+    returns the paths of the references which were replaced.
     """
-    result = False
-    if isinstance(template, dict):
-        for name, value in template.items():
-            if name == "Ref" and value == old_reference:
-                template["Ref"] = new_reference
-                result = True
-            elif (
-                isinstance(value, TaggedScalar)
-                and value.tag
-                and value.tag.suffix == "Ref"
-                and value.value == old_reference
-            ):
-                value.value = new_reference
-                result = True
-            else:
-                result = (
-                    replace_references(template[name], old_reference, new_reference)
-                    or result
-                )
-    elif isinstance(template, list):
-        for i, value in enumerate(template):
-            result = replace_references(value, old_reference, new_reference) or result
+    if isinstance(mapping, str):
+        mapping = {mapping: new_reference}
+
+    result, renamed = [], set()
+    for intrinsic in iter_intrinsics(template):
+        if intrinsic.function in _renamed_functions and intrinsic.name in mapping:
+            if intrinsic.holder not in renamed:
+                renamed.add(intrinsic.holder)
+                intrinsic.rename_all(mapping)
+                result.append(intrinsic.path)
     return result
+
+
+def referenced_names(template) -> set:
+    """
+    returns the names referred to by Ref, Fn::GetAtt, Fn::Sub and DependsOn in `template`.
+    """
+    return {
+        i.name for i in iter_intrinsics(template) if i.function in _renamed_functions
+    }
@@ -12,23 +12,43 @@
 #   limitations under the License.
 #
 #   Copyright 2018 binx.io B.V.
-import difflib
+import hashlib
+import os
 import re
 import sys
-from io import BytesIO
+from importlib.metadata import version
 from io import StringIO
 
 import jsonmerge
 from ruamel.yaml import YAML
 
+from aws_cfn_update.cache import load_cache, save_cache
 from aws_cfn_update.cfn_updater import CfnUpdater
+from aws_cfn_update.diff import line_diff, structural_diff_lines
+from aws_cfn_update.nodes import copy_node, structural_hash
+from aws_cfn_update.open_api_bundler import OpenAPIBundler
 from aws_cfn_update.replace_references import replace_references
 
+# the property holding the open api specification, by resource type
+_body_properties = {
+    "AWS::ApiGateway::RestApi": "Body",
+    "AWS::ApiGatewayV2::Api": "Body",
+    "AWS::Serverless::Api": "DefinitionBody",
+    "AWS::Serverless::HttpApi": "DefinitionBody",
+}
+
 
 class RestAPIBodyUpdater(CfnUpdater):
     """
     Updates the body of a REST API Resource, with an standard Open API
-    specification merged with AWS API Gateway extensions.
+    specification merged with AWS API Gateway extensions. It updates the
+    Body of an AWS::ApiGateway::RestApi or AWS::ApiGatewayV2::Api and the
+    DefinitionBody of an AWS::Serverless::Api or AWS::Serverless::HttpApi.
+    Specify --resource multiple times, to update multiple APIs.
+
+    A specification split over multiple files is bundled: named components
+    referred to with a `$ref` to another file are copied into the components
+    of the specification, and all other references to files are inlined.
 
     If you specify --add-new-version, it will create a new
     version of the resource and update all references
@@ -38,16 +58,17 @@ class RestAPIBodyUpdater(CfnUpdater):
     a value of 2 or higher. This might be handy if you have old clients
     still accessing the old version of the API.
 
-    If no changes are detected, no changes are made. Please make
-    sure that all dictionary keys in th specifications are strings,
-    not integers (especially the case with `responses`).
-    When updating json CFN templates, the compare algorithm does
-    not work properly.
+    If no changes are detected, no changes are made. The bodies are
+    compared by structure, ignoring comments, formatting and key order,
+    so this works for both yaml and json CFN templates. With --verbose,
+    the changed paths of the body are shown, or with --diff lines, the
+    changed lines.
     """
 
     def __init__(self):
         super(RestAPIBodyUpdater, self).__init__()
         self.resource_name = None
+        self.resource_names = []
         self.open_api_specification = None
         self.api_gateway_extensions = None
         self.template = None
@@ -56,15 +77,85 @@ class RestAPIBodyUpdater(CfnUpdater):
         self.dry_run = False
         self.keep = 1
         self.yaml = YAML()
+        self.merge_strategy = "jsonmerge-{}".format(version("jsonmerge"))
+        self.use_cache = True
+        self.diff = "structural"
+        self.max_diff_hunks = 50
         self._body = {}
 
+    def merged_body_cache_key(self, specification: bytes, extensions: bytes) -> str:
+        """
+        returns the key of the merged body of `specification` and `extensions`. The key
+        includes the real path of the specification, as its `$ref`s are relative to it.
+        """
+        digest = hashlib.sha256(self.merge_strategy.encode("utf-8"))
+        digest.update(os.path.realpath(self.open_api_specification).encode("utf-8"))
+        for content in [specification, extensions]:
+            digest.update(hashlib.sha256(content).digest())
+        return digest.hexdigest()
+
     def load_and_merge_swagger_body(self):
-        with open(self.open_api_specification, "r") as f:
-            body = self.yaml.load(f)
-        with open(self.api_gateway_extensions, "r") as f:
-            extensions = self.yaml.load(f)
+        """
+        merges the open api specification with the api gateway extensions. Files
+        referred to by `$ref` in the specification are bundled into it first.
+
+        The merged body is cached by the path and content of the specification, the
+        extensions and all referred files, so that repeated invocations with the same
+        input do not bundle and merge again. The body is cached as YAML text, and parsed
+        as data when it is read from the cache.
+        """
+        with open(self.open_api_specification, "rb") as f:
+            specification = f.read()
+        with open(self.api_gateway_extensions, "rb") as f:
+            extensions = f.read()
+
+        cache_name = "rest-api-body-{}".format(
+            self.merged_body_cache_key(specification, extensions)
+        )
+        cached = load_cache(cache_name) if self.use_cache else {}
+        if (
+            isinstance(cached.get("body"), str)
+            and isinstance(cached.get("dependencies"), dict)
+            and self.is_unchanged(cached["dependencies"])
+        ):
+            if self.verbose:
+                sys.stderr.write(
+                    f"INFO: using cached merge of {self.open_api_specification} and {self.api_gateway_extensions}\n"
+                )
+            self.body = self.yaml.load(cached["body"])
+            return
 
-        self.body = jsonmerge.merge(body, extensions)
+        bundler = OpenAPIBundler(self.open_api_specification)
+        body = jsonmerge.merge(bundler.bundle(), self.yaml.load(extensions))
+        if self.use_cache:
+            dependencies = {
+                path: digest
+                for path, digest in bundler.files.items()
+                if path != bundler.filename
+            }
+            # without line folding, which does not preserve repeated spaces in plain scalars
+            yaml = YAML()
+            yaml.width = sys.maxsize
+            content = StringIO()
+            yaml.dump(body, content)
+            save_cache(
+                cache_name, {"dependencies": dependencies, "body": content.getvalue()}
+            )
+        self.body = body
+
+    @staticmethod
+    def is_unchanged(dependencies: dict) -> bool:
+        """
+        returns True if the files in `dependencies` still have the recorded sha256 digest.
+        """
+        for path, digest in dependencies.items():
+            try:
+                with open(path, "rb") as f:
+                    if hashlib.sha256(f.read()).hexdigest() != digest:
+                        return False
+            except OSError:
+                return False
+        return True
 
     @property
     def body(self):
@@ -73,7 +164,11 @@ class RestAPIBodyUpdater(CfnUpdater):
     @body.setter
     def body(self, body):
         self._body = body
-        self.body_as_string = self.yaml_dump_to_str(self.body) if body else ""
+        self.body_hash = structural_hash(body) if body else None
+
+    @property
+    def body_as_string(self):
+        return self.yaml_dump_to_str(self.body) if self.body else ""
 
     def yaml_dump_to_str(self, dict):
         s = StringIO()
@@ -97,7 +192,7 @@ class RestAPIBodyUpdater(CfnUpdater):
             result = list(
                 filter(
                     lambda name: "Type" in resources[name]
-                    and resources[name]["Type"] == "AWS::ApiGateway::RestApi",
+                    and resources[name]["Type"] in _body_properties,
                     filter(lambda name: pattern.match(name), resources),
                 )
             )
@@ -115,39 +210,65 @@ class RestAPIBodyUpdater(CfnUpdater):
 
     def copy_resource(self, resource):
         """
-        Copy the resource using dump and reload. dictionary deepcopy() did not work on yaml dictionaries.
+        Copy the resource, preserving the yaml tags, comments and anchors.
         """
-        bytes = BytesIO()
-        self.yaml.dump(resource, bytes)
-        bytes.seek(0)
-        result = self.yaml.load(bytes)
-        return result
+        return copy_node(resource)
+
+    def body_diff(self, current_body):
+        """
+        generates the differences between the `current_body` and the new body, as
+        changed paths or as a line diff of the yaml.
+        """
+        if self.diff == "lines":
+            current_body_as_string = (
+                self.yaml_dump_to_str(current_body) if current_body else ""
+            )
+            return line_diff(
+                current_body_as_string.split("\n"),
+                self.body_as_string.split("\n"),
+                max_hunks=self.max_diff_hunks,
+            )
+        return structural_diff_lines(
+            current_body or {}, self.body or {}, self.max_diff_hunks
+        )
 
     def update_template(self):
+        for resource_name in self.resource_names or [self.resource_name]:
+            self.resource_name = resource_name
+            self.update_resource()
+
+    def update_resource(self):
+        """
+        updates the body of the latest version of the api `self.resource_name`.
+        """
         resources = self.find_matching_resources()
         if not resources:
             return
 
         name = resources[-1]
         rest_api_gateway = self.template["Resources"][name]
-        current_body = rest_api_gateway.get("Properties", {}).get("Body", {})
+        body_property = _body_properties[rest_api_gateway["Type"]]
+        properties = rest_api_gateway.get("Properties", {})
+        if body_property == "DefinitionBody" and "DefinitionUri" in properties:
+            sys.stderr.write(
+                "WARN: skipping {}, as it has a DefinitionUri in template {}\n".format(
+                    name, self.filename
+                )
+            )
+            return
+        current_body = properties.get(body_property, {})
 
-        current_body_as_string = (
-            self.yaml_dump_to_str(current_body) if current_body else ""
-        )
-        if self.body_as_string != current_body_as_string:
+        current_body_hash = structural_hash(current_body) if current_body else None
+        if self.body_hash != current_body_hash:
             if self.verbose:
-                for text in difflib.unified_diff(
-                    current_body_as_string.split("\n"), self.body_as_string.split("\n")
-                ):
-                    if text[:3] not in ["---", "+++"]:
-                        sys.stderr.write("{}\n".format(text))
+                for text in self.body_diff(current_body):
+                    sys.stderr.write("{}\n".format(text))
 
             rest_api_gateway = self.copy_resource(rest_api_gateway)
             if not "Properties" in rest_api_gateway:
                 rest_api_gateway["Properties"] = {}
 
-            rest_api_gateway["Properties"]["Body"] = self.body
+            rest_api_gateway["Properties"][body_property] = copy_node(self.body)
 
             if self.add_new_version:
                 new_name = self.new_resource_name(name)
@@ -165,7 +286,7 @@ class RestAPIBodyUpdater(CfnUpdater):
                 )
 
             if self.add_new_version:
-                replace_references(self.template, name, new_name)
+                replace_references(self.template, {name: new_name})
                 for i in range(0, len(resources) - (self.keep - 1)):
                     sys.stderr.write(
                         "INFO: removing resource {} from template {}\n".format(
@@ -193,10 +314,17 @@ class RestAPIBodyUpdater(CfnUpdater):
         keep,
         dry_run,
         verbose,
+        diff="structural",
+        max_diff_hunks=50,
     ):
         self.dry_run = dry_run
         self.verbose = verbose
-        self.resource_name = resource_name
+        self.diff = diff
+        self.max_diff_hunks = max_diff_hunks
+        if isinstance(resource_name, str):
+            self.resource_name = resource_name
+        else:
+            self.resource_names = list(resource_name)
         self.open_api_specification = open_api_specification
         self.api_gateway_extensions = api_gateway_extensions
         self.add_new_version = add_new_version
@@ -0,0 +1,298 @@
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+#   Copyright 2024 binx.io B.V.
+import sys
+from typing import Optional
+
+import click
+import pytz
+from ruamel.yaml.comments import CommentedMap, CommentedSeq, TaggedScalar
+from ruamel.yaml.scalarstring import SingleQuotedScalarString
+
+from .cron_schedule_expression_updater import CronScheduleExpressionUpdater
+from .replace_references import replace_references
+
+_target_properties = [
+    "Arn",
+    "RoleArn",
+    "Input",
+    "RetryPolicy",
+    "DeadLetterConfig",
+    "EcsParameters",
+    "KinesisParameters",
+    "SageMakerPipelineParameters",
+    "SqsParameters",
+]
+
+_unsupported_target_properties = [
+    "InputPath",
+    "InputTransformer",
+    "HttpParameters",
+    "RedshiftDataParameters",
+    "RunCommandParameters",
+    "BatchParameters",
+]
+
+
+def role_reference(role_arn) -> Optional[str]:
+    """
+    returns the logical name of the role in a `!GetAtt Role.Arn` role arn, or None.
+    """
+    if isinstance(role_arn, TaggedScalar) and role_arn.tag.suffix == "GetAtt":
+        name, _, attribute = str(role_arn.value).partition(".")
+        return name if attribute == "Arn" else None
+    if isinstance(role_arn, CommentedSeq) and role_arn.tag.suffix == "GetAtt":
+        return role_arn[0] if len(role_arn) == 2 and role_arn[1] == "Arn" else None
+    if isinstance(role_arn, dict) and "Fn::GetAtt" in role_arn:
+        value = role_arn["Fn::GetAtt"]
+        if isinstance(value, str):
+            name, _, attribute = value.partition(".")
+            return name if attribute == "Arn" else None
+        if isinstance(value, list) and len(value) == 2 and value[1] == "Arn":
+            return value[0]
+    return None
+
+
+class SchedulerMigrator(CronScheduleExpressionUpdater):
+    """
+        Migrates AWS::Events::Rule resources with a cron expression in the description
+        to AWS::Scheduler::Schedule resources with a native timezone. It changes:
+
+    \b
+          DailyTaskSchedule:
+            Type: AWS::Events::Rule
+            Properties:
+              Description: run daily - cron(30 01 * * ? *)
+              ScheduleExpression: cron(30 23 * * ? *)
+              State: ENABLED
+              Targets:
+                - Id: task
+                  Arn: !GetAtt Task.Arn
+                  RoleArn: !GetAtt EventsRole.Arn
+
+    to
+
+    \b
+          DailyTaskScheduleSchedule:
+            Type: AWS::Scheduler::Schedule
+            Properties:
+              Description: run daily - cron(30 01 * * ? *)
+              ScheduleExpression: cron(30 01 * * ? *)
+              ScheduleExpressionTimezone: Europe/Amsterdam
+              FlexibleTimeWindow:
+                Mode: 'OFF'
+              State: ENABLED
+              Target:
+                Arn: !GetAtt Task.Arn
+                RoleArn: !GetAtt EventsRole.Arn
+
+    As a schedule has a single target, a schedule is created for each target of
+    the rule. All references to the rule are replaced by references to the
+    (first) schedule, and scheduler.amazonaws.com is allowed to assume the
+    target roles which trust events.amazonaws.com. Rules with targets without
+    a RoleArn, with an input transformation, ECS tags or a Kinesis partition key
+    path, rules with a state other than ENABLED or DISABLED, and rules of which a
+    schedule name is already in use, are not migrated.
+    """
+
+    def __init__(self):
+        super(SchedulerMigrator, self).__init__()
+
+    def unsupported_reason(self, resource) -> Optional[str]:
+        """
+        returns why the rule cannot be migrated, or None if it can.
+        """
+        properties = resource.get("Properties", {})
+        if properties.get("EventPattern"):
+            return "it has an event pattern"
+        if properties.get("EventBusName"):
+            return "it is on a custom event bus"
+        state = properties.get("State", "ENABLED")
+        if isinstance(state, str) and state not in ("ENABLED", "DISABLED"):
+            return f"its state {state} is not ENABLED or DISABLED"
+        targets = properties.get("Targets")
+        if not targets:
+            return "it has no targets"
+        for target in targets:
+            if "RoleArn" not in target:
+                return f"target {target.get('Id')} has no RoleArn"
+            unsupported = [p for p in _unsupported_target_properties if p in target]
+            if unsupported:
+                return f"target {target.get('Id')} uses {', '.join(unsupported)}"
+            if "TagList" in (target.get("EcsParameters") or {}):
+                return (
+                    f"target {target.get('Id')} uses EcsParameters.TagList, which has another"
+                    " shape than the Tags of a schedule"
+                )
+            if "PartitionKeyPath" in (target.get("KinesisParameters") or {}):
+                return (
+                    f"target {target.get('Id')} uses KinesisParameters.PartitionKeyPath,"
+                    " and a schedule has no event to take the partition key from"
+                )
+        return None
+
+    def new_target(self, target):
+        result = CommentedMap()
+        for name in filter(lambda n: n in target, _target_properties):
+            result[name] = target[name]
+
+        ecs_parameters = result.get("EcsParameters")
+        if ecs_parameters and "NetworkConfiguration" in ecs_parameters:
+            network = ecs_parameters["NetworkConfiguration"]
+            if "AwsVpcConfiguration" in network:
+                network["AwsvpcConfiguration"] = network.pop("AwsVpcConfiguration")
+        if ecs_parameters and "PlacementStrategies" in ecs_parameters:
+            ecs_parameters["PlacementStrategy"] = ecs_parameters.pop("PlacementStrategies")
+        return result
+
+    @staticmethod
+    def schedule_names(name: str, resource) -> list[str]:
+        """
+        returns the logical names of the schedules replacing the rule `name`.
+        """
+        targets = resource["Properties"]["Targets"]
+        return [
+            f"{name}Schedule" if i == 0 else f"{name}Schedule{i + 1}"
+            for i in range(len(targets))
+        ]
+
+    def new_schedules(self, name: str, resource) -> dict:
+        """
+        returns the schedules replacing the rule `name`, by logical name.
+        """
+        properties = resource["Properties"]
+        targets = properties["Targets"]
+        result = {}
+        names = self.schedule_names(name, resource)
+        for i, target in enumerate(targets):
+            schedule = CommentedMap()
+            if properties.get("Name"):
+                schedule["Name"] = (
+                    properties["Name"]
+                    if len(targets) == 1
+                    else f"{properties['Name']}-{target.get('Id', i + 1)}"
+                )
+            if properties.get("Description"):
+                schedule["Description"] = properties["Description"]
+            schedule["ScheduleExpression"] = "cron({})".format(
+                self.local_cron_expression(resource)
+            )
+            schedule["ScheduleExpressionTimezone"] = str(
+                getattr(self.timezone, "zone", self.timezone)
+            )
+            schedule["FlexibleTimeWindow"] = CommentedMap(Mode=SingleQuotedScalarString("OFF"))
+            schedule["State"] = properties.get("State", "ENABLED")
+            schedule["Target"] = self.new_target(target)
+
+            new_name = names[i]
+            new_resource = CommentedMap(Type="AWS::Scheduler::Schedule")
+            if "Condition" in resource:
+                new_resource["Condition"] = resource["Condition"]
+            if "DependsOn" in resource:
+                new_resource["DependsOn"] = resource["DependsOn"]
+            new_resource["Properties"] = schedule
+            result[new_name] = new_resource
+        return result
+
+    def allow_scheduler_to_assume(self, role_name: str):
+        """
+        adds scheduler.amazonaws.com to the trust policy statements of the role which
+        allow events.amazonaws.com.
+        """
+        role = self.resources.get(role_name)
+        if not role or role.get("Type") != "AWS::IAM::Role":
+            return
+        document = role.get("Properties", {}).get("AssumeRolePolicyDocument", {})
+        statements = document.get("Statement", []) if isinstance(document, dict) else []
+        for statement in statements:
+            services = statement.get("Principal", {}).get("Service")
+            if isinstance(services, str):
+                services = [services]
+            if not isinstance(services, list) or "events.amazonaws.com" not in services:
+                continue
+            if "scheduler.amazonaws.com" not in services:
+                statement["Principal"]["Service"] = list(services) + [
+                    "scheduler.amazonaws.com"
+                ]
+                sys.stderr.write(
+                    f"INFO: allowing scheduler.amazonaws.com to assume role {role_name} in {self.filename}\n"
+                )
+                self.dirty = True
+
+    def update_template(self):
+        """
+        replaces the matching rules by schedules, and renames all references to the
+        migrated rules in a single pass over the template.
+        """
+        mapping = {}
+        resources = self.resources
+        for name, resource in self.all_matching_resources(resources).items():
+            reason = self.unsupported_reason(resource)
+            if not reason:
+                existing = [n for n in self.schedule_names(name, resource) if n in resources]
+                reason = f"{', '.join(existing)} already exists" if existing else None
+            if reason:
+                sys.stderr.write(
+                    f"WARN: not migrating {name} in {self.filename}, as {reason}\n"
+                )
+                continue
+
+            schedules = self.new_schedules(name, resource)
+            for target in resource["Properties"]["Targets"]:
+                role_name = role_reference(target["RoleArn"])
+                if role_name:
+                    self.allow_scheduler_to_assume(role_name)
+
+            del resources[name]
+            resources.update(schedules)
+            mapping[name] = next(iter(schedules))
+            sys.stderr.write(
+                "INFO: migrated {} to {} in {}\n".format(
+                    name, ", ".join(schedules), self.filename
+                )
+            )
+            self.dirty = True
+
+        if mapping:
+            replace_references(self.template, mapping)
+
+    def main(self, tz, dry_run, verbose, paths):
+        self.dry_run = dry_run
+        self.verbose = verbose
+        self.timezone = tz
+        self.update(paths)
+
+
+@click.command(name="migrate-to-scheduler", help=SchedulerMigrator.__doc__)
+@click.option(
+    "--timezone",
+    required=False,
+    help="of the cron expressions in the rule descriptions",
+    default="Europe/Amsterdam",
+)
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
+@click.pass_context
+def migrate_to_scheduler(ctx, timezone, path):
+    migrator = SchedulerMigrator()
+    migrator.follow_nested = ctx.obj["follow_nested"]
+    migrator.journal = ctx.obj["journal"]
+    try:
+        tz = pytz.timezone(timezone)
+    except pytz.exceptions.UnknownTimeZoneError:
+        raise click.BadParameter(
+            "invalid timezone specified", ctx=ctx, param="timezone"
+        )
+    migrator.main(tz, ctx.obj["dry_run"], ctx.obj["verbose"], list(path))
@@ -124,10 +124,14 @@ class StateMachineDefinitionUpdater(CfnUpdater):
 @click.option(
     "--fn-sub/--no-fn-sub", required=False, default=True, help="for the definition"
 )
-@click.argument("path", nargs=-1, required=True, type=click.Path(exists=True))
+@click.argument(
+    "path", nargs=-1, required=True, type=click.Path(exists=True, allow_dash=True)
+)
 @click.pass_context
 def update_state_machine_definition(ctx, resource, definition, fn_sub, path):
     updater = StateMachineDefinitionUpdater()
+    updater.follow_nested = ctx.obj["follow_nested"]
+    updater.journal = ctx.obj["journal"]
     updater.main(
         resource, definition, fn_sub, list(path), ctx.obj["dry_run"], ctx.obj["verbose"]
     )
@@ -1,10 +1,14 @@
 import pathlib
 import tempfile
 
+import pytest
+from click.testing import CliRunner
 from ruamel.yaml import YAML
 
-from aws_cfn_update.add_missing_resources import add_missing_resources
+from aws_cfn_update.add_missing_resources import add_missing_resources, merge_templates
+from aws_cfn_update.add_new_resources import add_to_targets, report, target_filenames
 from aws_cfn_update.cfn_updater import read_template
+from aws_cfn_update.cli import cli
 
 
 def test_simple():
@@ -48,3 +52,176 @@ def test_read_template():
         YAML(typ="safe").dump(source, pathlib.Path(f.name))
         result = read_template(f.name)
         assert source == result
+
+
+def test_added_entries_are_copies():
+    source = {"Resources": {"Bucket": {"Type": "AWS::S3::Bucket", "Properties": {}}}}
+    target = {"Resources": {}}
+    result = add_missing_resources(target, source)
+    assert result == [("Resources", "Bucket")]
+    target["Resources"]["Bucket"]["Properties"]["BucketName"] = "changed"
+    assert source["Resources"]["Bucket"]["Properties"] == {}
+
+
+def _write_templates(tmp_path):
+    source = tmp_path / "base.yaml"
+    source.write_text(
+        "AWSTemplateFormatVersion: '2010-09-09'\n"
+        "Parameters:\n  Vpc:\n    Type: String\n"
+        "Resources:\n  Topic:\n    Type: AWS::SNS::Topic\n"
+    )
+    targets = []
+    for name in ["a", "b", "c"]:
+        directory = tmp_path / "services" / name
+        directory.mkdir(parents=True)
+        target = directory / "template.yaml"
+        target.write_text(
+            "AWSTemplateFormatVersion: '2010-09-09'\n"
+            "Resources:\n  Queue:\n    Type: AWS::SQS::Queue\n"
+        )
+        targets.append(target)
+    (tmp_path / "services" / "c" / "template.yaml").write_text(
+        source.read_text()
+    )
+    return source, targets
+
+
+def test_add_to_multiple_targets(tmp_path, capsys):
+    source, targets = _write_templates(tmp_path)
+    filenames = target_filenames([str(tmp_path / "services" / "*" / "template.yaml")])
+    assert filenames == [str(t) for t in targets]
+
+    results = add_to_targets(read_template(str(source)), filenames, False, False, 2)
+    assert results[str(targets[0])] == (["/Parameters/Vpc", "/Resources/Topic"], [])
+    assert results[str(targets[2])] == ([], [])
+
+    for target in targets[:2]:
+        template = read_template(str(target))
+        assert list(template["Resources"]) == ["Queue", "Topic"]
+        assert template["Parameters"]["Vpc"]["Type"] == "String"
+
+    report(results, False)
+    lines = capsys.readouterr().err.splitlines()
+    assert f"INFO: merged /Parameters/Vpc, /Resources/Topic into {targets[1]}" in lines
+    assert lines[-1] == "INFO: updated 2 of 3 templates, 0 conflicts"
+
+
+def test_add_to_targets_dry_run(tmp_path):
+    source, targets = _write_templates(tmp_path)
+    before = targets[0].read_text()
+    results = add_to_targets(
+        read_template(str(source)), [str(t) for t in targets], True, False
+    )
+    assert results[str(targets[0])][0]
+    assert targets[0].read_text() == before
+
+
+def test_unmatched_target_pattern(tmp_path):
+    with pytest.raises(SystemExit):
+        target_filenames([str(tmp_path / "*" / "template.yaml")])
+
+
+def _merge_source():
+    return {
+        "Parameters": {"Vpc": {"Type": "String", "Default": "vpc-2"}},
+        "Resources": {
+            "Bucket": {
+                "Type": "AWS::S3::Bucket",
+                "Properties": {
+                    "BucketName": "shared",
+                    "Tags": [{"Key": "team", "Value": "platform"}],
+                    "VersioningConfiguration": {"Status": "Enabled"},
+                },
+            }
+        },
+        "Outputs": {"BucketName": {"Value": {"Ref": "Bucket"}}},
+        "Rules": {"Region": {"Assertions": []}},
+    }
+
+
+def _merge_target():
+    return {
+        "Parameters": {"Vpc": {"Type": "String", "Default": "vpc-1"}},
+        "Resources": {
+            "Bucket": {
+                "Type": "AWS::S3::Bucket",
+                "Properties": {"BucketName": "mine", "Tags": []},
+            }
+        },
+    }
+
+
+def test_deep_merge():
+    target = _merge_target()
+    changes, conflicts = merge_templates(target, _merge_source())
+    assert changes == [
+        "/Rules/Region",
+        "/Resources/Bucket/Properties/VersioningConfiguration",
+        "/Outputs/BucketName",
+    ]
+    assert conflicts == [
+        "/Parameters/Vpc/Default",
+        "/Resources/Bucket/Properties/BucketName",
+        "/Resources/Bucket/Properties/Tags",
+    ]
+    properties = target["Resources"]["Bucket"]["Properties"]
+    assert properties["BucketName"] == "mine"
+    assert properties["VersioningConfiguration"] == {"Status": "Enabled"}
+    assert target["Outputs"] == _merge_source()["Outputs"]
+
+
+def test_deep_merge_theirs():
+    target = _merge_target()
+    changes, conflicts = merge_templates(target, _merge_source(), "theirs")
+    assert len(conflicts) == 3
+    assert "/Resources/Bucket/Properties/BucketName" in changes
+    assert target == _merge_source()
+
+
+def test_deep_merge_identical():
+    target = _merge_source()
+    assert merge_templates(target, _merge_source()) == ([], [])
+
+
+def test_three_way_merge():
+    base = _merge_target()
+    target = _merge_target()
+    target["Resources"]["Bucket"]["Properties"]["BucketName"] = "changed-by-us"
+    del target["Parameters"]["Vpc"]
+    source = _merge_source()
+    source["Parameters"]["Vpc"]["Default"] = "vpc-1"
+    source["Resources"]["Bucket"]["Properties"]["BucketName"] = "mine"
+
+    changes, conflicts = merge_templates(target, source, "deep", base)
+    assert conflicts == []
+    assert "Vpc" not in target["Parameters"]
+    properties = target["Resources"]["Bucket"]["Properties"]
+    assert properties["BucketName"] == "changed-by-us"
+    assert properties["Tags"] == [{"Key": "team", "Value": "platform"}]
+    assert "/Resources/Bucket/Properties/Tags" in changes
+
+
+def test_merge_conflict_pointers_are_escaped():
+    target = {"Mappings": {"a/b": {"c~d": {"x": 1}}}}
+    source = {"Mappings": {"a/b": {"c~d": {"x": 2}}}}
+    assert merge_templates(target, source)[1] == ["/Mappings/a~1b/c~0d/x"]
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--follow-nested"],
+        ["--journal", "journal.log"],
+        ["--resume"],
+        [],
+    ],
+)
+def test_unsupported_options(tmp_path, args):
+    source = tmp_path / "source.yaml"
+    source.write_text("AWSTemplateFormatVersion: '2010-09-09'\nResources: {}\n")
+    target = "-" if not args else str(source)
+    result = CliRunner().invoke(
+        cli, args + ["add-new-resources", "--source", str(source), target]
+    )
+    assert result.exit_code == 2, result.output
+    assert "add-new-resources does not support" in result.output
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+benchmarks = os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks")
+
+
+@pytest.fixture
+def templates(monkeypatch):
+    monkeypatch.syspath_prepend(benchmarks)
+    import templates
+
+    return templates
+
+
+def test_generate_template_is_deterministic(templates):
+    first = templates.generate_template(50, depth=3, seed=7)
+    assert first == templates.generate_template(50, depth=3, seed=7)
+    assert first != templates.generate_template(50, depth=3, seed=8)
+    assert len(first["Resources"]) == 50
+
+
+def test_generate_template_mix_and_depth(templates):
+    result = templates.generate_template(20, depth=4, mix={"ecs": 1})
+    assert {r["Type"] for r in result["Resources"].values()} == {
+        "AWS::ECS::TaskDefinition"
+    }
+    metadata = result["Resources"]["Task0"]["Metadata"]
+    for level in range(1, 5):
+        metadata = metadata[f"Level{level}"]
+    assert metadata == {"Index": 0, "Kind": "ecs"}
+
+
+def test_parse_mix(templates):
+    assert templates.parse_mix("ami=2,ecs") == {"ami": 2.0, "ecs": 1.0}
+
+
+def test_compare_results(templates):
+    import updaters
+
+    result = updaters.compare_results(
+        {"a/update/100": 1.0, "b/update/100": 1.0, "c/update/100": 1.0},
+        {"a/update/100": 1.1, "b/update/100": 1.5, "d/update/100": 9.0},
+        0.25,
+    )
+    assert [(name, slower) for name, _, _, _, slower in result] == [
+        ("a/update/100", False),
+        ("b/update/100", True),
+    ]
+
+
+def test_benchmark_updaters(templates):
+    import updaters
+
+    results = updaters.run_benchmarks([5], repeat=1, updaters=["container-image"])
+    assert set(results) == {
+        "container-image/load/5",
+        "container-image/update/5",
+        "container-image/write/5",
+        "iter_intrinsics/5",
+        "referenced_names/5",
+        "replace_references/5",
+    }
+
+
+def test_benchmark_inline_updaters(templates):
+    import updaters
+
+    names = ["config-rule-inline-code", "state-machine-definition"]
+    assert set(names) < set(updaters.UPDATERS)
+    template = templates.generate_template(50)
+    for name in names:
+        updater = updaters.UPDATERS[name](template)
+        updater.template = template
+        updater.update_template()
+        assert updater.dirty, name
@@ -0,0 +1,259 @@
+import io
+import json
+import os
+import threading
+
+import click
+import pytest
+from click.testing import CliRunner
+from ruamel.yaml import YAML
+
+from aws_cfn_update.cfn_updater import CfnUpdater, detect_format
+from aws_cfn_update.cli import cli
+
+
+class CountingUpdater(CfnUpdater):
+    def __init__(self):
+        super(CountingUpdater, self).__init__()
+        self.updated = []
+        self.lock = threading.Lock()
+
+    def update_template(self):
+        with self.lock:
+            self.updated.append(os.path.basename(self.filename))
+        self.template["Resources"]["Updated"] = {"Type": "AWS::SNS::Topic"}
+        self.dirty = True
+
+
+def _write_stacks(tmp_path):
+    (tmp_path / "nested" / "apps").mkdir(parents=True)
+    (tmp_path / "root.yaml").write_text(
+        "AWSTemplateFormatVersion: '2010-09-09'\n"
+        "Resources:\n"
+        "  Network:\n"
+        "    Type: AWS::CloudFormation::Stack\n"
+        "    Properties:\n"
+        "      TemplateURL: nested/network.yaml\n"
+        "  Shared:\n"
+        "    Type: AWS::CloudFormation::Stack\n"
+        "    Properties:\n"
+        "      TemplateURL: ./nested/shared.json\n"
+        "  Remote:\n"
+        "    Type: AWS::CloudFormation::Stack\n"
+        "    Properties:\n"
+        "      TemplateURL: https://s3.amazonaws.com/bucket/remote.yaml\n"
+    )
+    (tmp_path / "nested" / "network.yaml").write_text(
+        "Resources:\n"
+        "  App:\n"
+        "    Type: AWS::Serverless::Application\n"
+        "    Properties:\n"
+        "      Location: apps/app.yaml\n"
+        "  Shared:\n"
+        "    Type: AWS::CloudFormation::Stack\n"
+        "    Properties:\n"
+        "      TemplateURL: shared.json\n"
+    )
+    (tmp_path / "nested" / "shared.json").write_text('{"Resources": {}}')
+    (tmp_path / "nested" / "apps" / "app.yaml").write_text(
+        "Resources:\n"
+        "  Parent:\n"
+        "    Type: AWS::CloudFormation::Stack\n"
+        "    Properties:\n"
+        "      TemplateURL: ../network.yaml\n"
+    )
+
+
+def test_stack_graph(tmp_path):
+    _write_stacks(tmp_path)
+    updater = CountingUpdater()
+    graph = updater.stack_graph(str(tmp_path / "root.yaml"))
+
+    names = {
+        os.path.basename(filename): sorted(os.path.basename(n) for n in nested)
+        for filename, _, nested in graph.values()
+    }
+    assert names == {
+        "root.yaml": ["network.yaml", "shared.json"],
+        "network.yaml": ["app.yaml", "shared.json"],
+        "shared.json": [],
+        "app.yaml": ["network.yaml"],
+    }
+
+
+def test_update_nested_visits_each_template_once(tmp_path):
+    _write_stacks(tmp_path)
+    updater = CountingUpdater()
+    updater.follow_nested = True
+    updater.update(str(tmp_path / "root.yaml"))
+
+    assert sorted(updater.updated) == [
+        "app.yaml",
+        "network.yaml",
+        "root.yaml",
+        "shared.json",
+    ]
+    assert updater.dirty
+    assert "Updated:" in (tmp_path / "nested" / "apps" / "app.yaml").read_text()
+    assert '"Updated"' in (tmp_path / "nested" / "shared.json").read_text()
+
+
+def test_update_without_follow_nested(tmp_path):
+    _write_stacks(tmp_path)
+    updater = CountingUpdater()
+    updater.update(str(tmp_path / "root.yaml"))
+    assert updater.updated == ["root.yaml"]
+
+
+def test_updater_ignores_click_context():
+    with click.Context(cli, obj={"follow_nested": True}):
+        updater = CountingUpdater()
+    assert not updater.follow_nested
+
+
+def test_follow_nested_option(tmp_path):
+    _write_stacks(tmp_path)
+    (tmp_path / "nested" / "shared.json").write_text(
+        '{"Resources": {"Task": {"Type": "AWS::ECS::TaskDefinition", "Properties": '
+        '{"ContainerDefinitions": [{"Name": "app", "Image": "nginx:1.0"}]}}}}'
+    )
+    result = CliRunner().invoke(
+        cli,
+        [
+            "--follow-nested",
+            "container-image",
+            "--image",
+            "nginx:1.1",
+            str(tmp_path / "root.yaml"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "nginx:1.1" in (tmp_path / "nested" / "shared.json").read_text()
+
+
+def test_detect_format():
+    assert detect_format('  \n{"Resources": {}}') == ".json"
+    assert detect_format("---\nResources: {}\n") == ".yaml"
+    assert detect_format("Resources: {a: 1}\n") == ".yaml"
+
+
+def test_update_stdin_yaml(monkeypatch, capsys):
+    monkeypatch.setattr(
+        "sys.stdin",
+        io.StringIO("AWSTemplateFormatVersion: '2010-09-09'\nResources: {}\n"),
+    )
+    updater = CountingUpdater()
+    updater.update("-")
+    assert updater.updated == ["-"]
+    assert capsys.readouterr().out == (
+        "---\n"
+        "AWSTemplateFormatVersion: '2010-09-09'\n"
+        "Resources:\n"
+        "  Updated:\n"
+        "    Type: AWS::SNS::Topic\n"
+    )
+
+
+def test_update_stdin_json(monkeypatch, capsys):
+    monkeypatch.setattr(
+        "sys.stdin",
+        io.StringIO('{"AWSTemplateFormatVersion": "2010-09-09", "Resources": {}}'),
+    )
+    updater = CountingUpdater()
+    updater.update("-")
+    assert json.loads(capsys.readouterr().out)["Resources"] == {
+        "Updated": {"Type": "AWS::SNS::Topic"}
+    }
+
+
+def test_update_stdin_dry_run(monkeypatch, capsys):
+    content = '{"AWSTemplateFormatVersion": "2010-09-09", "Resources": {}}'
+    monkeypatch.setattr("sys.stdin", io.StringIO(content))
+    updater = CountingUpdater()
+    updater.dry_run = True
+    updater.update("-")
+    assert capsys.readouterr().out == content
+
+
+def test_cli_pipeline():
+    template = (
+        "AWSTemplateFormatVersion: '2010-09-09'\n"
+        "Resources:\n"
+        "  Task:\n"
+        "    Type: AWS::ECS::TaskDefinition\n"
+        "    Properties:\n"
+        "      ContainerDefinitions:\n"
+        "        - Name: app\n"
+        "          Image: nginx:1.0\n"
+    )
+    runner = CliRunner()
+    first = runner.invoke(cli, ["container-image", "--image", "nginx:1.1", "-"], input=template)
+    assert first.exit_code == 0, first.output
+    second = runner.invoke(
+        cli, ["container-image", "--image", "nginx:1.2", "-"], input=first.stdout
+    )
+    assert second.exit_code == 0, second.output
+    assert second.stdout == template.replace("nginx:1.0", "nginx:1.2").replace(
+        "AWS", "---\nAWS", 1
+    )
+
+
+def test_cli_passes_stdin_through_without_updates(monkeypatch):
+    monkeypatch.delenv("AWS_CFN_UPDATE_CONTAINER_IMAGES", raising=False)
+    monkeypatch.delenv("AWS_CFN_UPDATE_LAMBDA_S3_KEYS", raising=False)
+    template = "AWSTemplateFormatVersion: '2010-09-09'\nResources: {}\n"
+    runner = CliRunner()
+    for command in ["container-image", "lambda-s3-key"]:
+        result = runner.invoke(cli, [command, "-"], input=template)
+        assert result.exit_code == 0, result.output
+        assert result.stdout == template
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        ["oidc-provider-thumbprints", "--offline", "{tmp_path}"],
+        ["lambda-s3-key", "--resolve-from-s3"],
+    ],
+)
+@pytest.mark.parametrize(
+    "content",
+    ["not: a template\n", "AWSTemplateFormatVersion: '2010-09-09'\nResources: {}\n"],
+)
+def test_cli_two_pass_updaters_write_stdin_once(command, content, tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    loads = []
+    load = YAML.load
+
+    def counting_load(self, stream):
+        loads.append(stream)
+        return load(self, stream)
+
+    monkeypatch.setattr(YAML, "load", counting_load)
+    args = [a.format(tmp_path=tmp_path) for a in command] + ["-"]
+    result = CliRunner().invoke(cli, args, input=content)
+    assert result.exit_code == 0, result.output
+    assert result.stdout == content
+    assert len(loads) == 1, "expected stdin to be parsed once"
+
+
+def test_cli_journal_only_on_request(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    template = tmp_path / "template.json"
+    template.write_text(
+        '{"AWSTemplateFormatVersion": "2010-09-09", "Resources": {"Task": {"Type": "AWS::ECS::TaskDefinition", "Properties": '
+        '{"ContainerDefinitions": [{"Name": "app", "Image": "nginx:1.0"}]}}}}'
+    )
+    runner = CliRunner()
+    result = runner.invoke(cli, ["container-image", "--image", "nginx:1.1", str(template)])
+    assert result.exit_code == 0, result.output
+    assert "nginx:1.1" in template.read_text()
+    assert not (tmp_path / "cache").exists()
+
+    journal = tmp_path / "journal.log"
+    result = runner.invoke(
+        cli, ["--journal", str(journal), "container-image", "--image", "nginx:1.2", str(template)]
+    )
+    assert result.exit_code == 0, result.output
+    assert "nginx:1.2" in template.read_text()
+    assert not journal.exists(), "expected the journal of a finished run to be removed"
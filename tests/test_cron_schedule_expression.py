@@ -1,5 +1,7 @@
+import json
+import pytest
 import pytz
-from datetime import datetime, tzinfo
+from datetime import datetime, timedelta, tzinfo
 from aws_cfn_update.cron_schedule_expression_updater import (
     aws_cron_pattern,
     CronScheduleExpressionUpdater as Updater,
@@ -8,7 +10,10 @@ from aws_cfn_update.cron_schedule_expression_updater import (
     correct_for_utc,
     correct_cron_hours_expression_for_utc,
     correct_cron_expression_for_utc,
+    _correct_cron_expression_for_utc,
+    utc_offset_table,
 )
+import aws_cfn_update.cron_schedule_expression_updater as cron_updater
 
 
 def test_cron_pattern_match():
@@ -120,3 +125,122 @@ def test_template_update_incorrect_cron():
         properties["ScheduleExpression"]
         == "cron(Minutes Hours Day-of-month Month Day-of-week Year)"
     )
+
+
+@pytest.mark.parametrize(
+    "zone", ["Europe/Amsterdam", "America/New_York", "Australia/Sydney", "UTC", "Asia/Kolkata"]
+)
+def test_utc_offset_table(zone):
+    timezone = pytz.timezone(zone)
+    table = utc_offset_table(timezone)
+    start = datetime(2023, 1, 1)
+    for hour in range(0, 2 * 366 * 24, 1):
+        local_time = start + timedelta(hours=hour, minutes=30)
+        expected = timezone.localize(local_time, is_dst=False).utcoffset()
+        assert table.utcoffset(local_time) == expected, local_time
+
+
+def test_correct_cron_expression_is_memoized():
+    timezone = pytz.timezone("Europe/Amsterdam")
+    _correct_cron_expression_for_utc.cache_clear()
+    for _ in range(1000):
+        assert "30 23 * * ? *" == correct_cron_expression_for_utc(
+            "30 01 * * ? *", timezone.localize(datetime(2018, 8, 1, 12))
+        )
+    assert _correct_cron_expression_for_utc.cache_info().misses == 1
+
+    assert "30 0 * * ? *" == correct_cron_expression_for_utc(
+        "30 01 * * ? *", timezone.localize(datetime(2018, 12, 1))
+    )
+    assert "30 23 * * ? *" == correct_cron_expression_for_utc(
+        "30 01 * * ? *", timezone.localize(datetime(2018, 10, 27))
+    )
+    assert "30 0 * * ? *" == correct_cron_expression_for_utc(
+        "30 01 * * ? *", timezone.localize(datetime(2018, 10, 28))
+    )
+
+
+@pytest.mark.parametrize("zone", ["Europe/Amsterdam", "Australia/Sydney", "UTC"])
+@pytest.mark.parametrize(
+    "expression", ["30 01 * * ? *", "0 9-17 ? * MON-FRI *", "0 2 1 * ? *", "0 3 29 2 ? *"]
+)
+def test_schedule_changes_at_transitions(zone, expression, monkeypatch):
+    updater = Updater()
+    updater.timezone = pytz.timezone(zone)
+    updater.today = datetime(2018, 8, 1)
+    days = 3 * 365
+
+    expected = []
+    previous = correct_cron_expression_for_utc(expression, updater.today)
+    for day in range(1, days + 1):
+        today = updater.today + timedelta(days=day)
+        utc_expression = correct_cron_expression_for_utc(expression, today)
+        if utc_expression != previous:
+            expected.append((today.date(), utc_expression))
+            previous = utc_expression
+
+    evaluated = []
+    correct = cron_updater.correct_cron_expression_for_utc
+
+    def counting_correct(expression, today):
+        evaluated.append(today)
+        return correct(expression, today)
+
+    monkeypatch.setattr(cron_updater, "correct_cron_expression_for_utc", counting_correct)
+    assert updater.schedule_changes(expression, days) == expected
+    assert len(evaluated) <= 7, "expected only the days around the transitions"
+
+
+def test_forecast(tmp_path):
+    template = {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Resources": {
+            "Daily": {
+                "Type": "AWS::Events::Rule",
+                "Properties": {
+                    "Description": "run daily - cron(30 01 * * ? *)",
+                    "ScheduleExpression": "cron(30 23 * * ? *)",
+                },
+            },
+            "Hourly": {
+                "Type": "AWS::Events::Rule",
+                "Properties": {
+                    "Description": "run hourly - cron(0 9-17 * * ? *)",
+                    "ScheduleExpression": "cron(0 9-17 * * ? *)",
+                },
+            },
+        },
+    }
+    path = tmp_path / "template.json"
+    path.write_text(json.dumps(template))
+
+    updater = Updater()
+    updater.timezone = pytz.timezone("Europe/Amsterdam")
+    updater.today = datetime(2018, 8, 1)
+    plan = updater.forecast([str(path)], 365)
+
+    assert plan["timezone"] == "Europe/Amsterdam"
+    assert plan["date"] == "2018-08-01"
+    assert list(plan["dates"].keys()) == [
+        "2018-08-01",
+        "2018-10-27",
+        "2018-10-28",
+        "2019-03-30",
+        "2019-03-31",
+    ]
+    assert plan["dates"]["2018-08-01"] == [
+        {
+            "path": str(path),
+            "resource": "Hourly",
+            "schedule_expression": "cron(0 7-15 * * ? *)",
+        }
+    ]
+    changes = {
+        day: [(c["resource"], c["schedule_expression"]) for c in changes]
+        for day, changes in plan["dates"].items()
+    }
+    assert changes["2018-10-27"] == [("Hourly", "cron(0 8-16 * * ? *)")]
+    assert changes["2018-10-28"] == [("Daily", "cron(30 0 * * ? *)")]
+    assert changes["2019-03-30"] == [("Hourly", "cron(0 7-15 * * ? *)")]
+    assert changes["2019-03-31"] == [("Daily", "cron(30 23 * * ? *)")]
+    assert json.loads(path.read_text()) == template
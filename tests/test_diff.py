@@ -0,0 +1,89 @@
+import random
+
+from ruamel.yaml import YAML
+
+from aws_cfn_update.diff import line_diff, structural_diff_lines
+
+
+def test_structural_diff():
+    old = YAML().load(
+        """
+paths:
+  /orders:
+    post:
+      responses:
+        200: {description: ok}
+      x-amazon-apigateway-integration:
+        uri: !Sub '${Orders.Arn}'
+    get: {}
+tags: [a, b]
+"""
+    )
+    new = {
+        "paths": {
+            "/orders": {
+                "post": {
+                    "responses": {"200": {"description": "created"}},
+                    "x-amazon-apigateway-integration": {"uri": {"Fn::Sub": "${Orders.Arn}"}},
+                },
+                "put": {},
+            }
+        },
+        "tags": ["a"],
+    }
+    assert list(structural_diff_lines(old, new)) == [
+        "~ paths./orders.post.responses.200.description",
+        "+ paths./orders.put",
+        "- paths./orders.get",
+        "- tags.1",
+    ]
+    assert list(structural_diff_lines(old, new, 2)) == [
+        "~ paths./orders.post.responses.200.description",
+        "+ paths./orders.put",
+        "... 2 more changes",
+    ]
+    new["paths"]["/orders"]["post"]["x-amazon-apigateway-integration"]["uri"] = {
+        "Fn::Sub": "${Payments.Arn}"
+    }
+    assert "~ paths./orders.post.x-amazon-apigateway-integration.uri" in list(
+        structural_diff_lines(old, new)
+    )
+    assert list(structural_diff_lines(old, old)) == []
+
+
+def test_line_diff():
+    old = list("abcdefghijklmnop")
+    new = list("abXdefghijklmnoY")
+    assert list(line_diff(old, new, context=2)) == [
+        "@@ -1,5 +1,5 @@",
+        " a",
+        " b",
+        "-c",
+        "+X",
+        " d",
+        " e",
+        "@@ -14,3 +14,3 @@",
+        " n",
+        " o",
+        "-p",
+        "+Y",
+    ]
+    assert list(line_diff(old, new, context=2, max_hunks=1))[-1] == "... 1 more hunks"
+    assert list(line_diff(old, old)) == []
+
+
+def test_line_diff_reconstructs():
+    random.seed(42)
+    for _ in range(200):
+        old = [random.choice("abcdefg") for _ in range(random.randint(0, 40))]
+        new = list(old)
+        for _ in range(random.randint(1, 6)):
+            i = random.randint(0, len(new))
+            new[i:i + random.randint(0, 2)] = random.choice(["", "x", "yz"])
+
+        result = list(line_diff(old, new, context=len(old) + len(new)))
+        if old == new:
+            assert result == []
+            continue
+        assert [line[1:] for line in result[1:] if line[0] in " -"] == old
+        assert [line[1:] for line in result[1:] if line[0] in " +"] == new
@@ -0,0 +1,71 @@
+from io import StringIO
+
+from aws_cfn_update.cfn_updater import CfnUpdater
+from aws_cfn_update.intrinsics import iter_intrinsics, visit_intrinsics
+
+template = """
+Conditions:
+  IsProduction: !And [!Condition HasName, !Equals [!Ref Env, prod]]
+Resources:
+  Queue:
+    Type: AWS::SQS::Queue
+    Condition: IsProduction
+    DependsOn: [Topic]
+    Properties:
+      A: !GetAtt Topic.TopicName
+      B: !GetAtt [Topic, TopicName]
+      C: !Sub '${Topic}-${Topic.TopicName}-${AWS::Region}-${!Literal}'
+      D: !Sub ['${Name}-${Topic}', {Name: !Ref Env}]
+      E: !If [IsProduction, !ImportValue Export, !FindInMap [Map, a, b]]
+      F: {"Fn::GetAtt": ["Topic", "TopicName"], "Ref": "Env", "Fn::Sub": "${Topic}"}
+"""
+
+
+def test_iter_intrinsics():
+    yaml = CfnUpdater().yaml
+    result = sorted(
+        (i.function, i.name, i.namespace, ".".join(map(str, i.path)))
+        for i in iter_intrinsics(yaml.load(template))
+    )
+    assert result == [
+        ("Condition", "HasName", "condition", "Conditions.IsProduction.0"),
+        ("Condition", "IsProduction", "condition", "Resources.Queue"),
+        ("DependsOn", "Topic", "value", "Resources.Queue.DependsOn.0"),
+        ("Fn::FindInMap", "Map", "mapping", "Resources.Queue.Properties.E.2.0"),
+        ("Fn::GetAtt", "Topic", "value", "Resources.Queue.Properties.A"),
+        ("Fn::GetAtt", "Topic", "value", "Resources.Queue.Properties.B.0"),
+        ("Fn::GetAtt", "Topic", "value", "Resources.Queue.Properties.F.Fn::GetAtt.0"),
+        ("Fn::If", "IsProduction", "condition", "Resources.Queue.Properties.E.0"),
+        ("Fn::ImportValue", "Export", "export", "Resources.Queue.Properties.E.1"),
+        ("Fn::Sub", "AWS::Region", "value", "Resources.Queue.Properties.C"),
+        ("Fn::Sub", "Topic", "value", "Resources.Queue.Properties.C"),
+        ("Fn::Sub", "Topic", "value", "Resources.Queue.Properties.D.0"),
+        ("Fn::Sub", "Topic", "value", "Resources.Queue.Properties.F"),
+        ("Ref", "Env", "value", "Conditions.IsProduction.1.0"),
+        ("Ref", "Env", "value", "Resources.Queue.Properties.D.1.Name"),
+        ("Ref", "Env", "value", "Resources.Queue.Properties.F"),
+    ]
+
+
+def test_visit_and_rename():
+    yaml = CfnUpdater().yaml
+    loaded = yaml.load(template)
+
+    def rename(intrinsic):
+        if intrinsic.name == "Topic":
+            intrinsic.rename("NewTopic")
+            return True
+
+    assert len(visit_intrinsics(loaded, rename)) == 7
+    result = StringIO()
+    yaml.dump(loaded, result)
+    assert "Topic" not in result.getvalue().replace("NewTopic", "").replace(
+        "TopicName", ""
+    )
+
+
+def test_deeply_nested():
+    node = {"Ref": "Deep"}
+    for _ in range(5000):
+        node = {"Fn::Join": ["", [node]]}
+    assert [i.name for i in iter_intrinsics(node)] == ["Deep"]
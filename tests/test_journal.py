@@ -0,0 +1,148 @@
+import os
+
+import pytest
+
+from aws_cfn_update.cfn_updater import CfnUpdater
+from aws_cfn_update.journal import Journal, default_journal, write_atomic
+
+
+def test_write_atomic(tmp_path):
+    filename = tmp_path / "template.yaml"
+    filename.write_text("old")
+    filename.chmod(0o640)
+
+    write_atomic(str(filename), lambda f: f.write("new"))
+    assert filename.read_text() == "new"
+    assert filename.stat().st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["template.yaml"]
+
+
+def test_write_atomic_failure_keeps_original(tmp_path):
+    filename = tmp_path / "template.yaml"
+    filename.write_text("old")
+
+    def dump(f):
+        f.write("partial")
+        raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        write_atomic(str(filename), dump)
+    assert filename.read_text() == "old"
+    assert os.listdir(tmp_path) == ["template.yaml"]
+
+
+def test_write_atomic_follows_symlink(tmp_path):
+    filename = tmp_path / "template.yaml"
+    filename.write_text("old")
+    link = tmp_path / "link.yaml"
+    link.symlink_to(filename)
+
+    write_atomic(str(link), lambda f: f.write("new"))
+    assert link.is_symlink()
+    assert filename.read_text() == "new"
+    assert sorted(os.listdir(tmp_path)) == ["link.yaml", "template.yaml"]
+
+
+def test_write_atomic_keeps_hardlinks(tmp_path):
+    filename = tmp_path / "template.yaml"
+    filename.write_text("old content")
+    filename.chmod(0o640)
+    link = tmp_path / "link.yaml"
+    os.link(filename, link)
+
+    write_atomic(str(filename), lambda f: f.write("new"))
+    assert filename.read_text() == "new"
+    assert link.read_text() == "new"
+    assert os.path.samefile(filename, link)
+    assert filename.stat().st_mode & 0o777 == 0o640
+    assert sorted(os.listdir(tmp_path)) == ["link.yaml", "template.yaml"]
+
+
+def test_write_atomic_new_file_mode(tmp_path):
+    filename = tmp_path / "template.yaml"
+    mask = os.umask(0o022)
+    try:
+        write_atomic(str(filename), lambda f: f.write("new"))
+    finally:
+        os.umask(mask)
+    assert filename.stat().st_mode & 0o777 == 0o666 & ~mask
+
+
+def test_journal_resume(tmp_path):
+    filename = str(tmp_path / "journal.log")
+    journal = Journal(filename)
+    journal.complete(str(tmp_path / "a.yaml"), True)
+    journal.complete(str(tmp_path / "b.yaml"), False)
+    journal.flush()
+    journal.close()
+    assert os.path.exists(filename)
+
+    resumed = Journal(filename, resume=True)
+    assert resumed.is_completed(str(tmp_path / "a.yaml"))
+    assert resumed.is_completed(str(tmp_path / "b.yaml"))
+    assert not resumed.is_completed(str(tmp_path / "c.yaml"))
+
+    resumed.finished = True
+    resumed.close()
+    assert not os.path.exists(filename)
+
+
+def test_journal_without_resume_starts_over(tmp_path):
+    filename = tmp_path / "journal.log"
+    filename.write_text(str(tmp_path / "a.yaml") + "\n")
+    assert not Journal(str(filename)).is_completed(str(tmp_path / "a.yaml"))
+    assert not filename.exists()
+
+
+def test_default_journal(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
+    journal = default_journal(["container-image", "--image", "nginx:1.0", "."])
+    assert os.path.dirname(journal) == str(tmp_path)
+    assert journal == default_journal(
+        ["--resume", "container-image", "--image", "nginx:1.0", "."]
+    )
+    assert journal != default_journal(["container-image", "--image", "nginx:1.1", "."])
+
+
+class FailingUpdater(CfnUpdater):
+    def __init__(self, fail_on=None):
+        super(FailingUpdater, self).__init__()
+        self.fail_on = fail_on
+        self.updated = []
+
+    def update_template(self):
+        name = os.path.basename(self.filename)
+        if name == self.fail_on:
+            raise RuntimeError("interrupted")
+        self.updated.append(name)
+        self.template["Resources"]["Updated"] = {"Type": "AWS::SNS::Topic"}
+        self.dirty = True
+
+
+def test_resume_interrupted_run(tmp_path):
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    for name in ["a", "b", "c", "d"]:
+        (templates / f"{name}.yaml").write_text(
+            "AWSTemplateFormatVersion: '2010-09-09'\nResources: {}\n"
+        )
+    filename = str(tmp_path / "journal.log")
+    paths = [str(templates / f"{name}.yaml") for name in ["a", "b", "c", "d"]]
+
+    journal = Journal(filename)
+    journal.batch_size = 1
+    updater = FailingUpdater(fail_on="c.yaml")
+    updater.journal = journal
+    with pytest.raises(RuntimeError):
+        updater.update(paths)
+    journal.close()
+    assert updater.updated == ["a.yaml", "b.yaml"]
+
+    journal = Journal(filename, resume=True)
+    updater = FailingUpdater()
+    updater.journal = journal
+    updater.update(paths)
+    journal.close()
+    assert updater.updated == ["c.yaml", "d.yaml"]
+    assert not os.path.exists(filename)
+    assert "Updated" in (templates / "d.yaml").read_text()
@@ -1,4 +1,14 @@
+import json
+
+import botocore.session
+from botocore.stub import Stubber
+
 from aws_cfn_update.lambda_s3_key_updater import LambdaS3KeyUpdater as Updater
+from aws_cfn_update.lambda_s3_key_updater import (
+    _s3_key_semver_pattern,
+    semver_precedence,
+    S3KeyIndex,
+)
 from copy import deepcopy
 
 
@@ -81,3 +91,352 @@ def test_no_updates():
     updater.template = deepcopy(sample)
     updater.update_template()
     assert not updater.dirty
+
+
+def test_semver_precedence():
+    keys = [
+        "lambdas/iam-sudo-1.0.0.zip",
+        "lambdas/iam-sudo-1.0.0-rc.1.zip",
+        "lambdas/iam-sudo-1.0.0-alpha.beta.zip",
+        "lambdas/iam-sudo-1.0.0-alpha.1.zip",
+        "lambdas/iam-sudo-1.0.0-alpha.zip",
+        "lambdas/iam-sudo-0.10.0.zip",
+        "lambdas/iam-sudo-0.9.0.zip",
+    ]
+    result = sorted(
+        keys, key=lambda k: semver_precedence(_s3_key_semver_pattern.match(k))
+    )
+    assert result == [
+        "lambdas/iam-sudo-0.9.0.zip",
+        "lambdas/iam-sudo-0.10.0.zip",
+        "lambdas/iam-sudo-1.0.0-alpha.zip",
+        "lambdas/iam-sudo-1.0.0-alpha.1.zip",
+        "lambdas/iam-sudo-1.0.0-alpha.beta.zip",
+        "lambdas/iam-sudo-1.0.0-rc.1.zip",
+        "lambdas/iam-sudo-1.0.0.zip",
+    ]
+
+
+def test_highest_version_per_prefix():
+    updater = Updater()
+    updater.s3_keys = [
+        "lambdas/iam-sudo-1.0.0.zip",
+        "lambdas/iam-sudo-0.9.0.zip",
+        "lambdas/iam-sudo-1.0.0-rc.1.zip",
+        "lambdas/iam-sudo-1.0.0+build.2.zip",
+        "lambdas/cfn-listener-rule-provider-1.0.0.zip",
+    ]
+    assert list(updater.s3_keys) == [
+        "lambdas/iam-sudo-1.0.0.zip",
+        "lambdas/cfn-listener-rule-provider-1.0.0.zip",
+    ]
+
+    updater.template = deepcopy(sample)
+    updater.update_template()
+    assert updater.dirty
+    code = updater.template["Resources"]["1"]["Properties"]["Code"]
+    assert code["S3Key"] == "lambdas/iam-sudo-1.0.0.zip"
+
+
+def test_multi_digit_major_version():
+    match = _s3_key_semver_pattern.match("lambdas/x-10.0.0.zip")
+    assert match.group("prefix") == "lambdas/x-"
+    assert match.group("major") == "10"
+
+    index = S3KeyIndex(["lambdas/x-9.0.0.zip", "lambdas/x-10.0.0.zip"])
+    assert list(index.values()) == ["lambdas/x-10.0.0.zip"]
+    assert index.lookup("lambdas/x-9.0.0.zip") == "lambdas/x-10.0.0.zip"
+
+    updater = Updater()
+    updater.s3_keys = ["lambdas/iam-sudo-9.0.0.zip", "lambdas/iam-sudo-10.0.0.zip"]
+    updater.template = deepcopy(sample)
+    updater.update_template()
+    code = updater.template["Resources"]["1"]["Properties"]["Code"]
+    assert code["S3Key"] == "lambdas/iam-sudo-10.0.0.zip"
+
+
+def test_index_lookup():
+    index = S3KeyIndex(
+        ["lambdas/iam-sudo-1.0.0.zip", "lambdas/iam-sudo-extra-2.0.0.zip"]
+    )
+    assert index.lookup("lambdas/iam-sudo-0.1.0.zip") == "lambdas/iam-sudo-1.0.0.zip"
+    assert (
+        index.lookup("lambdas/iam-sudo-extra-0.1.0-beta+sha.1.zip")
+        == "lambdas/iam-sudo-extra-2.0.0.zip"
+    )
+    assert index.lookup("lambdas/iam-sudo-latest.zip") is None
+    assert index.lookup("lambdas/iam-sudo-0.1.0.tgz") is None
+    assert index.lookup("lambdas/cfn-secret-provider-0.1.0.zip") is None
+    assert index.lookup("lambdas/iam-sud") is None
+
+
+def test_list_object_keys_paginated():
+    s3 = botocore.session.get_session().create_client(
+        "s3", region_name="eu-central-1"
+    )
+    stub = Stubber(s3)
+    request = {"Bucket": "test-bucket", "Prefix": "lambdas/iam-sudo-"}
+    stub.add_response(
+        "list_objects_v2",
+        {
+            "Contents": [{"Key": "lambdas/iam-sudo-0.1.0.zip"}],
+            "IsTruncated": True,
+            "NextContinuationToken": "next",
+        },
+        request,
+    )
+    stub.add_response(
+        "list_objects_v2",
+        {
+            "Contents": [
+                {"Key": "lambdas/iam-sudo-0.3.1.zip"},
+                {"Key": "lambdas/iam-sudo-extra-9.0.0.zip"},
+                {"Key": "lambdas/iam-sudo-latest.zip"},
+            ],
+            "IsTruncated": False,
+        },
+        {**request, "ContinuationToken": "next"},
+    )
+    updater = Updater()
+    updater.s3 = s3
+    with stub:
+        result = updater._list_semver_keys(s3, "test-bucket", "lambdas/iam-sudo-")
+        stub.assert_no_pending_responses()
+
+    assert result == ["lambdas/iam-sudo-0.1.0.zip", "lambdas/iam-sudo-0.3.1.zip"]
+
+
+def test_resolve_from_s3(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    template = tmp_path / "template.json"
+    template.write_text(json.dumps({"AWSTemplateFormatVersion": "2010-09-09", **sample}))
+
+    objects = {
+        ("test-bucket", "lambdas/cfn-listener-rule-provider-"): [
+            "lambdas/cfn-listener-rule-provider-0.1.0.zip",
+            "lambdas/cfn-listener-rule-provider-0.2.0.zip",
+            "lambdas/cfn-listener-rule-provider-0.10.0-rc.1.zip",
+        ],
+        ("test-bucket", "lambdas/iam-sudo-"): [
+            "lambdas/iam-sudo-0.0.0.zip",
+            "lambdas/iam-sudo-1.0.0-beta.zip",
+            "lambdas/iam-sudo-1.0.0.zip",
+        ],
+    }
+    listed = []
+
+    def list_object_keys(s3, bucket, prefix):
+        listed.append((bucket, prefix))
+        return objects[(bucket, prefix)]
+
+    updater = Updater()
+    updater._list_object_keys = list_object_keys
+    updater.main([], [str(template)], False, False, resolve_from_s3=True)
+    assert sorted(listed) == sorted(objects.keys())
+
+    result = json.loads(template.read_text())["Resources"]
+    assert (
+        result["0"]["Properties"]["Code"]["S3Key"]
+        == "lambdas/cfn-listener-rule-provider-0.10.0-rc.1.zip"
+    )
+    assert result["1"]["Properties"]["Code"]["S3Key"] == "lambdas/iam-sudo-1.0.0.zip"
+
+    listed.clear()
+    updater = Updater()
+    updater._list_object_keys = list_object_keys
+    updater.main([], [str(template)], False, False, resolve_from_s3=True)
+    assert not listed, "expected listings to be read from the cache"
+
+    updater = Updater()
+    updater._list_object_keys = list_object_keys
+    updater.main([], [str(template)], False, False, True, cache_max_age=0)
+    assert sorted(listed) == sorted(objects.keys())
+
+
+def test_resolve_multi_digit_major_from_s3(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    template = tmp_path / "template.json"
+    template.write_text(json.dumps({"AWSTemplateFormatVersion": "2010-09-09", **sample}))
+
+    def list_object_keys(s3, bucket, prefix):
+        return [f"{prefix}9.0.0.zip", f"{prefix}10.0.0.zip", f"{prefix}9.1.0.zip"]
+
+    updater = Updater()
+    updater._list_object_keys = list_object_keys
+    updater.main([], [str(template)], False, False, resolve_from_s3=True)
+
+    result = json.loads(template.read_text())["Resources"]
+    assert result["1"]["Properties"]["Code"]["S3Key"] == "lambdas/iam-sudo-10.0.0.zip"
+
+
+all_code_locations = {
+    "Resources": {
+        "Inline": {
+            "Type": "AWS::Lambda::Function",
+            "Properties": {"Code": {"ZipFile": "print('hello')"}},
+        },
+        "Function": {
+            "Type": "AWS::Lambda::Function",
+            "Properties": {
+                "Code": {
+                    "S3Bucket": "test-bucket",
+                    "S3Key": "lambdas/iam-sudo-0.1.0.zip",
+                    "S3ObjectVersion": "v1",
+                },
+            },
+        },
+        "Layer": {
+            "Type": "AWS::Lambda::LayerVersion",
+            "Properties": {
+                "Content": {
+                    "S3Bucket": "test-bucket",
+                    "S3Key": "layers/boto3-1.0.0.zip",
+                },
+            },
+        },
+        "SamFunction": {
+            "Type": "AWS::Serverless::Function",
+            "Properties": {"CodeUri": "s3://test-bucket/lambdas/iam-sudo-0.1.0.zip"},
+        },
+        "SamFunctionVersion": {
+            "Type": "AWS::Serverless::Function",
+            "Properties": {
+                "CodeUri": {
+                    "Bucket": "test-bucket",
+                    "Key": "lambdas/iam-sudo-0.2.0.zip",
+                    "Version": "v2",
+                }
+            },
+        },
+        "SamLayer": {
+            "Type": "AWS::Serverless::LayerVersion",
+            "Properties": {"ContentUri": "s3://test-bucket/layers/boto3-0.9.0.zip"},
+        },
+    }
+}
+
+
+def test_all_code_locations(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
+    listed = []
+
+    def list_latest_object_versions(s3, bucket, prefix):
+        listed.append((bucket, prefix))
+        return {
+            "lambdas/iam-sudo-0.1.0.zip": "v1",
+            "lambdas/iam-sudo-0.2.0.zip": "v2",
+            "lambdas/iam-sudo-0.3.1.zip": "v3",
+        }
+
+    updater = Updater()
+    updater._list_latest_object_versions = list_latest_object_versions
+    updater.s3_keys = ["lambdas/iam-sudo-0.3.1.zip", "layers/boto3-1.1.0.zip"]
+    updater.template = deepcopy(all_code_locations)
+    updater.update_template()
+    assert updater.dirty
+    assert listed == [("test-bucket", "lambdas/iam-sudo-")]
+
+    resources = updater.template["Resources"]
+    assert resources["Function"]["Properties"]["Code"] == {
+        "S3Bucket": "test-bucket",
+        "S3Key": "lambdas/iam-sudo-0.3.1.zip",
+        "S3ObjectVersion": "v3",
+    }
+    assert (
+        resources["Layer"]["Properties"]["Content"]["S3Key"] == "layers/boto3-1.1.0.zip"
+    )
+    assert (
+        resources["SamFunction"]["Properties"]["CodeUri"]
+        == "s3://test-bucket/lambdas/iam-sudo-0.3.1.zip"
+    )
+    assert resources["SamFunctionVersion"]["Properties"]["CodeUri"] == {
+        "Bucket": "test-bucket",
+        "Key": "lambdas/iam-sudo-0.3.1.zip",
+        "Version": "v3",
+    }
+    assert (
+        resources["SamLayer"]["Properties"]["ContentUri"]
+        == "s3://test-bucket/layers/boto3-1.1.0.zip"
+    )
+
+    listed.clear()
+    updater.template = deepcopy(all_code_locations)
+    updater.update_template()
+    assert not listed, "expected object versions to be reused within the run"
+
+
+def test_missing_object_version_leaves_location_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
+    updater = Updater()
+    updater._list_latest_object_versions = lambda s3, bucket, prefix: {
+        "lambdas/iam-sudo-0.1.0.zip": "v1",
+    }
+    updater.s3_keys = ["lambdas/iam-sudo-0.3.1.zip"]
+    updater.template = deepcopy(all_code_locations)
+    updater.update_template()
+
+    resources = updater.template["Resources"]
+    assert resources["Function"]["Properties"]["Code"] == {
+        "S3Bucket": "test-bucket",
+        "S3Key": "lambdas/iam-sudo-0.1.0.zip",
+        "S3ObjectVersion": "v1",
+    }
+    assert resources["SamFunctionVersion"]["Properties"]["CodeUri"] == {
+        "Bucket": "test-bucket",
+        "Key": "lambdas/iam-sudo-0.2.0.zip",
+        "Version": "v2",
+    }
+    assert (
+        resources["SamFunction"]["Properties"]["CodeUri"]
+        == "s3://test-bucket/lambdas/iam-sudo-0.3.1.zip"
+    )
+    assert updater.dirty
+
+
+def test_versioned_location_with_intrinsic_bucket(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
+    updater = Updater()
+    updater._list_latest_object_versions = lambda s3, bucket, prefix: {}
+    updater.s3_keys = ["lambdas/iam-sudo-0.3.1.zip"]
+    updater.template = {
+        "Resources": {
+            "Function": {
+                "Type": "AWS::Lambda::Function",
+                "Properties": {
+                    "Code": {
+                        "S3Bucket": {"Fn::Sub": "${AWS::AccountId}-lambdas"},
+                        "S3Key": "lambdas/iam-sudo-0.1.0.zip",
+                        "S3ObjectVersion": "v1",
+                    }
+                },
+            }
+        }
+    }
+    updater.update_template()
+
+    code = updater.template["Resources"]["Function"]["Properties"]["Code"]
+    assert code["S3Key"] == "lambdas/iam-sudo-0.1.0.zip"
+    assert code["S3ObjectVersion"] == "v1"
+    assert not updater.dirty
+
+
+def test_list_concurrently_creates_one_client(monkeypatch):
+    created = []
+
+    def client(service):
+        created.append(service)
+        return object()
+
+    monkeypatch.setattr("aws_cfn_update.lambda_s3_key_updater.boto3.client", client)
+    clients = []
+
+    def list_object_keys(s3, bucket, prefix):
+        clients.append(s3)
+        return []
+
+    updater = Updater()
+    locations = [("test-bucket", f"lambdas/function-{i}-") for i in range(16)]
+    result = updater._list_concurrently(list_object_keys, locations)
+    assert set(result) == set(locations)
+    assert created == ["s3"]
+    assert len(clients) == 16 and all(c is clients[0] for c in clients)
@@ -291,3 +291,27 @@ def describe_images_stub(**request):
     if not result:
         assert False, "no dummy response found for this request"
     return result["response"]
+
+
+def test_add_new_version_replaces_get_att_and_sub():
+    template = {
+        "Resources": {
+            "CustomAMI": {
+                "Type": "Custom::AMI",
+                "Properties": {
+                    "Filters": {"name": "amzn-ami-2013.09.a-amazon-ecs-optimized"}
+                },
+            }
+        },
+        "Outputs": {
+            "ImageId": {"Value": {"Fn::GetAtt": ["CustomAMI", "ImageId"]}},
+            "Name": {"Value": {"Fn::Sub": "ami-${CustomAMI}"}},
+        },
+    }
+    updater = stubbed_ami_updater()
+    updater.template = template
+    updater.ami_name_pattern = "amzn-ami-*ecs-optimized"
+    updater.add_new_version = True
+    updater.update_template()
+    assert template["Outputs"]["ImageId"]["Value"]["Fn::GetAtt"][0] == "CustomAMIv1"
+    assert template["Outputs"]["Name"]["Value"]["Fn::Sub"] == "ami-${CustomAMIv1}"
@@ -0,0 +1,55 @@
+import json
+from collections import OrderedDict
+from io import StringIO
+
+from ruamel.yaml import YAML
+
+from aws_cfn_update.nodes import copy_node
+
+template = """# the template
+Resources:
+  Base: &base
+    Type: AWS::ApiGateway::RestApi # a rest api
+    Properties:
+      Name: !Sub '${AWS::StackName}-api'
+      Types: [REGIONAL]
+  Copy:
+    <<: *base
+    Condition: IsProduction
+  Outputs:
+    - !GetAtt [Base, RootResourceId]
+    - *base
+"""
+
+
+def test_copy_node_preserves_yaml():
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    original = yaml.load(template)
+    result = copy_node(original)
+
+    expected, s = StringIO(), StringIO()
+    yaml.dump(original, expected)
+    yaml.dump(result, s)
+    assert s.getvalue() == expected.getvalue()
+
+    resources = result["Resources"]
+    assert resources["Outputs"][1] is resources["Base"]
+    assert resources["Base"] is not original["Resources"]["Base"]
+
+    resources["Base"]["Properties"]["Name"].value = "changed"
+    resources["Outputs"][0][0] = "Copy"
+    properties = original["Resources"]["Base"]["Properties"]
+    assert properties["Name"].value == "${AWS::StackName}-api"
+    assert original["Resources"]["Outputs"][0][0] == "Base"
+
+
+def test_copy_node_plain():
+    original = OrderedDict(
+        Resources=OrderedDict(A={"Type": "AWS::SNS::Topic", "DependsOn": ["B"]})
+    )
+    result = copy_node(original)
+    assert isinstance(result["Resources"], OrderedDict)
+    assert json.dumps(result) == json.dumps(original)
+    result["Resources"]["A"]["DependsOn"].append("C")
+    assert original["Resources"]["A"]["DependsOn"] == ["B"]
@@ -1,4 +1,20 @@
 import pytest
+import socket
+import ssl
+import threading
+from datetime import datetime, timedelta, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+)
+from cryptography.x509.oid import AuthorityInformationAccessOID, NameOID
+
+import aws_cfn_update.oidc_provider_thumbprints_updater as oidc
 from aws_cfn_update.oidc_provider_thumbprints_updater import (
     OIDCProviderThumbprintsUpdater,
 )
@@ -124,3 +140,367 @@ def test_update_all(verbose_mode):
 
     updater.update_template()
     assert updater.dirty
+
+
+def _self_signed_certificate(common_name: str, days: int = 30):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.now(timezone.utc)
+    return (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=days))
+        .add_extension(
+            x509.SubjectAlternativeName([x509.DNSName(f"*.{common_name}")]),
+            critical=False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+
+
+def test_prefetch_deduplicates_jwks_hosts(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    tmp_path = tmp_path / "templates"
+    tmp_path.mkdir()
+    for i in range(3):
+        (tmp_path / f"template-{i}.json").write_text(
+            json.dumps(
+                {"AWSTemplateFormatVersion": "2010-09-09", **_multiple_oidc_providers}
+            )
+        )
+
+    discovered = []
+    handshakes = []
+
+    def get_jwks_host(url, session=None, timeout=None):
+        assert timeout == (1.0, 2.0)
+        discovered.append(url)
+        return "keys.example.com", 443
+
+    def get_certificate(host, port=443, timeout=None):
+        assert timeout == (1.0, 2.0)
+        handshakes.append((host, port))
+        return _self_signed_certificate(host)
+
+    monkeypatch.setattr(oidc, "get_jwks_host", get_jwks_host)
+    monkeypatch.setattr(oidc, "get_certificate", get_certificate)
+
+    updater = OIDCProviderThumbprintsUpdater()
+    updater.main(None, False, [str(tmp_path)], False, False, (1.0, 2.0))
+
+    assert sorted(discovered) == ["https://accounts.google.com", "https://gitlab.com"]
+    assert handshakes == [("keys.example.com", 443)]
+    for i in range(3):
+        template = json.loads((tmp_path / f"template-{i}.json").read_text())
+        for provider in template["Resources"].values():
+            assert len(provider["Properties"]["ThumbprintList"]) == 1
+
+
+def _write_template(path):
+    path.write_text(
+        json.dumps({"AWSTemplateFormatVersion": "2010-09-09", **_single_oidc_provider})
+    )
+
+
+def test_cached_fingerprints(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
+    template = tmp_path / "template.json"
+    handshakes = []
+    days = 30
+
+    def get_certificate(host, port=443, timeout=None):
+        handshakes.append(host)
+        return _self_signed_certificate("example.com", days)
+
+    monkeypatch.setattr(
+        oidc, "get_jwks_host", lambda url, session, timeout: ("keys.example.com", 443)
+    )
+    monkeypatch.setattr(oidc, "get_certificate", get_certificate)
+
+    _write_template(template)
+    OIDCProviderThumbprintsUpdater().main(None, False, [str(template)], False, False)
+    assert len(handshakes) == 1
+
+    _write_template(template)
+    OIDCProviderThumbprintsUpdater().main(None, False, [str(template)], False, False)
+    assert len(handshakes) == 1, "expected the cached fingerprint to be used"
+    thumbprints = json.loads(template.read_text())["Resources"]["GitLabCom"][
+        "Properties"
+    ]["ThumbprintList"]
+    assert thumbprints != ["DEADBEEF"]
+
+    OIDCProviderThumbprintsUpdater().main(
+        None, False, [str(template)], False, False, refresh=True
+    )
+    assert len(handshakes) == 2
+
+    days = 3
+    OIDCProviderThumbprintsUpdater().main(
+        None, False, [str(template)], False, False, refresh=True
+    )
+    OIDCProviderThumbprintsUpdater().main(None, False, [str(template)], False, False)
+    assert len(handshakes) == 4, "expected certificate close to expiry to be refreshed"
+
+
+def test_leaf_fingerprint_cache_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
+    (tmp_path / "oidc-certificates.json").write_text(
+        json.dumps(
+            {
+                "providers": {"https://gitlab.com": ["gitlab.com", 443]},
+                "hosts": {
+                    "gitlab.com:443": oidc.CertificateFingerprint.from_certificate(
+                        _self_signed_certificate("gitlab.com", 30)
+                    ).to_dict()
+                },
+            }
+        )
+    )
+    updater = OIDCProviderThumbprintsUpdater()
+    updater.load_cached_fingerprints(["https://gitlab.com"])
+    assert not updater._certificates
+
+
+def test_offline(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+
+    def no_network(*args, **kwargs):
+        assert False, "expected no network access in offline mode"
+
+    monkeypatch.setattr(oidc, "get_jwks_host", no_network)
+    monkeypatch.setattr(oidc, "get_certificate", no_network)
+
+    certificate = _self_signed_certificate("com")
+    bundle = tmp_path / "certificates"
+    bundle.mkdir()
+    (bundle / "gitlab.pem").write_bytes(
+        _self_signed_certificate("example.com").public_bytes(Encoding.PEM)
+        + certificate.public_bytes(Encoding.PEM)
+    )
+
+    template = tmp_path / "template.json"
+    _write_template(template)
+    OIDCProviderThumbprintsUpdater().main(
+        None, False, [str(template)], False, False, offline=str(bundle)
+    )
+    thumbprints = json.loads(template.read_text())["Resources"]["GitLabCom"][
+        "Properties"
+    ]["ThumbprintList"]
+    assert thumbprints == [
+        oidc.CertificateFingerprint.from_certificate(certificate).fingerprint
+    ]
+
+
+def _issue_certificate(
+    common_name, issuer=None, ca=False, dns_name=None, ca_issuers=None
+):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    issuer_certificate, issuer_key = issuer if issuer else (None, key)
+    now = datetime.now(timezone.utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(issuer_certificate.subject if issuer_certificate else name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+    )
+    if dns_name:
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName([x509.DNSName(dns_name)]), critical=False
+        )
+    if ca_issuers:
+        builder = builder.add_extension(
+            x509.AuthorityInformationAccess(
+                [
+                    x509.AccessDescription(
+                        AuthorityInformationAccessOID.CA_ISSUERS,
+                        x509.UniformResourceIdentifier(ca_issuers),
+                    )
+                ]
+            ),
+            critical=False,
+        )
+    return builder.sign(issuer_key, hashes.SHA256()), key
+
+
+@pytest.fixture(scope="module")
+def certificate_chain():
+    root = _issue_certificate("Test Root CA", ca=True)
+    intermediate = _issue_certificate(
+        "Test Intermediate CA",
+        issuer=root,
+        ca=True,
+        ca_issuers="http://ca.example.com/root.der",
+    )
+    leaf = _issue_certificate(
+        "localhost",
+        issuer=intermediate,
+        dns_name="localhost",
+        ca_issuers="http://ca.example.com/intermediate.der",
+    )
+    return leaf, intermediate, root
+
+
+@pytest.fixture()
+def published_issuers(monkeypatch, certificate_chain):
+    """
+    serves the issuers of the certificate chain from their caIssuers urls, which are
+    downloaded on Python versions without SSLSocket.get_unverified_chain().
+    """
+    (_, _), (intermediate, _), (root, _) = certificate_chain
+    published = {
+        "http://ca.example.com/intermediate.der": [intermediate],
+        "http://ca.example.com/root.der": [root],
+    }
+    downloads = []
+
+    def download_certificates(url, timeout=None):
+        downloads.append(url)
+        return published[url]
+
+    monkeypatch.setattr(oidc, "download_certificates", download_certificates)
+    return downloads
+
+
+@pytest.fixture()
+def tls_server(tmp_path, certificate_chain):
+    """
+    a local TLS server presenting the leaf, root and intermediate certificates.
+    """
+    (leaf, leaf_key), (intermediate, _), (root, _) = certificate_chain
+    chain_file = tmp_path / "chain.pem"
+    chain_file.write_bytes(
+        b"".join(c.public_bytes(Encoding.PEM) for c in [leaf, root, intermediate])
+    )
+    key_file = tmp_path / "key.pem"
+    key_file.write_bytes(
+        leaf_key.private_bytes(
+            Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()
+        )
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(chain_file, key_file)
+
+    listener = socket.create_server(("localhost", 0))
+    handshakes = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            try:
+                with context.wrap_socket(conn, server_side=True):
+                    handshakes.append(True)
+            except (ssl.SSLError, OSError):
+                pass
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield listener.getsockname()[1], handshakes
+    listener.close()
+
+
+def test_thumbprint_of_top_intermediate(tls_server, certificate_chain, published_issuers):
+    port, handshakes = tls_server
+    (leaf, _), (intermediate, _), (root, _) = certificate_chain
+
+    chain = oidc.get_certificate_chain("localhost", port)
+    assert chain == [leaf, intermediate, root]
+    assert oidc.get_certificate("localhost", port) == intermediate
+
+
+def test_download_issuers(certificate_chain, published_issuers):
+    (leaf, _), (intermediate, _), (root, _) = certificate_chain
+    assert oidc.download_issuers(leaf) == [intermediate, root]
+    assert published_issuers == [
+        "http://ca.example.com/intermediate.der",
+        "http://ca.example.com/root.der",
+    ]
+
+
+def test_download_issuers_failure(certificate_chain, monkeypatch):
+    (leaf, _), (_, _), (_, _) = certificate_chain
+
+    def download_certificates(url, timeout=None):
+        raise oidc.requests.ConnectionError(url)
+
+    monkeypatch.setattr(oidc, "download_certificates", download_certificates)
+    assert oidc.download_issuers(leaf) == []
+
+
+def test_thumbprint_certificate_without_intermediate(certificate_chain):
+    (leaf, _), (intermediate, _), (root, _) = certificate_chain
+    assert oidc.thumbprint_certificate([leaf]) == leaf
+    assert oidc.walk_chain(leaf, [root]) == [leaf]
+    assert oidc.walk_chain(leaf, [root, intermediate, leaf]) == [
+        leaf,
+        intermediate,
+        root,
+    ]
+
+
+def test_one_handshake_per_host(
+    tls_server, certificate_chain, published_issuers, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    port, handshakes = tls_server
+    (_, _), (intermediate, _), (_, _) = certificate_chain
+    monkeypatch.setattr(
+        oidc, "get_jwks_host", lambda url, session, timeout: ("localhost", port)
+    )
+
+    template = tmp_path / "template.json"
+    template.write_text(
+        json.dumps(
+            {"AWSTemplateFormatVersion": "2010-09-09", **_multiple_oidc_providers}
+        )
+    )
+    OIDCProviderThumbprintsUpdater().main(None, False, [str(template)], False, False)
+
+    assert len(handshakes) == 1
+    expected = oidc.CertificateFingerprint.from_certificate(intermediate).fingerprint
+    for provider in json.loads(template.read_text())["Resources"].values():
+        assert provider["Properties"]["ThumbprintList"] == [expected]
+
+
+def test_offline_chain(tmp_path, monkeypatch, certificate_chain):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    (leaf, _), (intermediate, _), (root, _) = certificate_chain
+    bundle = tmp_path / "certificates"
+    bundle.mkdir()
+    (bundle / "localhost.pem").write_bytes(leaf.public_bytes(Encoding.PEM))
+    (bundle / "ca.pem").write_bytes(
+        root.public_bytes(Encoding.PEM) + intermediate.public_bytes(Encoding.PEM)
+    )
+
+    template = tmp_path / "template.json"
+    template.write_text(
+        json.dumps(
+            {
+                "AWSTemplateFormatVersion": "2010-09-09",
+                "Resources": {
+                    "Local": {
+                        "Type": "AWS::IAM::OIDCProvider",
+                        "Properties": {"Url": "https://localhost"},
+                    }
+                },
+            }
+        )
+    )
+    OIDCProviderThumbprintsUpdater().main(
+        None, False, [str(template)], False, False, offline=str(bundle)
+    )
+    provider = json.loads(template.read_text())["Resources"]["Local"]
+    assert provider["Properties"]["ThumbprintList"] == [
+        oidc.CertificateFingerprint.from_certificate(intermediate).fingerprint
+    ]
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from aws_cfn_update import open_api_bundler
+from aws_cfn_update.open_api_bundler import OpenAPIBundler, component_section
+
+test_directory = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_component_section():
+    assert component_section("/components/schemas/Pet") == (
+        ("components", "schemas"),
+        "Pet",
+    )
+    assert component_section("/definitions/a~1b") == (("definitions",), "a/b")
+    assert component_section("/paths/~1pets") is None
+    assert component_section("") is None
+
+
+def test_bundle():
+    bundler = OpenAPIBundler(f"{test_directory}/open-api/api.yaml")
+    result = bundler.bundle()
+
+    responses = result["paths"]["/pets"]["get"]["responses"]
+    content = responses["200"]["content"]["application/json"]
+    assert content["schema"]["items"] == {"$ref": "#/components/schemas/Pet"}
+    content = responses["default"]["content"]["application/json"]
+    assert content["schema"] == {"$ref": "#/components/schemas/Error"}
+
+    schemas = result["components"]["schemas"]
+    assert list(schemas.keys()) == ["Error", "Pet", "Error1"]
+    assert schemas["Error1"] == {"type": "string"}
+    assert schemas["Pet"]["properties"]["parent"] == {
+        "$ref": "#/components/schemas/Pet"
+    }
+    assert schemas["Pet"]["properties"]["error"] == {
+        "$ref": "#/components/schemas/Error1"
+    }
+    assert sorted(os.path.relpath(f, test_directory) for f in bundler.files) == [
+        "open-api/api.yaml",
+        "open-api/paths/pets.yaml",
+        "open-api/schemas/pet.yaml",
+    ]
+
+
+def test_fragments_are_parsed_once(monkeypatch):
+    OpenAPIBundler(f"{test_directory}/open-api/api.yaml").bundle()
+
+    def fail(*args):
+        pytest.fail("fragment should have been cached")
+
+    monkeypatch.setattr(open_api_bundler, "YAML", fail)
+    OpenAPIBundler(f"{test_directory}/open-api/api.yaml").bundle()
+
+
+def test_cyclic_inline_reference(tmp_path, capsys):
+    (tmp_path / "api.yaml").write_text("paths:\n  /a:\n    $ref: a.yaml\n")
+    (tmp_path / "a.yaml").write_text("get:\n  $ref: b.yaml\n")
+    (tmp_path / "b.yaml").write_text("responses:\n  $ref: a.yaml\n")
+
+    with pytest.raises(SystemExit):
+        OpenAPIBundler(str(tmp_path / "api.yaml")).bundle()
+    assert "ERROR: cyclic $ref" in capsys.readouterr().err
@@ -1,4 +1,8 @@
-from aws_cfn_update.remove_resource import remove_resource_from_template
+from aws_cfn_update.remove_resource import (
+    ReferenceIndex,
+    ResourceRemover,
+    remove_resource_from_template,
+)
 from aws_cfn_update.cfn_updater import CfnUpdater
 from io import StringIO
 from ruamel.yaml import YAML
@@ -18,7 +22,7 @@ def test_simple_ref():
 
 
 def test_get_att():
-    template = {"Resources": {"AMI": {}, "EC2Instance": {"FN::GetAtt": ["AMI", "Arn"]}}}
+    template = {"Resources": {"AMI": {}, "EC2Instance": {"Fn::GetAtt": ["AMI", "Arn"]}}}
     remove_resource_from_template(template, "AMI")
     assert template.get("Resources", {}).get("AMI") is None
     assert template.get("Resources", {}).get("EC2Instance") is None
@@ -26,7 +30,7 @@ def test_get_att():
 
 def test_nested_ref():
     template = {
-        "Resources": {"AMI": {}, "EC2Instance": {"FN::GetAtt": [{"Ref": "AMI"}, "Arn"]}}
+        "Resources": {"AMI": {}, "EC2Instance": {"Fn::GetAtt": [{"Ref": "AMI"}, "Arn"]}}
     }
     remove_resource_from_template(template, "AMI")
     assert template.get("Resources", {}).get("AMI") is None
@@ -178,8 +182,8 @@ Resources:
     assert template.get("Resources", {}).get("EC2Instance") is None
 
 
-def test_json_sub():
-    template = {"Resources": {"AMI": {}, "EC2Instance": {"FN::Sub": "${AMI}"}}}
+def test_json_sub_string():
+    template = {"Resources": {"AMI": {}, "EC2Instance": {"Fn::Sub": "${AMI}"}}}
     remove_resource_from_template(template, "AMI")
     assert template.get("Resources", {}).get("AMI") is None
     assert template.get("Resources", {}).get("EC2Instance") is None
@@ -189,9 +193,165 @@ def test_json_sub():
     template = {
         "Resources": {
             "AMI": {},
-            "EC2Instance": {"FN::Sub": ["${AmiRef}", {"AmiRef": {"Ref": "AMI"}}]},
+            "EC2Instance": {"Fn::Sub": ["${AmiRef}", {"AmiRef": {"Ref": "AMI"}}]},
         }
     }
     remove_resource_from_template(template, "AMI")
     assert template.get("Resources", {}).get("AMI") is None
     assert template.get("Resources", {}).get("EC2Instance") is None
+
+
+def test_transitive_removal():
+    yaml = CfnUpdater().yaml
+    template = yaml.load(
+        """
+Parameters:
+  Name:
+    Type: String
+Conditions:
+  HasImage: !Not [!Equals [!GetAtt AMI.ImageId, ""]]
+  IsProduction: !Equals [!Ref Name, prod]
+  HasProductionImage: !And [!Condition HasImage, !Condition IsProduction]
+Resources:
+  AMI:
+    Type: Custom::AMI
+  LaunchTemplate:
+    Type: AWS::EC2::LaunchTemplate
+    Properties:
+      ImageId: !Ref AMI
+  Instance:
+    Type: AWS::EC2::Instance
+    Properties:
+      LaunchTemplate:
+        LaunchTemplateId: !Ref LaunchTemplate
+  Alarm:
+    Type: AWS::CloudWatch::Alarm
+    DependsOn: [Instance]
+  Topic:
+    Type: AWS::SNS::Topic
+    Condition: HasProductionImage
+  Bucket:
+    Type: AWS::S3::Bucket
+    Properties:
+      BucketName: !Sub
+        - '${AMI}-${Name}'
+        - AMI: fixed
+      Tags:
+        - Key: image
+          Value: !If [IsProduction, !Ref Name, none]
+Outputs:
+  InstanceId:
+    Value: !Ref Instance
+  BucketName:
+    Value: !Ref Bucket
+"""
+    )
+
+    assert remove_resource_from_template(template, "AMI")
+    assert list(template["Resources"].keys()) == ["Alarm", "Bucket"]
+    assert "DependsOn" not in template["Resources"]["Alarm"]
+    assert list(template["Conditions"].keys()) == ["IsProduction"]
+    assert list(template["Outputs"].keys()) == ["BucketName"]
+    assert list(template["Parameters"].keys()) == ["Name"]
+
+
+def test_removal_set_reasons():
+    template = {
+        "Resources": {
+            "AMI": {},
+            "Instance": {"Properties": {"ImageId": {"Fn::GetAtt": "AMI.ImageId"}}},
+            "Alarm": {"DependsOn": "Instance"},
+            "Topic": {"Properties": {"Name": {"Fn::Sub": "${Instance}"}}},
+        },
+        "Outputs": {"Topic": {"Value": {"Fn::Sub": "${Topic.Arn}"}}},
+    }
+    result = ReferenceIndex(template).removal_set([("Resources", "AMI")])
+    assert result == {
+        ("Resources", "AMI"): None,
+        ("Resources", "Instance"): ("Fn::GetAtt", "Resources", "AMI"),
+        ("Resources", "Topic"): ("Fn::Sub", "Resources", "Instance"),
+        ("Outputs", "Topic"): ("Fn::Sub", "Resources", "Topic"),
+    }
+
+
+def test_depends_on_is_pruned(capsys):
+    yaml = CfnUpdater().yaml
+    template = yaml.load(
+        """
+Resources:
+  AMI:
+    Type: Custom::AMI
+  Queue:
+    Type: AWS::SQS::Queue
+  Alarm:
+    Type: AWS::CloudWatch::Alarm
+    DependsOn: AMI
+  Instance:
+    Type: AWS::EC2::Instance
+    DependsOn: [AMI, Queue]
+"""
+    )
+    assert remove_resource_from_template(template, "AMI")
+    resources = template["Resources"]
+    assert list(resources.keys()) == ["Queue", "Alarm", "Instance"]
+    assert "DependsOn" not in resources["Alarm"]
+    assert resources["Instance"]["DependsOn"] == ["Queue"]
+    assert capsys.readouterr().err.splitlines() == [
+        "INFO: removing AMI from Resources",
+        "INFO: removing AMI from the DependsOn of Alarm",
+        "INFO: removing AMI from the DependsOn of Instance",
+    ]
+
+
+def test_resource_remover(capsys):
+    yaml = CfnUpdater().yaml
+    template = yaml.load(
+        """
+AWSTemplateFormatVersion: '2010-09-09'
+Resources:
+  LegacyQueue:
+    Type: AWS::SQS::Queue
+  LegacyHandler:
+    Type: AWS::Lambda::Function
+  Topic:
+    Type: AWS::SNS::Topic
+  Subscription:
+    Type: AWS::SNS::Subscription
+    Properties:
+      TopicArn: !Ref Topic
+  Bucket:
+    Type: AWS::S3::Bucket
+  Role:
+    Type: AWS::IAM::Role
+    Properties:
+      Policies:
+        - PolicyDocument:
+            Statement:
+              - Resource: !GetAtt LegacyQueue.Arn
+Outputs:
+  Bucket:
+    Value: !Ref Bucket
+"""
+    )
+    remover = ResourceRemover()
+    remover.dry_run = True
+    remover.template = template
+    remover._filename = "template.yaml"
+    remover.resource_names = ["Bucket"]
+    remover.resource_globs = ["Legacy*"]
+    remover.resource_types = ["AWS::SNS::T*"]
+    remover.update_template()
+
+    assert remover.dirty
+    assert list(template["Resources"].keys()) == []
+    assert list(template["Outputs"].keys()) == []
+    assert capsys.readouterr().err.splitlines() == [
+        "INFO: plan to remove 7 objects from template.yaml",
+        "INFO: would remove LegacyQueue from Resources, as it matches --resource-glob Legacy*",
+        "INFO: would remove LegacyHandler from Resources, as it matches --resource-glob Legacy*",
+        "INFO: would remove Topic from Resources, as it is of --resource-type AWS::SNS::T*",
+        "INFO: would remove Bucket from Resources, as it is selected by --resource",
+        "INFO: would remove Role from Resources, as it references LegacyQueue via Fn::GetAtt",
+        "INFO: would remove Subscription from Resources, as it references Topic via Ref",
+        "INFO: would remove Bucket from Outputs, as it references Bucket via Ref",
+    ]
@@ -29,3 +29,43 @@ def test_yaml():
     result = StringIO()
     yaml.dump(template, result)
     assert result.getvalue() == "---\nAMI: !Ref New\n"
+
+
+def test_mapping():
+    yaml = CfnUpdater().yaml
+    template = yaml.load(
+        """
+Resources:
+  Instance:
+    DependsOn: [Old, Other]
+    Properties:
+      ImageId: !GetAtt Old.ImageId
+      Name: !Sub '${Old}-${Other.Name}-${AWS::Region}'
+      Tags: {"Fn::Sub": ["${Old}", {"Old": "literal"}]}
+      List: !GetAtt [Other, Name]
+"""
+    )
+    result = replace_references(template, {"Old": "Other", "Other": "Old"})
+    assert sorted(".".join(map(str, p)) for p in result) == [
+        "Resources.Instance.DependsOn.0",
+        "Resources.Instance.DependsOn.1",
+        "Resources.Instance.Properties.ImageId",
+        "Resources.Instance.Properties.List.0",
+        "Resources.Instance.Properties.Name",
+    ]
+    properties = template["Resources"]["Instance"]["Properties"]
+    assert template["Resources"]["Instance"]["DependsOn"] == ["Other", "Old"]
+    assert properties["ImageId"].value == "Other.ImageId"
+    assert properties["Name"].value == "${Other}-${Old.Name}-${AWS::Region}"
+    assert properties["Tags"]["Fn::Sub"][0] == "${Old}"
+    assert properties["List"] == ["Old", "Name"]
+
+
+def test_sub_variables_are_not_renamed():
+    template = {
+        "Fn::Sub": ["${Old}-${X}", {"Old": "literal", "Other": {"Ref": "Old"}}]
+    }
+    replace_references(template, {"X": "Y", "Old": "New"})
+    assert template == {
+        "Fn::Sub": ["${Old}-${Y}", {"Old": "literal", "Other": {"Ref": "New"}}]
+    }
@@ -1,6 +1,11 @@
 import json
 import os
+from io import StringIO
 
+import pytest
+from ruamel.yaml import YAML
+
+from aws_cfn_update.nodes import structural_hash
 from aws_cfn_update.rest_api_body_updater import RestAPIBodyUpdater
 
 
@@ -166,7 +171,8 @@ def test_add_new_version_keep_two():
     )
 
 
-def test_load_and_merge():
+def test_load_and_merge(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
     test_directory = os.path.dirname(os.path.abspath(__file__))
     updater = RestAPIBodyUpdater()
     updater.resource_name = "RestAPI"
@@ -180,3 +186,239 @@ def test_load_and_merge():
     assert (
         updater.template["Resources"]["RestAPI"]["Properties"]["Body"] == updater.body
     )
+
+
+def test_structural_hash():
+    yaml = YAML()
+    a = yaml.load(
+        """
+# a comment
+paths:
+  /: {get: {responses: {200: {description: "ok"}}}}
+x-amazon-apigateway-integration: !Sub 'arn:${AWS::Region}'
+"""
+    )
+    b = {
+        "x-amazon-apigateway-integration": {"Fn::Sub": "arn:${AWS::Region}"},
+        "paths": {"/": {"get": {"responses": {"200": {"description": "ok"}}}}},
+    }
+    assert structural_hash(a["paths"]) == structural_hash(b["paths"])
+    assert structural_hash(a) == structural_hash(b)
+    b["x-amazon-apigateway-integration"] = {"Fn::Sub": "arn:${AWS::Partition}"}
+    assert structural_hash(a) != structural_hash(b)
+    assert structural_hash([1, 2]) != structural_hash([2, 1])
+    assert structural_hash({"a": "1"}) != structural_hash({"a": 1})
+    assert structural_hash({"a": True}) != structural_hash({"a": 1})
+
+
+def test_structural_hash_of_short_forms():
+    yaml = YAML()
+    short = yaml.load(
+        """
+- !Ref Api
+- !GetAtt Api.RootResourceId
+- !GetAtt [Api, RootResourceId]
+- !Join [",", [a, !Sub "${AWS::Region}"]]
+- !Condition IsProduction
+"""
+    )
+    long = [
+        {"Ref": "Api"},
+        {"Fn::GetAtt": ["Api", "RootResourceId"]},
+        {"Fn::GetAtt": "Api.RootResourceId"},
+        {"Fn::Join": [",", ["a", {"Fn::Sub": "${AWS::Region}"}]]},
+        {"Condition": "IsProduction"},
+    ]
+    assert structural_hash(short) == structural_hash(long)
+    assert structural_hash(short[0]) != structural_hash({"Ref": "Other"})
+
+
+def test_no_changes_between_short_and_long_form():
+    updater = RestAPIBodyUpdater()
+    updater.resource_name = "RestAPI"
+    updater.template = json.loads(json.dumps(sample))
+    updater.template["Resources"]["RestAPI"]["Properties"]["Body"] = {
+        "swagger": "2.0",
+        "x-uri": {"Fn::Sub": "arn:${AWS::Region}"},
+    }
+    updater.body = YAML().load("swagger: '2.0'\nx-uri: !Sub 'arn:${AWS::Region}'\n")
+
+    updater.update_template()
+    assert not updater.dirty
+
+
+def test_no_changes_in_json_template():
+    updater = RestAPIBodyUpdater()
+    updater.resource_name = "RestAPI"
+    updater.template = json.loads(json.dumps(sample))
+    updater.body = YAML().load("# the spec\nswagger: '2.0'\n")
+
+    updater.update_template()
+    assert not updater.dirty
+
+
+def test_load_and_merge_cached(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
+    test_directory = os.path.dirname(os.path.abspath(__file__))
+    updater = RestAPIBodyUpdater()
+    updater.api_gateway_extensions = f"{test_directory}/aws-extensions.yaml"
+    updater.open_api_specification = f"{test_directory}/api-specification.yaml"
+    updater.load_and_merge_swagger_body()
+    expected = updater.body
+    assert len(list(tmp_path.glob("rest-api-body-*.json"))) == 1
+
+    monkeypatch.setattr(
+        "aws_cfn_update.rest_api_body_updater.jsonmerge.merge",
+        lambda *args: pytest.fail("merged body should have been cached"),
+    )
+    updater = RestAPIBodyUpdater()
+    updater.api_gateway_extensions = f"{test_directory}/aws-extensions.yaml"
+    updater.open_api_specification = f"{test_directory}/api-specification.yaml"
+    updater.load_and_merge_swagger_body()
+    assert updater.body == expected
+    assert updater.body_hash == structural_hash(expected)
+
+    updater.merge_strategy = "another"
+    with pytest.raises(pytest.fail.Exception):
+        updater.load_and_merge_swagger_body()
+
+
+def test_load_and_merge_cache_is_data(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path))
+    test_directory = os.path.dirname(os.path.abspath(__file__))
+    updater = RestAPIBodyUpdater()
+    updater.api_gateway_extensions = f"{test_directory}/aws-extensions.yaml"
+    updater.open_api_specification = f"{test_directory}/api-specification.yaml"
+    updater.load_and_merge_swagger_body()
+    expected = updater.body
+
+    (cache_file,) = tmp_path.glob("rest-api-body-*.json")
+    cached = json.loads(cache_file.read_text())
+    assert set(cached) == {"dependencies", "body"}
+    assert YAML().load(cached["body"]) == expected
+
+    cached["body"] = {"py/object": "os.system"}
+    cache_file.write_text(json.dumps(cached))
+    updater.load_and_merge_swagger_body()
+    assert updater.body == expected
+
+
+def test_load_and_merge_bundled(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    (tmp_path / "api.yaml").write_text(
+        "paths:\n  /pets:\n    $ref: pets.yaml\n"
+    )
+    (tmp_path / "pets.yaml").write_text("get:\n  description: pets\n")
+    (tmp_path / "extensions.yaml").write_text(
+        "paths:\n  /pets:\n    get:\n      x-amazon-apigateway-integration:\n        type: mock\n"
+    )
+
+    updater = RestAPIBodyUpdater()
+    updater.open_api_specification = str(tmp_path / "api.yaml")
+    updater.api_gateway_extensions = str(tmp_path / "extensions.yaml")
+    updater.load_and_merge_swagger_body()
+    assert updater.body["paths"]["/pets"]["get"] == {
+        "description": "pets",
+        "x-amazon-apigateway-integration": {"type": "mock"},
+    }
+
+    (tmp_path / "pets.yaml").write_text("get:\n  description: dogs and cats\n")
+    updater.load_and_merge_swagger_body()
+    assert updater.body["paths"]["/pets"]["get"]["description"] == "dogs and cats"
+
+
+def test_load_and_merge_cached_by_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_CFN_UPDATE_CACHE_DIR", str(tmp_path / "cache"))
+    for name in ["dogs", "cats"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "api.yaml").write_text(
+            "paths:\n  /pets:\n    $ref: pets.yaml\n"
+        )
+        (tmp_path / name / "pets.yaml").write_text(f"get:\n  description: {name}\n")
+    (tmp_path / "extensions.yaml").write_text("paths: {}\n")
+
+    for name in ["dogs", "cats"]:
+        updater = RestAPIBodyUpdater()
+        updater.open_api_specification = str(tmp_path / name / "api.yaml")
+        updater.api_gateway_extensions = str(tmp_path / "extensions.yaml")
+        updater.load_and_merge_swagger_body()
+        assert updater.body["paths"]["/pets"]["get"]["description"] == name
+
+
+def test_verbose_diff(capsys):
+    updater = RestAPIBodyUpdater()
+    updater.resource_name = "RestAPI"
+    updater.verbose = True
+    updater.template = json.loads(json.dumps(sample))
+    updater.body = {"swagger": "2.0", "description": "a new one"}
+    updater.update_template()
+    assert "+ description\n" in capsys.readouterr().err
+
+    updater.template = json.loads(json.dumps(sample))
+    updater.diff = "lines"
+    updater.update_template()
+    assert "+description: a new one\n" in capsys.readouterr().err
+
+
+apis = {
+    "Resources": {
+        "HttpApi": {
+            "Type": "AWS::ApiGatewayV2::Api",
+            "Properties": {"Body": {"openapi": "3.0.1"}},
+        },
+        "SamApiv2": {
+            "Type": "AWS::Serverless::Api",
+            "Properties": {"StageName": "v1", "DefinitionBody": {"openapi": "3.0.1"}},
+        },
+        "SamHttpApi": {
+            "Type": "AWS::Serverless::HttpApi",
+            "Properties": {"DefinitionUri": "s3://bucket/api.yaml"},
+        },
+        "Output": {
+            "Type": "AWS::SSM::Parameter",
+            "Properties": {"Value": {"Ref": "SamApiv2"}},
+        },
+    }
+}
+
+
+def test_update_all_api_types():
+    updater = RestAPIBodyUpdater()
+    updater.resource_names = ["HttpApi", "SamApi", "SamHttpApi"]
+    updater.template = json.loads(json.dumps(apis))
+    updater.body = {"openapi": "3.0.1", "info": {"title": "orders"}}
+    updater.add_new_version = True
+    updater.update_template()
+
+    assert updater.dirty
+    resources = updater.template["Resources"]
+    assert resources["HttpApiv1"]["Properties"]["Body"] == updater.body
+    assert resources["SamApiv3"]["Properties"]["DefinitionBody"] == updater.body
+    assert "HttpApi" not in resources and "SamApiv2" not in resources
+    assert resources["Output"]["Properties"]["Value"] == {"Ref": "SamApiv3"}
+    assert "DefinitionBody" not in resources["SamHttpApi"]["Properties"]
+
+
+def test_apis_do_not_share_the_body():
+    updater = RestAPIBodyUpdater()
+    updater.resource_names = ["Api", "Http"]
+    updater.template = YAML().load(
+        "Resources:\n"
+        "  Api:\n"
+        "    Type: AWS::ApiGateway::RestApi\n"
+        "  Http:\n"
+        "    Type: AWS::Serverless::HttpApi\n"
+        "    Properties: {}\n"
+    )
+    updater.body = {"openapi": "3.0.1", "paths": {"/orders": {}}}
+    updater.update_template()
+
+    resources = updater.template["Resources"]
+    body = resources["Api"]["Properties"]["Body"]
+    definition_body = resources["Http"]["Properties"]["DefinitionBody"]
+    assert body == definition_body == updater.body
+    assert body is not definition_body and body is not updater.body
+
+    output = StringIO()
+    YAML().dump(updater.template, output)
+    assert "&" not in output.getvalue() and "*" not in output.getvalue()
@@ -0,0 +1,217 @@
+import textwrap
+from io import StringIO
+
+import pytz
+
+from aws_cfn_update.cfn_updater import CfnUpdater
+from aws_cfn_update.scheduler_migrator import SchedulerMigrator
+
+template = textwrap.dedent(
+    """\
+    ---
+    AWSTemplateFormatVersion: '2010-09-09'
+    Resources:
+      EventsRole:
+        Type: AWS::IAM::Role
+        Properties:
+          AssumeRolePolicyDocument:
+            Statement:
+              - Effect: Allow
+                Principal:
+                  Service: events.amazonaws.com
+                Action: sts:AssumeRole
+      DailyTaskSchedule:
+        Type: AWS::Events::Rule
+        Properties:
+          Name: daily
+          Description: run daily - cron(30 01 * * ? *)
+          ScheduleExpression: cron(30 23 * * ? *)
+          State: ENABLED
+          Targets:
+            - Id: task
+              Arn: !GetAtt Task.Arn
+              RoleArn: !GetAtt EventsRole.Arn
+              Input: '{}'
+            - Id: queue
+              Arn: !GetAtt Queue.Arn
+              RoleArn: !GetAtt EventsRole.Arn
+      LambdaSchedule:
+        Type: AWS::Events::Rule
+        Properties:
+          Description: run daily - cron(30 01 * * ? *)
+          ScheduleExpression: cron(30 23 * * ? *)
+          Targets:
+            - Id: lambda
+              Arn: !GetAtt Function.Arn
+    Outputs:
+      Schedule:
+        Value: !Ref DailyTaskSchedule
+      ScheduleArn:
+        Value: !GetAtt DailyTaskSchedule.Arn
+      ScheduleSub:
+        Value: !Sub '${DailyTaskSchedule.Arn}/${LambdaSchedule}'
+    """
+)
+
+
+def test_migrate():
+    migrator = SchedulerMigrator()
+    migrator.template = migrator.yaml.load(template)
+    migrator.timezone = pytz.timezone("Europe/Amsterdam")
+    migrator.update_template()
+    assert migrator.dirty
+
+    resources = migrator.template["Resources"]
+    assert "DailyTaskSchedule" not in resources
+    assert "LambdaSchedule" in resources
+
+    schedule = resources["DailyTaskScheduleSchedule"]
+    assert schedule["Type"] == "AWS::Scheduler::Schedule"
+    properties = schedule["Properties"]
+    assert properties["Name"] == "daily-task"
+    assert properties["ScheduleExpression"] == "cron(30 01 * * ? *)"
+    assert properties["ScheduleExpressionTimezone"] == "Europe/Amsterdam"
+    assert properties["FlexibleTimeWindow"] == {"Mode": "OFF"}
+    assert properties["Target"]["Input"] == "{}"
+    assert str(properties["Target"]["Arn"].value) == "Task.Arn"
+
+    second = resources["DailyTaskScheduleSchedule2"]["Properties"]
+    assert second["Name"] == "daily-queue"
+    assert str(second["Target"]["Arn"].value) == "Queue.Arn"
+
+    services = resources["EventsRole"]["Properties"]["AssumeRolePolicyDocument"][
+        "Statement"
+    ][0]["Principal"]["Service"]
+    assert services == ["events.amazonaws.com", "scheduler.amazonaws.com"]
+
+    outputs = migrator.template["Outputs"]
+    assert outputs["Schedule"]["Value"].value == "DailyTaskScheduleSchedule"
+    assert outputs["ScheduleArn"]["Value"].value == "DailyTaskScheduleSchedule.Arn"
+    assert (
+        outputs["ScheduleSub"]["Value"].value
+        == "${DailyTaskScheduleSchedule.Arn}/${LambdaSchedule}"
+    )
+
+    output = StringIO()
+    CfnUpdater().yaml.dump(migrator.template, output)
+    assert "Mode: 'OFF'" in output.getvalue()
+
+
+def test_migrate_json_references():
+    migrator = SchedulerMigrator()
+    migrator.timezone = pytz.timezone("UTC")
+    migrator.template = {
+        "Resources": {
+            "Rule": {
+                "Type": "AWS::Events::Rule",
+                "Properties": {
+                    "Description": "cron(0 4 * * ? *)",
+                    "Targets": [{"Id": "1", "Arn": "arn", "RoleArn": "role"}],
+                },
+            },
+            "Permission": {
+                "Type": "AWS::Lambda::Permission",
+                "DependsOn": ["Rule"],
+                "Properties": {"SourceArn": {"Fn::GetAtt": ["Rule", "Arn"]}},
+            },
+        }
+    }
+    migrator.update_template()
+    resources = migrator.template["Resources"]
+    assert resources["RuleSchedule"]["Properties"]["ScheduleExpressionTimezone"] == "UTC"
+    assert resources["Permission"]["DependsOn"] == ["RuleSchedule"]
+    assert resources["Permission"]["Properties"]["SourceArn"] == {
+        "Fn::GetAtt": ["RuleSchedule", "Arn"]
+    }
+
+
+def _rule(target: dict, state: str = "ENABLED") -> dict:
+    return {
+        "Resources": {
+            "Rule": {
+                "Type": "AWS::Events::Rule",
+                "Properties": {
+                    "Description": "cron(0 4 * * ? *)",
+                    "State": state,
+                    "Targets": [{"Id": "1", "Arn": "arn", "RoleArn": "role", **target}],
+                },
+            }
+        }
+    }
+
+
+def test_unsupported_kinesis_partition_key_path(capsys):
+    migrator = SchedulerMigrator()
+    migrator.timezone = pytz.timezone("UTC")
+    migrator.template = _rule({"KinesisParameters": {"PartitionKeyPath": "$.id"}})
+    migrator.update_template()
+    assert not migrator.dirty
+    assert "Rule" in migrator.template["Resources"]
+    assert "KinesisParameters.PartitionKeyPath" in capsys.readouterr().err
+
+
+def test_unsupported_state(capsys):
+    migrator = SchedulerMigrator()
+    migrator.timezone = pytz.timezone("UTC")
+    migrator.template = _rule({}, "ENABLED_WITH_ALL_CLOUDTRAIL_MANAGEMENT_EVENTS")
+    migrator.update_template()
+    assert not migrator.dirty
+    assert "is not ENABLED or DISABLED" in capsys.readouterr().err
+
+    migrator.template = _rule({}, "DISABLED")
+    migrator.update_template()
+    assert migrator.dirty
+    properties = migrator.template["Resources"]["RuleSchedule"]["Properties"]
+    assert properties["State"] == "DISABLED"
+
+
+def test_existing_schedule_name(capsys):
+    migrator = SchedulerMigrator()
+    migrator.timezone = pytz.timezone("UTC")
+    migrator.template = _rule({})
+    migrator.template["Resources"]["RuleSchedule"] = {"Type": "AWS::S3::Bucket"}
+    migrator.update_template()
+    assert not migrator.dirty
+    resources = migrator.template["Resources"]
+    assert resources["RuleSchedule"] == {"Type": "AWS::S3::Bucket"}
+    assert "Rule" in resources
+    assert "RuleSchedule already exists" in capsys.readouterr().err
+
+
+def test_ecs_parameters():
+    migrator = SchedulerMigrator()
+    migrator.timezone = pytz.timezone("UTC")
+    migrator.template = _rule(
+        {
+            "EcsParameters": {
+                "TaskDefinitionArn": "task",
+                "NetworkConfiguration": {"AwsVpcConfiguration": {"Subnets": ["a"]}},
+                "PlacementStrategies": [{"Type": "spread", "Field": "instanceId"}],
+            }
+        }
+    )
+    migrator.update_template()
+    parameters = migrator.template["Resources"]["RuleSchedule"]["Properties"]["Target"][
+        "EcsParameters"
+    ]
+    assert parameters == {
+        "TaskDefinitionArn": "task",
+        "NetworkConfiguration": {"AwsvpcConfiguration": {"Subnets": ["a"]}},
+        "PlacementStrategy": [{"Type": "spread", "Field": "instanceId"}],
+    }
+
+
+def test_unsupported_ecs_tag_list(capsys):
+    migrator = SchedulerMigrator()
+    migrator.timezone = pytz.timezone("UTC")
+    migrator.template = _rule(
+        {
+            "EcsParameters": {
+                "TaskDefinitionArn": "task",
+                "TagList": [{"Key": "team", "Value": "platform"}],
+            }
+        }
+    )
+    migrator.update_template()
+    assert not migrator.dirty
+    assert "EcsParameters.TagList" in capsys.readouterr().err